@@ -1,47 +1,140 @@
 import streamlit as st
 import pandas as pd
 import os
-import pickle
+import sys
 from datetime import datetime
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #so src can be imported when launched by streamlit
+from src.summary_store import (
+    load_summary_stats,
+    load_top_pairs,
+    load_summary_series,
+    stored_dates,
+    stored_windows,
+    LEGACY_WINDOW
+)
+from src.pair_query import CorrelationQuery
+from src.group_correlation import load_group_correlations, group_matrix
+from src.correlation_change import load_change_stats, load_top_changes, CHANGE_HISTOGRAM_COLUMNS
+from src.live_stream import read_live_summary
+from orchestration import load_return_matrix
+
 """
 Create GUI for visualizing rolling correlation summary statistics using Streamlit
 """
 
-SUMMARY_DIR = "daily_correlations_summary_stats" #file of daily summar stat .csv files
+SUMMARY_DIR = "daily_correlations_summary_stats" #Parquet summary store (see src/summary_store.py)
+ZIP_PATH = "stock_data.zip" #price archive, the drill-down queries its memory-mapped return matrix cache
+
+CHART_RANGES = {"1 year": 1, "5 years": 5, "10 years": 10, "All": None} #years of history shown in the charts
+LIVE_REFRESH_SECONDS = 2 #how often the live section re-reads the summary published by live mode
+
+#loading and caching the window lengths in the store
+@st.cache_data
+def load_windows(summary_dir):
+    return stored_windows(summary_dir)
+
+#loading and caching the sorted dates of one window, the index every date lookup goes through
+@st.cache_data
+def load_dates(summary_dir, window):
+    return stored_dates(summary_dir, window)
+
+#loading and caching the scalar stats of one date (only its year partition is read), indexed by Date
+@st.cache_data
+def load_day_stats(summary_dir, date, window):
+    return load_summary_stats(summary_dir, start_date=date, end_date=date, window=window).set_index("Date")
+
+#loading and caching the chart series for a range: daily stats, or the weekly/monthly rollup for long ranges
+@st.cache_data
+def load_chart_data(summary_dir, start_date, end_date, window):
+    return load_summary_series(summary_dir, load_dates(summary_dir, window), start_date, end_date, window)
+
+#loading and caching the top pair tables for one date and window
+@st.cache_data
+def load_top_pairs_for_date(summary_dir, date, window):
+    top_pairs = load_top_pairs(summary_dir, date, window=window)
+    return {category: pairs for category, pairs in top_pairs.groupby("category")}
 
-#loading and caching data for Streamlit dashboard
+#loading and caching the group (sector) averages of one window for the chart range, empty without a group mapping
 @st.cache_data
-def load_summary_data(summary_dir):
-    all_summaries = []
-    for fname in sorted(os.listdir(summary_dir)):
-        if fname.endswith(".pkl"):
-            with open(os.path.join(summary_dir, fname), "rb") as f:
-                summary = pickle.load(f)
-                all_summaries.append(summary)
-    return pd.DataFrame(all_summaries).sort_values("Date")
+def load_group_data(summary_dir, start_date, end_date, window):
+    return load_group_correlations(summary_dir, start_date, end_date, window)
+
+#loading and caching the day-over-day change stats of one window for the chart range, empty without --changes
+@st.cache_data
+def load_change_data(summary_dir, start_date, end_date, window):
+    return load_change_stats(summary_dir, start_date, end_date, window).set_index("Date")
+
+#loading and caching the largest day-over-day moves of one date and window
+@st.cache_data
+def load_top_changes_for_date(summary_dir, date, window):
+    return load_top_changes(summary_dir, date, window=window)
+
+#pair and ticker queries over the cached return matrix, one per window (each keeps its own LRU cache of results)
+@st.cache_resource
+def load_correlation_query(zip_path, window):
+    return CorrelationQuery(load_return_matrix(zip_path), window)
 
 #formatting summary cards helper function
 def display_summary_card(title, value):
     st.metric(label=title, value=round(value, 4))
 #formatting top ticker tables helper function    
-def display_top_table(title: str, data: list):
-    df = pd.DataFrame(data)
-    df.insert(0, "Rank", range(1, len(df) + 1))
+def display_top_table(title: str, data: pd.DataFrame):
+    df = data.rename(columns={"rank": "Rank"}).reset_index(drop=True)
     st.markdown(f"##### {title}")
     st.dataframe(df[["Rank", "ticker_1", "ticker_2", "correlation"]])
 
+#Live mode's latest summary (python orchestration.py --live ...), re-read every LIVE_REFRESH_SECONDS without rerunning
+#the rest of the page. Nothing is shown when live mode has not published anything
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def display_live_summary(summary_dir):
+    live = read_live_summary(summary_dir)
+    if live is None:
+        return
+    st.subheader(f"Live {live['window']} Day Window ({live['Date']}, as of {pd.Timestamp(live['as_of']).strftime('%H:%M:%S')})")
+    st.caption(
+        f"{live['tickers_updated']}/{live['tickers']} tickers have a price today, "
+        f"refreshed {live['latency_seconds']:.2f}s after the prices arrived"
+    )
+    columns = st.columns(5)
+    for column, (label, key) in zip(columns, [
+        ("Mean Correlation", "mean_correlation"),
+        ("Median Correlation", "median_correlation"),
+        ("Std Dev", "std_correlation"),
+        ("Percent > 0.7", "pct_above_0.7"),
+        ("Entropy", "correlation_entropy")
+    ]):
+        with column:
+            display_summary_card(label, live[key])
+    with st.expander("Live top pairs"):
+        for title, key in [
+            ("Top 20 Closest to 0", "top_20_closest_to_zero"),
+            ("Top 20 Closest to ±1", "top_20_closest_to_one"),
+            ("Top 5 Most Negative", "top_5_most_negative")
+        ]:
+            pairs = pd.DataFrame(live[key], columns=["ticker_1", "ticker_2", "correlation"])
+            display_top_table(title, pairs.assign(rank=range(1, len(pairs) + 1)))
+
 #Building the dashboard
-st.title("Stock 20 Rolling Correlation Summary Dashboard")
 
-df = load_summary_data(SUMMARY_DIR)
-df["Date"] = pd.to_datetime(df["Date"])
+# Sidebar window selector, one entry per window length in the store
+windows = load_windows(SUMMARY_DIR)
+window = st.sidebar.selectbox(
+    "Rolling window (days)",
+    windows,
+    index=windows.index(LEGACY_WINDOW) if LEGACY_WINDOW in windows else 0
+)
+st.title(f"Stock {window} Day Rolling Correlation Summary Dashboard")
+display_live_summary(SUMMARY_DIR)
+
+dates = load_dates(SUMMARY_DIR, int(window))
 
 # Sidebar date selector
-date_selected = st.sidebar.date_input("Select a date", value=df["Date"].max(), min_value=df["Date"].min(), max_value=df["Date"].max())
+date_selected = st.sidebar.date_input("Select a date", value=dates[-1], min_value=dates[0], max_value=dates[-1])
 
-# Extract summary for selected date
-row = df[df["Date"] == pd.to_datetime(date_selected)].squeeze()
+# Extract summary for selected date, looked up in the date index instead of scanning the stats
+day = pd.to_datetime(date_selected)
+row = load_day_stats(SUMMARY_DIR, day, int(window)).loc[day] if day in dates else pd.Series(dtype=float)
 
 if row.empty:
     st.warning("No data available for the selected date.") #some days don't have price data (markets closed)
@@ -68,20 +161,82 @@ else:
             help="Measures the unpredictability or diversity of correlation values. Higher values (~5-6) mean more variation than lower values (~2-3)."
             )
 
-    st.subheader("Top Rolling 20 Correlations (Selected Day)")
-    #correlations of interest table
-    display_top_table("Top 20 Closest to 0", row["top_20_closest_to_zero"])
-    display_top_table("Top 20 Closest to ±1", row["top_20_closest_to_one"])
-    display_top_table("Top 5 Most Negative", row["top_5_most_negative"])
-
-# Plot time series of summary stats
+    st.subheader(f"Top Rolling {window} Day Correlations (Selected Day)")
+    #correlations of interest table, only the selected day's rows are read from the store
+    top_pairs = load_top_pairs_for_date(SUMMARY_DIR, day, int(window))
+    empty = pd.DataFrame(columns=["rank", "ticker_1", "ticker_2", "correlation"])
+    display_top_table("Top 20 Closest to 0", top_pairs.get("top_20_closest_to_zero", empty))
+    display_top_table("Top 20 Closest to ±1", top_pairs.get("top_20_closest_to_one", empty))
+    display_top_table("Top 5 Most Negative", top_pairs.get("top_5_most_negative", empty))
+
+# Plot time series of summary stats, long ranges come from the precomputed weekly/monthly rollups
+chart_range = st.sidebar.selectbox("Chart range", list(CHART_RANGES), index=len(CHART_RANGES) - 1)
+years = CHART_RANGES[chart_range]
+chart_start = dates[0] if years is None else max(dates[0], dates[-1] - pd.DateOffset(years=years))
+resolution, series = load_chart_data(SUMMARY_DIR, chart_start, dates[-1], int(window))
 st.subheader("Time Series Overview")
+st.caption(f"{resolution.capitalize()} values from {chart_start.strftime('%Y-%m-%d')} to {dates[-1].strftime('%Y-%m-%d')}")
 
 st.markdown("**Mean, Median, and Percent > 0.7 Correlations Over Time**")
-st.line_chart(df.set_index("Date")[["mean_correlation", "median_correlation", "pct_above_0.7"]])
+st.line_chart(series[["mean_correlation", "median_correlation", "pct_above_0.7"]])
 
 st.markdown("**Standard Deviation of Correlations Over Time**")
-st.line_chart(df.set_index("Date")[["std_correlation"]])
+st.line_chart(series[["std_correlation"]])
 
 st.markdown("**Correlation Entropy Over Time**")
-st.line_chart(df.set_index("Date")[["correlation_entropy"]])
\ No newline at end of file
+st.line_chart(series[["correlation_entropy"]])
+# Sector (group) averages, only when the summaries were computed with a group mapping (--groups)
+groups = load_group_data(SUMMARY_DIR, chart_start, dates[-1], int(window))
+if not groups.empty:
+    st.subheader("Average Correlation Between and Within Groups")
+    day_groups = groups[groups["Date"] == day]
+    if not day_groups.empty:
+        st.markdown(f"**Group x Group Average Correlations on {day.strftime('%Y-%m-%d')}**")
+        st.dataframe(group_matrix(day_groups).round(3))
+    st.markdown("**Average Correlation Within Each Group Over Time**")
+    within = groups[groups["group_1"] == groups["group_2"]]
+    st.line_chart(within.pivot(index="Date", columns="group_1", values="mean_correlation"))
+
+# Day-over-day changes, only when the summaries were computed with --changes
+changes = load_change_data(SUMMARY_DIR, chart_start, dates[-1], int(window))
+if not changes.empty:
+    st.subheader("Day-over-Day Correlation Changes")
+    st.markdown("**Mean Absolute and Largest Change Against the Previous Day Over Time**")
+    st.line_chart(changes[["mean_abs_change", "max_abs_change"]])
+    if day in changes.index:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown(f"**Distribution of |Change| on {day.strftime('%Y-%m-%d')}**")
+            histogram = changes.loc[day, CHANGE_HISTOGRAM_COLUMNS]
+            st.bar_chart(histogram.rename(lambda column: column.removeprefix("abs_change_").replace("_", "-")))
+        with col2:
+            st.markdown(f"**Largest Moves on {day.strftime('%Y-%m-%d')}**")
+            top_changes = load_top_changes_for_date(SUMMARY_DIR, day, int(window))
+            st.dataframe(top_changes[["rank", "ticker_1", "ticker_2", "previous_correlation", "correlation", "change"]])
+
+# Drill-down into single pairs and tickers, computed on demand from the return matrix rather than the summary store
+st.subheader(f"Pair and Ticker Drill-Down ({window} Day Window)")
+if not os.path.exists(ZIP_PATH):
+    st.info(f"Drill-down needs the price archive {ZIP_PATH}.")
+else:
+    query = load_correlation_query(ZIP_PATH, int(window))
+    tickers = list(query.tickers)
+    col1, col2 = st.columns(2)
+    with col1:
+        ticker_1 = st.selectbox("Ticker", tickers, index=0)
+    with col2:
+        ticker_2 = st.selectbox("Compared with", tickers, index=min(1, len(tickers) - 1))
+
+    st.markdown(f"**{ticker_1} / {ticker_2} Rolling Correlation**")
+    st.line_chart(query.pair_history(ticker_1, ticker_2, chart_start, dates[-1]))
+
+    if not row.empty:
+        peers = query.ticker_vs_all(ticker_1, day).drop(ticker_1).dropna()
+        peers = peers.sort_values(ascending=False).rename("correlation").rename_axis("ticker").reset_index()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown(f"##### Most Correlated with {ticker_1}")
+            st.dataframe(peers.head(10))
+        with col2:
+            st.markdown(f"##### Least Correlated with {ticker_1}")
+            st.dataframe(peers.tail(10).iloc[::-1].reset_index(drop=True))
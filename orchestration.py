@@ -1,55 +1,339 @@
 import os
+import argparse
 import pandas as pd
 import subprocess
 import shutil
 
 from src.data_reader import data_load_zip
 from src.correlation import (
-    computing_daily_returns,
-    pivot_returns,
-    orchestrate_daily_correlation_summary_stats
+    daily_return_matrix,
+    orchestrate_daily_correlation_summary_stats,
+    SUMMARY_CODE_VERSION
 )
+from src.summary_store import (
+    stored_dates,
+    read_manifest,
+    write_manifest,
+    ticker_universe_hash,
+    repair_store,
+    window_lengths,
+    write_rollups,
+    stage_settings
+)
+from src.adaptive_scheduler import SCHEDULERS
+from src.return_cache import cached_return_matrix, RETURN_CACHE_DIR
+from src.neighbour_index import remove_partial_neighbours
+from src.correlation_archive import remove_partial_archive, ARCHIVE_DTYPES
+from src.group_correlation import read_group_mapping
+from src.instrumentation import span, instrumented
+from src.live_stream import LiveCorrelation, tail_lines, socket_lines, run_live, LIVE_PORT
+from src.tiled_summary import TILE_SIZE
+
+LOOKBACK_PADDING = 5 #extra trading days loaded before the first window so tickers with a missing day still get their previous price
+
+#Loads the zip and builds the Date x Ticker return matrix
+def build_return_matrix(zip_path, start_date=None, end_date=None):
+    print("Loading Stock Data...")
+    with span("data_load_zip", "load"):
+        df = data_load_zip(zip_path, start_date=start_date, end_date=end_date)
+
+    print("Building the daily returns matrix...")
+    with span("daily_return_matrix", "load"):
+        return daily_return_matrix(df)
+
+#Return matrix from the memory-mapped cache next to the archive, built and stored on the first run for these inputs.
+#use_cache=False always rebuilds it in memory
+def load_return_matrix(zip_path, start_date=None, end_date=None, use_cache=True):
+    if not use_cache:
+        return build_return_matrix(zip_path, start_date, end_date)
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(zip_path)), RETURN_CACHE_DIR)
+    with span("load_return_matrix", "load"):
+        return cached_return_matrix(
+            zip_path,
+            lambda: build_return_matrix(zip_path, start_date, end_date),
+            start_date=start_date,
+            end_date=end_date,
+            cache_dir=cache_dir
+        )
+
+#Why the summaries recorded in manifest cannot be extended or resumed by a run with these settings, None when they can
+def _manifest_mismatch(manifest, window, approximate, stages):
+    windows = window_lengths(window)
+    if manifest is None:
+        return "no manifest found in the output directory"
+    if manifest["windows"] != windows:
+        return f"windows changed from {manifest['windows']} to {windows}"
+    if manifest["code_version"] != SUMMARY_CODE_VERSION:
+        return f"summary code version changed from {manifest['code_version']} to {SUMMARY_CODE_VERSION}"
+    if manifest["approximate"] != approximate:
+        return f"sampled pairs changed from {manifest['approximate']} to {approximate}"
+    changed = [
+        f"{name} from {manifest['stages'].get(name)} to {value}"
+        for name, value in stages.items() if manifest["stages"].get(name) != value
+    ]
+    if changed:
+        return "stage settings changed: " + ", ".join(changed)
+    return None
+
+"""
+Decides whether the summaries already in output_correlations_dir can be extended with new dates.
+Returns (load_start_date, first_new_date, None) when they can, where load_start_date is the first price date needed so
+the trailing window of the first new date is complete (the longest one when window is a list), or (None, None, reason)
+when a full rebuild is required. stages is the stage_settings of the run (None for none of the optional stages), a
+store written with other ones cannot be extended: the new dates would miss tables the old ones have, or the other way.
+"""
+
+def plan_incremental_run(output_correlations_dir, window, padding=LOOKBACK_PADDING, approximate=0, stages=None):
+    windows = window_lengths(window)
+    stages = stage_settings() if stages is None else stages
+    reason = _manifest_mismatch(read_manifest(output_correlations_dir), window, approximate, stages)
+    if reason is not None:
+        return None, None, reason
+
+    dates = stored_dates(output_correlations_dir)
+    if len(dates) < windows[-1] + 1 + padding:
+        return None, None, "not enough summarised dates to rebuild the trailing window"
+    #the window of the next date is the last `window` summarised dates, each return needs the price before it
+    return dates[-(windows[-1] + 1 + padding)], dates[-1] + pd.Timedelta(days=1), None
 
 def orchestrate_pipeline(
     zip_path="stock_data.zip",
-    window=20,
+    window=20, #days per rolling window, or a list of lengths (e.g. [5, 20, 60, 120]) summarised in one pass
     output_correlations_dir="daily_correlations_summary_stats",
     overwrite=False,
     start_date=None,
-    end_date=None
+    end_date=None,
+    engine="sliding", #"sliding" updates running sums day to day, "window" recomputes every window from scratch, "tiles"
+                      #splits every day's matrix into tiles spread over the scheduler's workers (src/tiled_summary.py)
+    incremental=False, #only compute dates after the last summarised one (falls back to a full rebuild when required)
+    use_cache=True, #reuse the memory-mapped return matrix when the archive and date range are unchanged
+    scheduler="threads", #window and tiles engines: "threads", "processes", "distributed" or a dask scheduler address
+                         #("tcp://host:8786", workers on several machines), see src/adaptive_scheduler.py
+    resume=False, #continue an interrupted run: keep the completed dates and compute only the missing or corrupt ones
+    neighbours=0, #k most and least correlated peers stored per ticker and day (src/neighbour_index.py), 0 skips them
+    groups_csv=None, #Ticker,Group CSV, adds the average correlations between and within groups (src/group_correlation.py)
+    trace=None, #path of a Chrome trace JSON file, records per-stage timings and prints a run report (src/instrumentation.py)
+    approximate=0, #pairs sampled per date for approximate summaries (src/approximate_summary.py), 0 computes them exactly
+    tile_size=TILE_SIZE, #tiles engine only, tickers per side of a tile
+    archive=None, #"int8" or "int16" archives every day's quantized correlation matrix (src/correlation_archive.py)
+    changes=0, #pairs kept per day with the largest day-over-day change (src/correlation_change.py), 0 skips them
+    launch_dashboard=True
 ):
-    
-    if os.path.exists(output_correlations_dir) and not overwrite:
-        print(f"Data already exists in {output_correlations_dir}.")
-        user_input = input("Do you want to recalculate the data? (y/n): ").strip().lower()
-        if user_input != "y":
-            print("Skipping data recomputation.")
+    if trace is not None:
+        #the run itself with instrumentation on, the trace and report are written before the dashboard starts
+        with instrumented(trace):
+            orchestrate_pipeline(
+                zip_path, window, output_correlations_dir, overwrite, start_date, end_date, engine, incremental,
+                use_cache, scheduler, resume, neighbours, groups_csv, trace=None, approximate=approximate,
+                tile_size=tile_size, archive=archive, changes=changes, launch_dashboard=False
+            )
+        if launch_dashboard:
             print("Launching Streamlit dashboard...")
             subprocess.run(["streamlit", "run", "app/app.py"])
+        return
+
+    mode = "y" #full computation
+    if os.path.exists(output_correlations_dir) and not overwrite:
+        if resume:
+            mode = "r"
+        elif incremental:
+            mode = "u"
+        else:
+            print(f"Data already exists in {output_correlations_dir}.")
+            mode = input(
+                "Do you want to recalculate the data? (y = full rebuild, u = update new dates only, r = resume an interrupted run, n = no): "
+            ).strip().lower()
+
+        #a manifest without a last date was written by a run that never finished, extending it would leave holes
+        if mode == "u" and (read_manifest(output_correlations_dir) or {}).get("last_date", "") is None:
+            print("The previous run did not finish, resuming it instead.")
+            mode = "r"
+
+        if mode not in ("y", "u", "r"):
+            print("Skipping data recomputation.")
+            if launch_dashboard:
+                print("Launching Streamlit dashboard...")
+                subprocess.run(["streamlit", "run", "app/app.py"])
             return
+
+    groups = None if groups_csv is None else read_group_mapping(groups_csv)
+    stages = stage_settings(neighbours, groups, archive, changes)
+    manifest = first_date = None
+    if mode == "u":
+        load_start, first_date, reason = plan_incremental_run(
+            output_correlations_dir, window, approximate=approximate, stages=stages
+        )
+        if reason is None:
+            manifest = read_manifest(output_correlations_dir)
+            print(f"Updating summaries from {first_date.strftime('%Y-%m-%d')}...")
+            return_matrix = load_return_matrix(zip_path, start_date=load_start, end_date=end_date, use_cache=use_cache)
+
+            #a ticker outside the recorded universe means the data set changed underneath the old summaries
+            #(stores converted from pickles have no recorded universe, this run records it)
+            universe = set(manifest["tickers"] or []) | set(map(str, return_matrix.columns))
+            if manifest["tickers"] is not None and ticker_universe_hash(universe) != manifest["ticker_universe_hash"]:
+                reason = "ticker universe changed"
+                manifest = None
+        if reason is not None:
+            print(f"Full rebuild required: {reason}.")
+
+    if mode == "r":
+        manifest = read_manifest(output_correlations_dir)
+        reason = _manifest_mismatch(manifest, window, approximate, stages)
+        if reason is None:
+            return_matrix = load_return_matrix(zip_path, start_date=start_date, end_date=end_date, use_cache=use_cache)
+            universe = set(map(str, return_matrix.columns))
+            if manifest["tickers"] is not None and ticker_universe_hash(universe) != manifest["ticker_universe_hash"]:
+                reason = "ticker universe changed"
+
+        if reason is None:
+            moved = repair_store(output_correlations_dir)
+            remove_partial_neighbours(output_correlations_dir)
+            remove_partial_archive(output_correlations_dir)
+            if moved:
+                print(f"Moved {len(moved)} unreadable or partial part files to quarantine, their dates will be recomputed")
+            print("Resuming rolling correlation summary...")
         else:
+            print(f"Cannot resume, full rebuild required: {reason}.")
+            manifest = None
+
+    if manifest is None:
+        if os.path.exists(output_correlations_dir):
             print("Recomputing rolling correlation summary...")
             shutil.rmtree(output_correlations_dir)
+        return_matrix = load_return_matrix(zip_path, start_date=start_date, end_date=end_date, use_cache=use_cache)
+        universe = set(map(str, return_matrix.columns))
+        first_date = None
 
-    
-    print("Loading Stock Data...")
-    df = data_load_zip(zip_path)
-
-    print("Computing daily returns...")
-    returns = computing_daily_returns(df)
-
-    print("Pivoting returns matrix...")
-    return_matrix = pivot_returns(returns)
+    #recorded before any summary is written so an interrupted run can be resumed (last_date=None marks it unfinished)
+    write_manifest(output_correlations_dir, window, universe, SUMMARY_CODE_VERSION, None, approximate, stages)
 
+    if approximate and engine == "sliding":
+        print("Approximate summaries use the window engine.")
+        engine = "window"
+    if archive and engine == "tiles":
+        print("The correlation archive uses the window engine.")
+        engine = "window"
     print("Running rolling correlation summary...")
-    orchestrate_daily_correlation_summary_stats(
-        return_matrix,
-        window=window,
-        output_directory=output_correlations_dir
+    with span("correlation_summaries", "pipeline", engine=engine):
+        orchestrate_daily_correlation_summary_stats(
+            return_matrix,
+            window=window,
+            output_directory=output_correlations_dir,
+            engine=engine,
+            first_date=first_date,
+            scheduler=scheduler,
+            resume=mode == "r",
+            neighbours=neighbours,
+            groups=groups,
+            approximate=approximate,
+            tile_size=tile_size,
+            archive=archive,
+            changes=changes
+        )
+    write_manifest(
+        output_correlations_dir, window, universe, SUMMARY_CODE_VERSION, return_matrix.index[-1], approximate, stages
     )
+    with span("write_rollups", "store"):
+        write_rollups(output_correlations_dir)
+
+    if launch_dashboard:
+        print("Launching Streamlit dashboard...")
+        subprocess.run(["streamlit", "run", "app/app.py"])
+
+"""
+Live mode: keeps the summary of the window ending with today's partial day up to date as prices arrive (see
+src/live_stream.py) and publishes it to output_correlations_dir, where the dashboard picks it up.
+Prices come from live_file ("Ticker,Date,Price" lines appended by another process) or, without one, from a local
+socket on port. The completed days come from the archive. Live mode follows a single window length, window can be an
+int or a one element list (ValueError for more). Runs until interrupted (or until stop, a threading.Event, is set).
+"""
+
+def orchestrate_live(
+    zip_path="stock_data.zip",
+    window=20,
+    output_correlations_dir="daily_correlations_summary_stats",
+    live_file=None,
+    port=LIVE_PORT,
+    stop=None
+):
+    windows = window_lengths(window)
+    if len(windows) > 1:
+        raise ValueError(f"Live mode follows a single window length, got {windows}")
+    window = windows[0]
+    print("Loading Stock Data...")
+    prices = data_load_zip(zip_path)
+    live = LiveCorrelation.from_prices(prices, window)
+    del prices
+    os.makedirs(output_correlations_dir, exist_ok=True)
 
-    print("Launching Streamlit dashboard...")
-    subprocess.run(["streamlit", "run", "app/app.py"])
+    if live_file is not None:
+        print(f"Live mode: reading prices appended to {live_file}")
+        source = tail_lines(live_file, from_start=False, stop=stop)
+    else:
+        print(f"Live mode: listening for prices on localhost:{port}")
+        source = socket_lines(port, stop=stop)
+
+    def on_publish(summary):
+        print(
+            f"{summary['as_of']}: mean {summary['mean_correlation']:.4f}, {summary['tickers_updated']}/{summary['tickers']} "
+            f"tickers updated, refreshed in {summary['latency_seconds']:.2f}s"
+        )
+    try:
+        run_live(live, source, output_correlations_dir, on_publish)
+    except KeyboardInterrupt:
+        print("Live mode stopped.")
 
 if __name__ == "__main__":
-    orchestrate_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Computes the rolling correlation summaries and launches the dashboard")
+    parser.add_argument("--zip", default="stock_data.zip", help=".zip of per-ticker .csv price files")
+    parser.add_argument("--window", type=int, nargs="+", default=[20], help="one or more window lengths in days")
+    parser.add_argument("--output", default="daily_correlations_summary_stats", help="summary store directory")
+    parser.add_argument("--engine", choices=["sliding", "window", "tiles"], default="sliding")
+    parser.add_argument("--scheduler", choices=SCHEDULERS, default="threads")
+    parser.add_argument("--cluster", default=None, metavar="ADDRESS",
+                        help="dask scheduler address (tcp://host:8786) to run the tasks on instead of --scheduler")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help="tickers per side of a tile (--engine tiles)")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run, computing only missing dates")
+    parser.add_argument("--incremental", action="store_true", help="only compute dates after the last summarised one")
+    parser.add_argument("--overwrite", action="store_true", help="rebuild without asking")
+    parser.add_argument("--neighbours", type=int, default=0, help="most/least correlated peers kept per ticker and day")
+    parser.add_argument("--groups", default=None, help="Ticker,Group (or Ticker,Sector) CSV for sector averages")
+    parser.add_argument("--trace", default=None, help="write a Chrome trace JSON of the run here and print a run report")
+    parser.add_argument("--approximate", type=int, default=0, metavar="PAIRS",
+                        help="estimate the summaries from PAIRS sampled pairs per day (large universes), 0 is exact")
+    parser.add_argument("--archive", choices=ARCHIVE_DTYPES, default=None,
+                        help="also store every day's whole correlation matrix quantized to int8 or int16")
+    parser.add_argument("--changes", type=int, default=0, metavar="K",
+                        help="store the K pairs whose correlation moved most since the previous day, 0 skips them")
+    parser.add_argument("--live", nargs="?", const="", default=None, metavar="FILE",
+                        help="live mode: follow Ticker,Date,Price lines appended to FILE (or a local socket without FILE)")
+    parser.add_argument("--live-port", type=int, default=LIVE_PORT, help="socket port for --live without a file")
+    parser.add_argument("--no-dashboard", action="store_true")
+    args = parser.parse_args()
+
+    if args.live is not None:
+        if not args.no_dashboard:
+            print("Launching Streamlit dashboard...")
+            subprocess.Popen(["streamlit", "run", "app/app.py"])
+        orchestrate_live(args.zip, args.window, args.output, args.live or None, args.live_port)
+        raise SystemExit
+
+    orchestrate_pipeline(
+        zip_path=args.zip,
+        window=args.window,
+        output_correlations_dir=args.output,
+        overwrite=args.overwrite,
+        engine=args.engine,
+        incremental=args.incremental,
+        scheduler=args.cluster or args.scheduler,
+        resume=args.resume,
+        neighbours=args.neighbours,
+        groups_csv=args.groups,
+        trace=args.trace,
+        approximate=args.approximate,
+        tile_size=args.tile_size,
+        archive=args.archive,
+        changes=args.changes,
+        launch_dashboard=not args.no_dashboard
+    )
@@ -0,0 +1,294 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import psutil
+
+from src import instrumentation
+
+"""
+The purpose of this file is to run the window engine's tasks without a barrier after every fixed size batch.
+dask.compute on a batch of 50 tasks waits for the slowest one before the next batch can start, and the batch size had to
+be tuned by hand against the available memory.
+
+run_adaptive keeps a bounded number of tasks in flight and submits the next one as soon as any task finishes:
+- The first task runs alone as a probe. A background thread samples the RSS of this process and its worker processes
+  and records the peak memory above the starting baseline, divided by the number of tasks in flight at that moment.
+  The peak decays with a half-life of MEMORY_HALF_LIFE seconds, so one task's spike lowers the limit straight away but
+  the limit grows back once the following tasks stay smaller.
+- After every completion the in-flight limit is recomputed as memory budget // measured per-task peak, clamped to
+  [1, max_workers]. The budget is memory_fraction of the RAM available when the run started (or memory_limit bytes).
+- Throughput (dates/sec, in-flight count, limit, RSS) is passed to a progress callback after every completed task
+  and printed every progress_every seconds when no callback is given.
+- With instrumentation on (src/instrumentation.py) every task is recorded as a "task" span from submission to
+  completion with the peak process tree RSS seen while it was in flight, the RSS samples are recorded as a counter,
+  tasks are submitted through run_traced so the spans and counters of worker processes come back with the results,
+  and the idle worker time (slots without a task, e.g. while on_result writes to the store) is added to the report's
+  counters.
+
+Schedulers:
+- "threads": concurrent.futures thread pool. No serialisation; numpy and BLAS release the GIL
+- "processes": concurrent.futures process pool. Task arguments are pickled, so pass cache paths and offsets (see
+  src/return_cache.py) rather than arrays where possible
+- "distributed": a dask.distributed LocalCluster with one single threaded worker process per slot (needs the
+  optional distributed package)
+- "tcp://host:port": the address of a running dask scheduler, whose workers can be spread over several machines
+  (dask scheduler on one node, dask worker tcp://host:port on each). max_workers then only bounds the tasks in flight
+  and the memory sampler only sees this machine
+
+Several run_adaptive calls can share one pool (worker_pool) instead of starting workers for each call.
+"""
+
+SCHEDULERS = ("threads", "processes", "distributed")
+MEMORY_FRACTION = 0.5 #share of the available RAM the tasks in flight may use
+SAMPLE_INTERVAL = 0.05 #seconds between RSS samples
+MEMORY_HALF_LIFE = 60.0 #seconds for a per-task memory peak to count half as much
+
+#RSS of this process plus all of its child processes (pool or cluster workers)
+def process_tree_rss(process: psutil.Process = None) -> int:
+    process = process or psutil.Process()
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error: #worker exited between listing and sampling
+            pass
+    return rss
+
+"""
+Samples the process tree RSS in a background thread. peak_per_task is the largest (RSS - baseline) / in_flight seen
+while tasks were running, which is the measured memory cost of one task in flight. It is a decaying peak: every sample
+first scales it by 0.5 ** (seconds since the last sample / half_life), then takes the max with the current value, so
+a spike counts in full when it happens and fades out over the next few half-lives. watch(key) starts tracking the
+peak RSS for one task, unwatch(key) returns it.
+"""
+
+class MemorySampler:
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, half_life: float = MEMORY_HALF_LIFE):
+        self.interval = interval
+        self.half_life = half_life
+        self._last_sample = time.perf_counter()
+        self.baseline = process_tree_rss()
+        self.rss = self.baseline
+        self.peak_rss = self.baseline
+        self.peak_per_task = 0.0
+        self.in_flight = 0
+        self.task_peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        self.rss = process_tree_rss()
+        self.peak_rss = max(self.peak_rss, self.rss)
+        now = time.perf_counter()
+        self.peak_per_task *= 0.5 ** ((now - self._last_sample) / self.half_life)
+        self._last_sample = now
+        if self.in_flight:
+            self.peak_per_task = max(self.peak_per_task, (self.rss - self.baseline) / self.in_flight)
+        for key, peak in list(self.task_peaks.items()):
+            self.task_peaks[key] = max(peak, self.rss)
+        instrumentation.sample("rss_mb", rss=self.rss / 2**20)
+
+    def watch(self, key):
+        self.task_peaks[key] = self.rss
+
+    def unwatch(self, key) -> int:
+        return self.task_peaks.pop(key, self.rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+#Wraps a dask.distributed LocalCluster behind the submit/wait/shutdown calls used by run_adaptive
+class _DistributedPool:
+
+    def __init__(self, max_workers: int, address: str = None):
+        try:
+            from distributed import Client, LocalCluster
+        except ImportError:
+            raise ImportError("scheduler='distributed' needs the dask distributed package (pip install distributed)")
+        self.cluster = None if address else LocalCluster(n_workers=max_workers, threads_per_worker=1, processes=True)
+        self.client = Client(address or self.cluster)
+
+    def submit(self, fn, *args):
+        return self.client.submit(fn, *args, pure=False)
+
+    def wait_first(self, futures):
+        from distributed import wait as distributed_wait
+        return distributed_wait(futures, return_when="FIRST_COMPLETED")
+
+    def shutdown(self):
+        self.client.close()
+        if self.cluster is not None:
+            self.cluster.close()
+
+
+class _FuturesPool:
+
+    def __init__(self, executor):
+        self.executor = executor
+
+    def submit(self, fn, *args):
+        return self.executor.submit(fn, *args)
+
+    def wait_first(self, futures):
+        return wait(futures, return_when=FIRST_COMPLETED)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+def _open_pool(scheduler: str, max_workers: int):
+    if scheduler == "threads":
+        return _FuturesPool(ThreadPoolExecutor(max_workers=max_workers))
+    if scheduler == "processes":
+        return _FuturesPool(ProcessPoolExecutor(max_workers=max_workers))
+    if scheduler == "distributed":
+        return _DistributedPool(max_workers)
+    if scheduler.startswith("tcp://"):
+        return _DistributedPool(max_workers, address=scheduler)
+    raise ValueError(f"Unknown scheduler '{scheduler}', expected one of {SCHEDULERS}")
+
+#Pool for several run_adaptive(pool=...) calls, shut down when the block exits
+@contextmanager
+def worker_pool(scheduler: str = "threads", max_workers: int = None):
+    pool = _open_pool(scheduler, max_workers or os.cpu_count() or 1)
+    try:
+        yield pool
+    finally:
+        pool.shutdown()
+
+#Default progress output: one line every `every` seconds
+def _print_progress(every: float):
+    last = [0.0]
+    def progress(stats):
+        if stats["completed_dates"] == stats["total_dates"] or stats["elapsed"] - last[0] >= every:
+            last[0] = stats["elapsed"]
+            print(
+                f"Completed {stats['completed_dates']}/{stats['total_dates']} dates "
+                f"({stats['dates_per_sec']:.1f} dates/sec, {stats['in_flight']} in flight, limit {stats['limit']}, "
+                f"RSS {stats['rss_mb']:.0f}MB)"
+            )
+    return progress
+
+"""
+Runs fn(*args) for every (args, n_dates) in tasks and calls on_result(index, result, stats) as each task finishes, in
+completion order rather than submission order. index is the task's position in tasks and n_dates the number of dates
+it covers (used for the throughput). on_result may append more (args, n_dates) to tasks, they are scheduled in the same
+run (their dates are added to total_dates), so follow-up work starts as soon as the results it needs are in.
+Returns the final stats dictionary:
+completed_tasks, completed_dates, total_dates, elapsed, dates_per_sec, in_flight, limit, rss_mb, peak_task_mb,
+idle_worker_seconds (summed over the max_workers slots: time a slot had no task)
+"""
+
+def run_adaptive(
+    fn,
+    tasks: list,
+    on_result,
+    scheduler: str = "threads",
+    max_workers: int = None,
+    memory_limit: int = None, #bytes the tasks in flight may use, defaults to memory_fraction of the available RAM
+    memory_fraction: float = MEMORY_FRACTION,
+    progress=None, #callable(stats) after every completed task, None prints every progress_every seconds
+    progress_every: float = 5.0,
+    pool=None #open pool from worker_pool (scheduler is then ignored), None starts one for this run
+) -> dict:
+    max_workers = max_workers or os.cpu_count() or 1
+    memory_limit = memory_limit or int(psutil.virtual_memory().available * memory_fraction)
+    progress = progress or _print_progress(progress_every)
+
+    own_pool = pool is None
+    pool = _open_pool(scheduler, max_workers) if own_pool else pool
+    sampler = MemorySampler()
+    sampler.start()
+    start = time.perf_counter()
+    stats = {
+        "completed_tasks": 0,
+        "completed_dates": 0,
+        "total_dates": sum(n_dates for _, n_dates in tasks),
+        "elapsed": 0.0,
+        "dates_per_sec": 0.0,
+        "in_flight": 0,
+        "limit": 1, #the first task runs alone so its memory can be measured
+        "rss_mb": sampler.rss / 2**20,
+        "peak_task_mb": 0.0
+    }
+
+    traced = instrumentation.is_enabled()
+    pending = {} #future -> (task index, number of dates, submission time in ns)
+    submitted_tasks = 0 #tasks is read by position, on_result may append to it
+    counted_tasks = len(tasks) #tasks whose dates are in total_dates
+    idle = 0.0 #worker-seconds with a free slot
+    try:
+        while pending or submitted_tasks < len(tasks):
+            while submitted_tasks < len(tasks) and len(pending) < stats["limit"]:
+                index, (args, n_dates) = submitted_tasks, tasks[submitted_tasks]
+                submitted_tasks += 1
+                future = pool.submit(instrumentation.run_traced, fn, *args) if traced else pool.submit(fn, *args)
+                pending[future] = (index, n_dates, time.perf_counter_ns())
+                sampler.watch(future)
+                sampler.in_flight = len(pending)
+            if not pending:
+                break
+
+            waiting = time.perf_counter()
+            done, _ = pool.wait_first(list(pending))
+            handling = time.perf_counter()
+            idle += (max_workers - len(pending)) * (handling - waiting)
+            sampler.sample() #make sure short tasks are measured at least once
+            for future in done:
+                index, n_dates, submitted = pending.pop(future)
+                result = future.result()
+                peak_rss = sampler.unwatch(future)
+                if traced:
+                    result, events, counters = result
+                    instrumentation.merge_events(events)
+                    instrumentation.merge_counters(counters)
+                    instrumentation.merge_events([{
+                        "name": "task",
+                        "cat": "scheduler",
+                        "ph": "X",
+                        "ts": submitted / 1000,
+                        "dur": (time.perf_counter_ns() - submitted) / 1000,
+                        "pid": os.getpid(),
+                        "tid": threading.get_ident(),
+                        "args": {"index": index, "dates": n_dates, "peak_rss_mb": peak_rss / 2**20}
+                    }])
+                stats["completed_tasks"] += 1
+                stats["completed_dates"] += n_dates
+                stats["elapsed"] = time.perf_counter() - start
+                stats["dates_per_sec"] = stats["completed_dates"] / max(stats["elapsed"], 1e-9)
+                stats["in_flight"] = len(pending)
+                stats["rss_mb"] = sampler.rss / 2**20
+                stats["peak_task_mb"] = sampler.peak_per_task / 2**20
+                with instrumentation.span("on_result", "scheduler"):
+                    on_result(index, result, stats)
+                stats["total_dates"] += sum(n_dates for _, n_dates in tasks[counted_tasks:])
+                counted_tasks = len(tasks)
+                progress(dict(stats))
+            sampler.in_flight = len(pending)
+            #no task is submitted while results are handled (store writes), so the finished tasks' slots stay empty
+            idle += (max_workers - len(pending)) * (time.perf_counter() - handling)
+
+            #memory budget divided by the measured cost of one task in flight
+            per_task = max(sampler.peak_per_task, 1.0)
+            stats["limit"] = int(max(1, min(max_workers, memory_limit // per_task)))
+    finally:
+        sampler.stop()
+        if own_pool:
+            pool.shutdown()
+
+    stats["in_flight"] = 0
+    stats["idle_worker_seconds"] = idle
+    instrumentation.add_counter("idle_worker_seconds", idle)
+    instrumentation.add_counter("worker_seconds", max_workers * (time.perf_counter() - start))
+    return stats
@@ -0,0 +1,303 @@
+import os
+import numpy as np
+import pandas as pd
+
+from src.summary_reducer import HISTOGRAM_BINS, HIGH_CORRELATION, TOP_PAIRS, NEGATIVE_PAIRS
+from src.summary_store import _append_table, _load_table, _next_write_stamp, INTERVAL_TABLE, LEGACY_WINDOW
+from src.instrumentation import span
+
+"""
+The purpose of this file is an approximate summary for universes too large for the exact O(N^2 * W) summary
+(20k-50k tickers: 200M-1.25B pairs per day). It costs O((S + C) * W) for S sampled pairs and C candidate pairs plus
+O(N * W * bands * bits) for hashing, so it grows close to linearly with the number of tickers.
+
+Distribution statistics come from a uniform random sample of pairs (with replacement), each scored with its exact
+pairwise-complete correlation (same semantics as DataFrame.corr(), pairs with a NaN correlation are left out like in the
+exact summary). Each statistic comes with a 95% confidence interval:
+- mean            normal interval, sd / sqrt(n)
+- std             delta method on the variance, sd((r - mean)^2) / (2 * std * sqrt(n))
+- median          distribution-free interval from the order statistics at ranks n/2 -+ 1.96 * sqrt(n)/2
+- pct_above_0.7   Wilson score interval (stays sensible for the small shares this usually is)
+- entropy         Miller-Madow corrected, percentile interval of the entropy of multinomial resamples of the sample's
+                  histogram
+
+Top pairs cannot be sampled (20 pairs out of a billion), so they come from a candidate filter: random hyperplane LSH
+(SimHash) on the z-scored return vectors. Each of `bands` bands hashes every ticker to `bits` signs of random
+projections. Two tickers with correlation r agree on each sign with probability 1 - arccos(r) / pi, so strongly
+correlated tickers tend to land in the same bucket. The complement of a signature is the signature of the negated
+vector, so keying every bucket on min(key, ~key) also puts strongly negatively correlated tickers together.
+Every pair sharing a bucket in any band is a candidate and is scored exactly. The closest to +-1 and most negative
+pairs are the best of those candidates and the sampled pairs, so they are exact correlations of real pairs, but a pair
+the hash never put together can be missed (recall is measured in tests/performance_approximate_summary.py). The
+closest to zero pairs come from the same pairs, mostly the sample. With billions of pairs near zero they are good
+examples, not the global top 20.
+Tickers with missing days are hashed on their z-scores over the days they have (0 on the others) and scored exactly.
+
+The summary has the same keys as the exact one plus "intervals" ({stat: (low, high)}), "sample_pairs" (valid sampled
+pairs) and "candidate_pairs". The intervals are stored in the summary store's confidence_intervals table.
+Sampling and hashing use a generator seeded with seed and the date, so a date gives the same summary on every run.
+"""
+
+SAMPLE_PAIRS = 200_000
+LSH_BANDS = 24
+MAX_BUCKET = 128 #tickers of a bucket paired with each other, larger buckets only pair tickers this close in the bucket
+BOOTSTRAP_RESAMPLES = 200
+CONFIDENCE_Z = 1.959964 #95% two sided
+PAIR_CHUNK = 1 << 17 #pairs scored at a time
+INTERVAL_STATS = ["mean_correlation", "median_correlation", "std_correlation", "pct_above_0.7", "correlation_entropy"]
+
+"""
+What pair_correlations needs from a (W x N) window: zero-filled float64 values shifted by each column's mean, 0/1
+masks, the shifts, which columns are fully observed and (N x W) unit length z-scores of the columns. The correlation of
+two fully observed columns is the dot product of their unit z-scores, other pairs are scored over the days both have.
+"""
+
+def prepare_window(rows: np.ndarray) -> dict:
+    rows = np.asarray(rows, dtype=np.float32)
+    observed = ~np.isnan(rows)
+    count = observed.sum(axis=0)
+    shift = np.where(observed, rows, 0).sum(axis=0) / np.maximum(count, 1)
+    values = np.where(observed, rows - shift, 0).astype(np.float64)
+    mask = observed.astype(np.float64)
+
+    #z-scores over each column's own days, constant columns (same tolerance as the exact kernels) are left at 0
+    eps = np.finfo(np.float32).eps #tolerance of the float32 inputs
+    centred = np.where(observed, values - values.sum(axis=0) / np.maximum(count, 1), 0)
+    sum_xx = (values * values).sum(axis=0)
+    variance = (centred * centred).sum(axis=0)
+    valid = (count >= 2) & (variance > 16 * eps * sum_xx + count * (16 * eps * np.abs(shift)) ** 2)
+    units = np.where(valid, centred / np.sqrt(np.where(valid, variance, 1)), 0)
+    return {
+        "values": values,
+        "mask": mask,
+        "shift": shift,
+        "full": observed.all(axis=0),
+        "valid": valid,
+        "units": np.ascontiguousarray(units.T)
+    }
+
+#Exact pairwise-complete correlations of the pairs (first[k], second[k]) from the output of prepare_window
+def pair_correlations(window: dict, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    result = np.full(len(first), np.nan)
+    full = window["full"][first] & window["full"][second]
+    units = window["units"]
+    for start in range(0, len(first), PAIR_CHUNK):
+        a, b = first[start:start + PAIR_CHUNK], second[start:start + PAIR_CHUNK]
+        dense = full[start:start + PAIR_CHUNK]
+        block = result[start:start + PAIR_CHUNK]
+        block[dense] = np.einsum("ij,ij->i", units[a[dense]], units[b[dense]])
+        block[dense & ~(window["valid"][a] & window["valid"][b])] = np.nan #constant columns have no correlation
+        if not dense.all():
+            block[~dense] = _masked_correlations(window, a[~dense], b[~dense])
+    return np.clip(result, -1, 1)
+
+#Pairs with a column missing days: sums over the days both columns have (same tolerance as the exact masked kernel)
+def _masked_correlations(window: dict, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    values, mask, shift = window["values"], window["mask"], window["shift"]
+    eps = np.finfo(np.float32).eps
+    both = mask[:, a] * mask[:, b]
+    x, y = values[:, a] * both, values[:, b] * both
+    n = both.sum(axis=0)
+    sum_x, sum_y = x.sum(axis=0), y.sum(axis=0)
+    sum_xx, sum_yy = (x * x).sum(axis=0), (y * y).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var_x = sum_xx - sum_x * sum_x / n
+        var_y = sum_yy - sum_y * sum_y / n
+        var_x[var_x <= 16 * eps * sum_xx + n * (16 * eps * np.abs(shift[a])) ** 2] = np.nan
+        var_y[var_y <= 16 * eps * sum_yy + n * (16 * eps * np.abs(shift[b])) ** 2] = np.nan
+        corr = ((x * y).sum(axis=0) - sum_x * sum_y / n) / np.sqrt(var_x * var_y)
+    corr[n < 2] = np.nan
+    return corr
+
+#Uniform random pairs (i < j) of n columns, drawn with replacement
+def sample_pairs(n_columns: int, n_pairs: int, rng: np.random.Generator) -> tuple:
+    first = rng.integers(0, n_columns, n_pairs)
+    second = rng.integers(0, n_columns - 1, n_pairs)
+    second += second >= first #uniform over the other columns
+    return np.minimum(first, second), np.maximum(first, second)
+
+"""
+Candidate pairs (i < j, deduplicated) from SimHash bands over the (N x W) unit z-scores of prepare_window. In every band tickers are
+sorted by their canonical key min(key, ~key) and each is paired with the tickers up to MAX_BUCKET - 1 places after it
+that share the key, so a bucket of m tickers gives its m (m - 1) / 2 pairs.
+"""
+
+def lsh_candidates(units: np.ndarray, bands: int, bits: int, rng: np.random.Generator, max_bucket: int = MAX_BUCKET) -> tuple:
+    n_columns, n_rows = units.shape
+    hashable = np.flatnonzero(np.abs(units).sum(axis=1) > 0)
+    if len(hashable) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    signs = (units[hashable] @ rng.standard_normal((n_rows, bands * bits))) > 0
+    weights = 1 << np.arange(bits, dtype=np.int64)
+    all_ones = (1 << bits) - 1
+
+    codes = []
+    for band in range(bands):
+        keys = signs[:, band * bits:(band + 1) * bits] @ weights
+        keys = np.minimum(keys, keys ^ all_ones)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys, members = keys[order], hashable[order]
+        for offset in range(1, max_bucket):
+            same = sorted_keys[offset:] == sorted_keys[:-offset]
+            if not same.any():
+                break
+            first, second = members[:-offset][same], members[offset:][same]
+            codes.append(np.minimum(first, second) * n_columns + np.maximum(first, second))
+    if not codes:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    codes = np.sort(np.concatenate(codes))
+    codes = codes[np.r_[True, codes[1:] != codes[:-1]]] #np.unique is several times slower on millions of codes
+    return codes // n_columns, codes % n_columns
+
+#Entropy (bits) of 50 bin histograms over [-1, 1] given as rows of counts, with the Miller-Madow correction for the
+#plug-in estimate's downward bias on a sample ((occupied bins - 1) / 2n nats)
+def _entropy(counts: np.ndarray) -> np.ndarray:
+    counts = np.atleast_2d(counts).astype(np.float64)
+    total = counts.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        probabilities = counts / total[:, None]
+        terms = np.where(probabilities > 0, probabilities * np.log2(probabilities), 0)
+        return -terms.sum(axis=1) + ((counts > 0).sum(axis=1) - 1) / (2 * total * np.log(2))
+
+#Estimates and 95% intervals of the summary statistics from a sample of correlations (NaNs removed)
+def sample_statistics(sample: np.ndarray, rng: np.random.Generator) -> tuple:
+    n = len(sample)
+    if n < 2:
+        nan = float("nan")
+        return {stat: nan for stat in INTERVAL_STATS}, {stat: (nan, nan) for stat in INTERVAL_STATS}
+    mean = float(sample.mean())
+    std = float(sample.std())
+    mean_error = CONFIDENCE_Z * std / np.sqrt(n)
+    std_error = CONFIDENCE_Z * float(((sample - mean) ** 2).std()) / (2 * max(std, 1e-12) * np.sqrt(n))
+
+    ordered = np.sort(sample)
+    low_rank = int(max(0, np.floor(n / 2 - CONFIDENCE_Z * np.sqrt(n) / 2)))
+    high_rank = int(min(n - 1, np.ceil(n / 2 + CONFIDENCE_Z * np.sqrt(n) / 2)))
+    median = float(np.median(ordered))
+
+    share = float(np.count_nonzero(np.abs(sample) > HIGH_CORRELATION)) / n
+    z2 = CONFIDENCE_Z ** 2
+    centre = (share + z2 / (2 * n)) / (1 + z2 / n)
+    spread = CONFIDENCE_Z * np.sqrt(share * (1 - share) / n + z2 / (4 * n * n)) / (1 + z2 / n)
+
+    counts, _ = np.histogram(sample, bins=HISTOGRAM_BINS, range=(-1, 1))
+    entropy = float(_entropy(counts)[0])
+    resampled = _entropy(rng.multinomial(n, counts / n, size=BOOTSTRAP_RESAMPLES))
+
+    estimates = {
+        "mean_correlation": mean,
+        "median_correlation": median,
+        "std_correlation": std,
+        "pct_above_0.7": share,
+        "correlation_entropy": entropy
+    }
+    intervals = {
+        "mean_correlation": (mean - mean_error, mean + mean_error),
+        "median_correlation": (float(ordered[low_rank]), float(ordered[high_rank])),
+        "std_correlation": (std - std_error, std + std_error),
+        "pct_above_0.7": (max(0.0, centre - spread), min(1.0, centre + spread)),
+        "correlation_entropy": tuple(float(value) for value in np.percentile(resampled, [2.5, 97.5]))
+    }
+    return estimates, intervals
+
+#The k best distinct scored pairs by key (smallest first) as the summary's list of pair dictionaries. Only a head of
+#the pairs is sorted, a pair can appear twice (sampled and a candidate, or sampled twice)
+def _top_pairs(first, second, correlations, keys, k, tickers, n_columns) -> list:
+    head = min(len(keys), 4 * k)
+    while True:
+        best = np.argpartition(keys, head - 1)[:head] if head < len(keys) else np.arange(len(keys))
+        best = best[np.argsort(keys[best], kind="stable")]
+        _, first_seen = np.unique(first[best] * n_columns + second[best], return_index=True)
+        best = best[np.sort(first_seen)][:k]
+        if len(best) == k or head >= len(keys):
+            break
+        head = min(len(keys), head * 4)
+    return [
+        {"ticker_1": tickers[first[i]], "ticker_2": tickers[second[i]], "correlation": float(correlations[i])}
+        for i in best
+    ]
+
+"""
+Approximate summary of one (W x N) window of returns, same dictionary as summarize_rows plus intervals, sample_pairs
+and candidate_pairs (see the top of this file). n_pairs pairs are sampled for the statistics, bands x bits SimHash
+signatures give the top pair candidates.
+"""
+
+def approximate_summary(
+    rows: np.ndarray,
+    tickers: np.ndarray,
+    current_date: pd.Timestamp,
+    n_pairs: int = SAMPLE_PAIRS,
+    bands: int = LSH_BANDS,
+    bits: int = None, #bits per band, by default log2(N) - 1 (at least 8) so a ticker shares a bucket with a few others
+    seed: int = 0
+) -> dict:
+    rng = np.random.default_rng([seed, current_date.toordinal()])
+    n_columns = np.asarray(rows).shape[1]
+    bits = max(8, int(np.log2(max(n_columns, 2))) - 1) if bits is None else bits
+    with span("approximate_prepare", "approximate"):
+        window = prepare_window(rows)
+    with span("approximate_sample", "approximate", pairs=n_pairs):
+        sample_first, sample_second = sample_pairs(n_columns, n_pairs, rng)
+        sample = pair_correlations(window, sample_first, sample_second)
+        estimates, intervals = sample_statistics(sample[~np.isnan(sample)], rng)
+    with span("approximate_candidates", "approximate"):
+        candidate_first, candidate_second = lsh_candidates(window["units"], bands, bits, rng)
+        candidates = pair_correlations(window, candidate_first, candidate_second)
+
+    #candidates and sampled pairs together, NaN correlations dropped
+    first = np.concatenate([candidate_first, sample_first])
+    second = np.concatenate([candidate_second, sample_second])
+    correlations = np.concatenate([candidates, sample])
+    scored = ~np.isnan(correlations)
+    first, second, correlations = first[scored], second[scored], correlations[scored]
+    top = lambda keys, k: _top_pairs(first, second, correlations, keys, k, tickers, n_columns)
+
+    return {
+        "Date": current_date.strftime('%Y-%m-%d'),
+        **estimates,
+        "top_20_closest_to_zero": top(np.abs(correlations), TOP_PAIRS),
+        "top_20_closest_to_one": top(-np.abs(correlations), TOP_PAIRS),
+        "top_5_most_negative": top(correlations, NEGATIVE_PAIRS),
+        "intervals": intervals,
+        "sample_pairs": int(np.count_nonzero(~np.isnan(sample))),
+        "candidate_pairs": len(candidate_first)
+    }
+
+#Long table of the intervals carried by a batch of approximate summaries: Date, window, stat, estimate, low, high, pairs
+def interval_table(summaries: list) -> pd.DataFrame:
+    columns = ["Date", "window", "stat", "estimate", "low", "high", "sample_pairs"]
+    table = pd.DataFrame(
+        [
+            {
+                "Date": summary["Date"],
+                "window": summary.get("window", LEGACY_WINDOW),
+                "stat": stat,
+                "estimate": summary[stat],
+                "low": low,
+                "high": high,
+                "sample_pairs": summary["sample_pairs"]
+            }
+            for summary in summaries if summary.get("intervals") is not None
+            for stat, (low, high) in summary["intervals"].items()
+        ],
+        columns=columns
+    )
+    table["Date"] = pd.to_datetime(table["Date"])
+    table["window"] = table["window"].astype("int16")
+    table["sample_pairs"] = table["sample_pairs"].astype("int64")
+    return table
+
+#Appends the confidence intervals of a batch of approximate summaries to the store, returns the part files written
+def append_intervals(summaries: list, store_dir: str) -> list:
+    table = interval_table(summaries)
+    if table.empty:
+        return []
+    return _append_table(table, os.path.join(store_dir, INTERVAL_TABLE), _next_write_stamp(store_dir))
+
+#Loads the stored intervals for a date range (every date by default), one window or all, sorted by window, Date, stat
+def load_intervals(store_dir: str, start_date=None, end_date=None, window=None) -> pd.DataFrame:
+    columns = ["Date", "window", "stat", "estimate", "low", "high", "sample_pairs"]
+    table = _load_table(os.path.join(store_dir, INTERVAL_TABLE), columns, start_date, end_date, window)
+    table = table.drop_duplicates(subset=["window", "Date", "stat"], keep="last")
+    return table.sort_values(["window", "Date", "stat"]).reset_index(drop=True)
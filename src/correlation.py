@@ -1,10 +1,23 @@
 import pandas as pd
 import numpy as np
 import os
-from src.helpers import pickle_save
-import dask
+import time
+from src.fast_correlation import rolling_correlation_states, CorrelationWindow
+from src.summary_reducer import reduce_correlation_matrix, reduce_correlation_blocks
+from src.summary_store import append_summaries, completed_dates, window_lengths
+from src.return_cache import cache_entry_of, read_return_window
+from src.neighbour_index import append_neighbours
+from src.group_correlation import group_codes, group_correlation, append_group_correlations
+from src.approximate_summary import approximate_summary, append_intervals
+from src.correlation_archive import append_archive, ARCHIVE_DTYPES
+from src.correlation_change import append_changes
+from src.adaptive_scheduler import run_adaptive, worker_pool
+from src.tiled_summary import tiled_summaries, TILE_SIZE
+from src.instrumentation import span
 from dask import delayed
 
+SUMMARY_CODE_VERSION = 2 #bump when a change alters the saved summaries, incremental runs then require a full rebuild
+
 """
 The purpose of this file is to calculate rolling 20 day corrleations for stock data and calculate summary statistics at the daily level
 Both memory and computation time were constrained due to the size of the intended data set (5000 stocks over ~5 years)
@@ -14,7 +27,7 @@ The steps to achieve this were:
 1. Computing daily percentage returns per stock
 2. Pivoting data into a return matrix
 3. Calculating rolling correlation matrices
-4. Calculating and saving summary statistics
+4. Calculating summary statistics and saving them to a columnar (Parquet) summary store
 """
 
 #Computes daily percentage returns for each stock. Pandas DataFrame[Ticker, Date, Price] -> Pandas DataFrame[Ticker, Date, Price, Returns]
@@ -31,110 +44,451 @@ def pivot_returns(df_returns: pd.DataFrame) -> pd.DataFrame:
     return df_returns.pivot(index="Date", columns="Ticker", values="Return").astype('float32')
 
 """
-    For a given window of stock returns:
-    - Computes correlation matrix
-    - Extracts upper triangle of correlations
+Single pass replacement for pivot_returns(computing_daily_returns(df)), same result (index, columns, NaN placement and
+float32 values) without sorting, grouping or pivoting the long frame:
+1. Ticker codes (the categorical codes, or factorized names) and factorized Date codes give every row its cell
+2. Prices are scattered straight into a preallocated float32 Date x Ticker array, with a boolean array of the cells
+   that have a row
+3. The array is walked once along the date axis keeping each ticker's last price. Every cell becomes
+   price / last price - 1 in place (a missing price is carried forward, like pct_change), cells without a row stay NaN
+4. Dates and tickers without any return are dropped (a slice, not a copy, when only leading dates go)
+Peak memory is the array plus the boolean cells and the codes, instead of several copies of the long frame (see the
+daily_return_matrix stage of tests/benchmark.py).
+"""
+
+def daily_return_matrix(df: pd.DataFrame) -> pd.DataFrame:
+    if isinstance(df["Ticker"].dtype, pd.CategoricalDtype):
+        ticker_codes, tickers = df["Ticker"].cat.codes.to_numpy(), df["Ticker"].cat.categories
+    else:
+        ticker_codes, tickers = pd.factorize(df["Ticker"], sort=True)
+    date_codes, dates = pd.factorize(df["Date"], sort=True)
+
+    values = np.full((len(dates), len(tickers)), np.nan, dtype=np.float32)
+    has_row = np.zeros(values.shape, dtype=bool)
+    values[date_codes, ticker_codes] = df["Price"].to_numpy(dtype=np.float32)
+    has_row[date_codes, ticker_codes] = True
+    if np.count_nonzero(has_row) != len(df):
+        raise ValueError("Index contains duplicate entries, cannot reshape") #same error as pivot
+
+    last_price = np.full(len(tickers), np.nan, dtype=np.float32)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for row, rows_present in zip(values, has_row):
+            price = np.where(np.isnan(row), last_price, row)
+            np.divide(price, last_price, out=row)
+            row -= 1
+            row[~rows_present] = np.nan
+            last_price = price
+
+    observed = ~np.isnan(values)
+    keep_dates, keep_tickers = observed.any(axis=1), observed.any(axis=0)
+    first_date = int(np.argmax(keep_dates)) if keep_dates.any() else len(dates)
+    if keep_dates[first_date:].all():
+        values, dates = values[first_date:], dates[first_date:]
+    else:
+        values, dates = values[keep_dates], dates[keep_dates]
+    if not keep_tickers.all():
+        values, tickers = values[:, keep_tickers], tickers[keep_tickers]
+
+    if isinstance(df["Ticker"].dtype, pd.CategoricalDtype):
+        columns = pd.CategoricalIndex(tickers, categories=df["Ticker"].cat.categories, name="Ticker")
+    else:
+        columns = pd.Index(tickers, name="Ticker")
+    return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name="Date"), columns=columns, copy=False)
+
+"""
+    For a given correlation matrix (N x N numpy array, columns in ticker order):
+    - Walks the upper triangle in blocks of rows (never building the full triangle or a list of ticker pairs)
     - Computes summary stats (mean, median, std, entropy, etc.)
     - Identifies interesting ticker pairs (high/low/zero correlation)
-    - Saves results as a pickle file with the date in the filename
-    
-    Delayed is used to hold execution until dask has optimized the calculations for performance reasons
-    """
-    
+    - Returns the summary dictionary that gets saved for the date
+    See src/summary_reducer.py for the streaming reduction
+"""
+
+def summarize_correlation_matrix(
+    corr_matrix: np.ndarray,
+    tickers: np.ndarray,
+    current_date: pd.Timestamp,
+    neighbours: int = 0, #peers per ticker and side for the neighbour index, 0 skips them
+    archive: str = None, #"int8" or "int16" keeps the quantized upper triangle for the correlation archive
+    previous: CorrelationWindow = None, #previous date's window, adds the day-over-day changes
+    changes: int = 0 #pairs kept with the largest day-over-day change
+) -> dict:
+    return reduce_correlation_matrix(
+        corr_matrix, tickers, current_date, neighbours=neighbours, archive=archive,
+        previous_tile_fn=None if previous is None else previous.tile, changes=changes
+    )
+
+"""
+    For a given window of stock returns:
+    - Computes the correlation matrix block by block (batched_correlation kernel, same results as DataFrame.corr())
+    - Summarises each block as it is produced, so peak memory is one block of rows rather than N x N
+    - Returns the summary dictionary, the orchestrator appends a whole batch of them to the summary store at once
+"""
+
+def summarize_window(
+    window_slice: pd.DataFrame,
+    current_date: pd.Timestamp
+) -> dict:
+    return summarize_rows(window_slice.to_numpy(), window_slice.columns.to_numpy(), current_date)
+
+#Same as summarize_window for a plain (W x N) array of returns (or its prepared CorrelationWindow) with the tickers
+#passed separately. previous is the previous date's window (prepared or not), it adds the `changes` largest moves
+def summarize_rows(
+    rows,
+    tickers: np.ndarray,
+    current_date: pd.Timestamp,
+    neighbours: int = 0,
+    archive: str = None,
+    previous=None,
+    changes: int = 0
+) -> dict:
+    with span("correlation_window", "correlation"):
+        correlation_window = rows if isinstance(rows, CorrelationWindow) else CorrelationWindow(rows)
+        if previous is not None and not isinstance(previous, CorrelationWindow):
+            previous = CorrelationWindow(previous)
+    return reduce_correlation_blocks(
+        correlation_window.tile, correlation_window.n_columns, tickers, current_date, neighbours=neighbours,
+        archive=archive, previous_tile_fn=None if previous is None else previous.tile, changes=changes
+    )
+
+#Delayed is used to hold execution until dask has optimized the calculations for performance reasons
+@delayed
+def compute_summary_stats(
+    window_slice: pd.DataFrame,
+    current_date: pd.Timestamp
+) -> dict:
+    return summarize_window(window_slice, current_date)
+
+"""
+Window engine task for a run of consecutive dates. Neighbouring windows overlap by window - 1 rows, so instead of one
+window DataFrame per date the task gets the one block of rows covering all of its windows: rows row_start:row_stop of
+the return matrix, which end on the row before the last date (the window of the i-th date with a single window is
+block[i:i + window]).
+source is either that block as an array, or the path of a return matrix cache entry in which case the worker maps the
+file and slices the block itself (only the path and offsets are sent to the task).
+window is one length or a list of them, the block then covers the longest and every summary is tagged with its window.
+Dates without enough rows before them for a window get no summary for it.
+neighbours > 0 adds every ticker's top peers to each summary (see src/neighbour_index.py), codes (the group code of
+every column) adds the average correlations between and within the n_groups groups (see src/group_correlation.py).
+approximate > 0 replaces the exact summaries by approximate ones from that many sampled pairs (see
+src/approximate_summary.py), archive ("int8" or "int16") adds each window's quantized upper triangle (see
+src/correlation_archive.py).
+changes > 0 adds the pairs that moved most against the previous date's window (see src/correlation_change.py), the
+block then starts one row earlier. Each date's prepared window is kept as the next date's previous window.
+Plain function (not delayed) so it can be submitted to thread, process or distributed pools by src/adaptive_scheduler.py
+"""
+
+def compute_block_summary_stats(
+    source,
+    row_start: int,
+    row_stop: int,
+    dates: pd.DatetimeIndex,
+    tickers: np.ndarray,
+    window,
+    neighbours: int = 0,
+    codes: np.ndarray = None,
+    n_groups: int = 0,
+    approximate: int = 0,
+    archive: str = None,
+    changes: int = 0
+) -> list:
+    block = read_return_window(source, row_start, row_stop) if isinstance(source, str) else source
+    first_end = row_stop - row_start - len(dates) + 1 #block row after the first date's windows
+    summaries = []
+    prepared = {} #window length -> (end, CorrelationWindow) of the last window, the next date's previous window
+    for i, current_date in enumerate(dates):
+        for length in window_lengths(window):
+            end = first_end + i
+            if end - length < 0:
+                continue
+            rows = block[end - length:end]
+            with span("date", date=current_date.strftime('%Y-%m-%d'), window=length):
+                if approximate:
+                    summary = {**approximate_summary(rows, tickers, current_date, approximate), "window": length}
+                elif changes:
+                    last_end, previous = prepared.get(length, (None, None))
+                    with span("correlation_window", "correlation"):
+                        if last_end != end - 1:
+                            previous = CorrelationWindow(block[end - length - 1:end - 1]) if end > length else None
+                        current = CorrelationWindow(rows)
+                    prepared[length] = (end, current)
+                    summary = {
+                        **summarize_rows(current, tickers, current_date, neighbours, archive, previous, changes),
+                        "window": length
+                    }
+                else:
+                    summary = {**summarize_rows(rows, tickers, current_date, neighbours, archive), "window": length}
+                if codes is not None:
+                    with span("group_correlation"):
+                        summary["groups"] = group_correlation(rows, codes, n_groups)
+            summaries.append(summary)
+    return summaries
+
+#Single date version that writes the summary straight to the store in output_directory
 @delayed
 def compute_and_save_summary_stats(
     window_slice: pd.DataFrame,
     current_date: pd.Timestamp,
     output_directory: str
 ) -> None:
-    # Calculate correlation matrix
-    corr_matrix = window_slice.corr().astype('float32')
-    
-    # Get upper triangle values
-    tickers = corr_matrix.columns.to_numpy()
-    n = len(tickers)
-    upper_indices = np.triu_indices(n, k=1)
-    corr_values = corr_matrix.values[upper_indices].astype('float32')
-    
-    # Map back to ticker pairs
-    ticker_pairs = list(zip(tickers[upper_indices[0]], tickers[upper_indices[1]]))
-
-    # Basic summary stats
-    mean_corr = np.mean(corr_values)
-    median_corr = np.median(corr_values)
-    std_corr = np.std(corr_values)
-    pct_above_0_7 = np.mean(np.abs(corr_values) > 0.7)
-
-    # Correlation entropy
-    hist, _ = np.histogram(corr_values, bins=50, range=(-1, 1))
-    probabilities = hist / hist.sum()
-    probabilities = probabilities[probabilities > 0]
-    entropy = -np.sum(probabilities * np.log2(probabilities))
-
-    # Get top N indices
-    def get_top_pairs(indices):
-        return [
-            {
-                "ticker_1": ticker_pairs[i][0],
-                "ticker_2": ticker_pairs[i][1],
-                "correlation": float(corr_values[i])
-            }
-            for i in indices
-        ]
-    
-    #get the index of each correlation of interest, so ticker pairs can be assigned to the value
-    abs_corr = np.abs(corr_values)
-    closest_to_zero_idx = np.argpartition(abs_corr, 20)[:20]
-    closest_to_one_idx = np.argpartition(-abs_corr, 20)[:20]
-    most_negative_idx = np.argpartition(corr_values, 5)[:5]
-
-    #Summary dictionary
-    summary = {
-        "Date": current_date.strftime('%Y-%m-%d'),
-        "mean_correlation": float(mean_corr),
-        "median_correlation": float(median_corr),
-        "std_correlation": float(std_corr),
-        "pct_above_0.7": float(pct_above_0_7),
-        "correlation_entropy": float(entropy),
-        "top_20_closest_to_zero": get_top_pairs(closest_to_zero_idx),
-        "top_20_closest_to_one": get_top_pairs(closest_to_one_idx),
-        "top_5_most_negative": get_top_pairs(most_negative_idx),
-    }
-    
-    #save the summary file with pickle
-    filename = os.path.join(output_directory, f"correlation_summary_{current_date.strftime('%Y-%m-%d')}.pkl")
-    pickle_save(summary, filename)
+    with span("date", date=current_date.strftime('%Y-%m-%d')):
+        summary = summarize_window(window_slice, current_date)
+    with span("store_write"):
+        append_summaries([summary], output_directory)
 
 """
 Orchestrates the rolling correlation analysis over a DataFrame of stock returns.
 For each date, takes a trailing window and computes correlation stats.
-Uses Dask to process in parallel. Increasing batch_size will decrease run time but increase the memory usage
+window is one length or a list of them (e.g. [5, 20, 60, 120]); every length is summarised in the same pass over the
+dates and each summary is tagged with its window in the store. A date gets a summary for every window with a full
+trailing history.
+Summaries are appended to the Parquet summary store in output_directory (see src/summary_store.py) batch_size dates at
+a time.
+
+engine="window" recomputes every window from scratch (batched_correlation) in parallel. The dates are cut into runs of
+dates_per_task consecutive dates, each task gets row offsets and one shared block of rows covering its run (or only
+the cache path when the return matrix is memory-mapped). The tasks go through run_adaptive (src/adaptive_scheduler.py),
+which keeps as many tasks in flight as the measured per-task memory allows and starts the next run as soon as a slot
+frees up, on the "threads", "processes" or "distributed" scheduler.
+Every engine returns a list with one dictionary per store append: the batch number, the dates it wrote and the
+throughput so far (dates_per_sec). The window engine's also carry the bytes sent to the tasks behind it and the
+scheduler's in-flight count and RSS at that point. Nothing left to compute returns [].
+engine="sliding" walks the dates in order and updates running sums instead (see src/fast_correlation.py),
+so each day costs one rank-2 update plus normalisation instead of a full O(N^2 * W) recomputation. With several
+windows they share the shift, the row factors and the re-anchoring (MultiWindowCorrelationState); each window's
+matrix is then normalised and reduced in turn, so only one N x N correlation matrix is alive at a time.
+The window engine recomputes every window from raw returns, several windows only share the rows sent to each task.
+engine="tiles" splits every day's matrix instead: the upper triangle is cut into tile_size x tile_size tiles, each tile
+is a task that gets only its tickers' returns and sends back partial reductions which are merged into the day's summary
+(see src/tiled_summary.py). A worker never holds more than a tile, so one day of a huge universe is spread over the
+scheduler's workers ("processes", "distributed" or a dask scheduler address for several machines). The tiles of
+batch_size dates are in flight together, the batch is then written.
+first_date limits the run to dates on or after it (used by incremental runs, earlier rows only feed the windows).
+resume=True skips dates the store's journal already records as complete (see completed_dates in src/summary_store.py),
+so an interrupted run only recomputes the dates that are missing or whose part files are unreadable (for any window).
+neighbours > 0 also stores every ticker's `neighbours` most and least correlated peers per date and window in the
+neighbour index inside output_directory (see src/neighbour_index.py). The peers are taken from the same blocks of rows
+as the summary, which then walks whole rows instead of the upper triangle only.
+groups (a ticker -> group Series, see read_group_mapping) also stores the G x G average correlations between and
+within the groups for every date and window (see src/group_correlation.py), computed from the window's returns.
+approximate > 0 (window engine only, no neighbour index) estimates the summary statistics from that many sampled pairs
+per date and finds the top pairs through an LSH candidate filter instead of correlating every pair (see
+src/approximate_summary.py), for universes where the exact O(N^2 * W) summary is too slow. The confidence intervals of
+the estimates are stored in the confidence_intervals table.
+archive ("int8" or "int16", window and sliding engines) also stores every day's whole upper triangle quantized with a
+fixed scale in the correlation archive inside output_directory (see src/correlation_archive.py), 12.5MB (int8) or 25MB
+(int16) per date and window at 5000 tickers. The triangles of a batch are held until it is written, so batch_size
+bounds the memory they take.
+changes > 0 also stores, for every date and window, the `changes` pairs whose correlation moved most since the previous
+date's window and the distribution of all the moves (mean change, mean absolute change, |change| histogram) in the
+correlation_changes and top_changes tables (see src/correlation_change.py). Each block of the matrix is computed for
+both windows and their difference reduced on the spot, so two N x N matrices are never held. The first date with a full
+window has no previous window and gets no changes.
 """
 
+#Appends a batch of summaries to the store. Peers, archived matrices, changes, group averages and confidence intervals
+#(if any) go first so a journalled date has them
+def _append_batch(summaries: list, output_directory: str, tickers, group_names: list = None):
+    with span("store_write", "store", summaries=len(summaries)):
+        append_neighbours(summaries, output_directory, tickers)
+        append_archive(summaries, output_directory, tickers)
+        append_changes(summaries, output_directory)
+        append_intervals(summaries, output_directory)
+        if group_names is not None:
+            append_group_correlations(summaries, output_directory, group_names)
+        append_summaries(summaries, output_directory)
+
+#Report entry of the sliding and tiles engines for a store append, completed_dates counts every date written so far
+def _batch_record(report: list, summaries: list, completed_dates: int, started: float) -> dict:
+    return {
+        "batch": len(report) + 1,
+        "dates": len({summary["Date"] for summary in summaries}),
+        "dates_per_sec": completed_dates / max(time.perf_counter() - started, 1e-9)
+    }
+
 def orchestrate_daily_correlation_summary_stats(
     return_matrix: pd.DataFrame,
-    window: int = 20,
+    window=20, #days per rolling window, or a list of window lengths computed in one pass
     output_directory: str = "daily_correlations_summary_stats",
-    batch_size: int = 50  #Increasing this will increase memory usage and decrease run time
+    batch_size: int = 50,  #dates per append to the summary store
+    engine: str = "window",
+    reanchor_every: int = 50, #sliding engine only, days between rebuilding the running sums from raw returns
+    first_date=None,
+    dates_per_task: int = 5, #window engine only, consecutive dates per task (they share one block of rows)
+    scheduler: str = "threads", #window and tiles engines, "threads", "processes", "distributed" or a dask scheduler address
+    max_workers: int = None, #window and tiles engines, upper bound on tasks in flight (defaults to the number of CPUs)
+    memory_limit: int = None, #window and tiles engines, bytes the tasks in flight may use (defaults to half the available RAM)
+    progress=None, #window and tiles engines, callable(stats) after every task, see run_adaptive
+    resume: bool = False, #skip dates already completed in output_directory
+    neighbours: int = 0, #peers per ticker and side kept in the neighbour index, 0 skips the index
+    groups: pd.Series = None, #ticker -> group mapping for the group averages, None skips them
+    approximate: int = 0, #window engine only, pairs sampled per date for approximate summaries, 0 computes them exactly
+    tile_size: int = TILE_SIZE, #tiles engine only, tickers per side of a tile
+    archive: str = None, #window and sliding engines, "int8" or "int16" archives every day's quantized matrix, None skips it
+    changes: int = 0 #pairs kept per date with the largest day-over-day correlation change, 0 skips the change tables
 ):
+    if archive is not None and archive not in ARCHIVE_DTYPES:
+        raise ValueError(f"Unknown archive type '{archive}', expected one of {ARCHIVE_DTYPES}")
+    if archive and (approximate or engine == "tiles"):
+        raise ValueError("The correlation archive needs every day's whole matrix, use the window or sliding engine")
+    if approximate and engine != "window":
+        raise ValueError("Approximate summaries need the window engine, the sliding engine keeps every pair's sums")
+    if approximate and neighbours:
+        raise ValueError("The neighbour index needs exact correlations, it cannot be combined with approximate summaries")
+    if approximate and changes:
+        raise ValueError("Day-over-day changes need exact correlations, they cannot be combined with approximate summaries")
+    if neighbours and engine == "tiles":
+        raise ValueError("The neighbour index needs whole rows of the matrix, it cannot be combined with the tiles engine")
     if not os.path.exists(output_directory):
         os.makedirs(output_directory) #create output directory (where one doesn't exist)
     
-    dates_to_process = return_matrix.index[window:] #getting list of dates
+    windows = window_lengths(window)
+    dates_to_process = return_matrix.index[windows[0]:] #getting list of dates
+    if first_date is not None:
+        dates_to_process = dates_to_process[dates_to_process >= pd.Timestamp(first_date)]
+    if resume:
+        #a date is left to compute when any window that has a full history on that date is missing it
+        positions = return_matrix.index.get_indexer(dates_to_process)
+        missing = np.zeros(len(dates_to_process), dtype=bool)
+        for length in windows:
+            done = completed_dates(output_directory, length)
+            missing |= (positions >= length) & ~dates_to_process.normalize().isin(done)
+        print(f"Resuming: {len(dates_to_process) - missing.sum()} dates already complete, {missing.sum()} left to compute")
+        dates_to_process = dates_to_process[missing]
+    if len(dates_to_process) == 0:
+        return []
+    codes, group_names = (None, None) if groups is None else group_codes(return_matrix.columns, groups)
+
+    if engine == "sliding":
+        tickers = np.asarray(return_matrix.columns.astype(str), dtype=str)
+        values = return_matrix.to_numpy(dtype=np.float32) if changes else None #rows of the previous windows
+        total = len(dates_to_process)
+        summaries, report = [], []
+        started = time.perf_counter()
+        for i, (current_date, states) in enumerate(
+            rolling_correlation_states(
+                return_matrix, windows, reanchor_every=reanchor_every, first_date=first_date,
+                dates=dates_to_process if resume else None
+            )
+        ):
+            for length, state in states.items():
+                with span("date", date=current_date.strftime('%Y-%m-%d'), window=length):
+                    with span("normalise", "sliding"):
+                        corr_matrix = state.correlation()
+                    previous = None
+                    position = return_matrix.index.get_loc(current_date)
+                    if changes and position > length:
+                        with span("correlation_window", "correlation"):
+                            previous = CorrelationWindow(values[position - length - 1:position - 1])
+                    summary = summarize_correlation_matrix(
+                        corr_matrix, tickers, current_date, neighbours, archive, previous, changes
+                    )
+                    if codes is not None:
+                        with span("group_correlation"):
+                            rows = return_matrix.iloc[position - length:position].to_numpy()
+                            summary["groups"] = group_correlation(rows, codes, len(group_names))
+                summaries.append({**summary, "window": length})
+            if (i + 1) % batch_size == 0 or i + 1 == total:
+                _append_batch(summaries, output_directory, tickers, group_names)
+                report.append(_batch_record(report, summaries, i + 1, started))
+                summaries = []
+                print(f"Completed {i + 1}/{total} dates")
+        return report
+    elif engine == "tiles":
+        values = return_matrix.to_numpy(dtype=np.float32)
+        tickers = np.asarray(return_matrix.columns.astype(str), dtype=str)
+        positions = return_matrix.index.get_indexer(dates_to_process)
+        report = []
+        started = time.perf_counter()
+        with worker_pool(scheduler, max_workers) as pool:
+            for start in range(0, len(dates_to_process), batch_size):
+                batch_dates = slice(start, start + batch_size)
+                batch = [
+                    (current_date, length, values[position - length:position],
+                     values[position - length - 1:position - 1] if changes and position > length else None)
+                    for current_date, position in zip(dates_to_process[batch_dates], positions[batch_dates])
+                    for length in windows if position >= length
+                ]
+                summaries = tiled_summaries(
+                    [(current_date, rows) for current_date, _, rows, _ in batch], tickers, tile_size,
+                    max_workers=max_workers, memory_limit=memory_limit, progress=progress, pool=pool,
+                    previous=[previous for _, _, _, previous in batch], changes=changes
+                )
+                for summary, (_, length, rows, _) in zip(summaries, batch):
+                    summary["window"] = length
+                    if codes is not None:
+                        with span("group_correlation"):
+                            summary["groups"] = group_correlation(rows, codes, len(group_names))
+                _append_batch(summaries, output_directory, tickers, group_names)
+                completed = min(start + batch_size, len(dates_to_process))
+                report.append(_batch_record(report, summaries, completed, started))
+                print(f"Completed {completed}/{len(dates_to_process)} dates")
+        return report
+    elif engine != "window":
+        raise ValueError(f"Unknown engine '{engine}', expected 'window', 'sliding' or 'tiles'")
     
-    # Process batches
-    for i in range(0, len(dates_to_process), batch_size):
-        batch_dates = dates_to_process[i:i + batch_size]
-        tasks = []
-        
-        for current_date in batch_dates:
-            #setting window for rolling corrleation calc
-            window_start_date_idx = return_matrix.index.get_loc(current_date) - window
-            window_slice = return_matrix.iloc[window_start_date_idx : return_matrix.index.get_loc(current_date)]
-            #Adding Dask delayed task
-            task = compute_and_save_summary_stats(window_slice, current_date, output_directory)
-            tasks.append(task)
-        
-        print(f"Processing batch {i//batch_size + 1}/{(len(dates_to_process) + batch_size - 1)//batch_size}...")
-        dask.compute(*tasks) #execute the delayed tasks
-        print(f"Completed batch {i//batch_size + 1}")
\ No newline at end of file
+    #Window engine: one task per run of consecutive dates, described by integer row offsets into the return matrix.
+    #A cached (memory-mapped) return matrix is passed as its path only
+    values = return_matrix.to_numpy(dtype=np.float32)
+    tickers = np.asarray(return_matrix.columns.astype(str), dtype=str)
+    source = cache_entry_of(return_matrix)
+    positions = return_matrix.index.get_indexer(dates_to_process) #row of each date, looked up once
+
+    #a run ends after dates_per_task dates or at a gap (dates skipped by resume), so its windows stay one block of rows
+    run_starts = [
+        i for i in range(len(positions))
+        if i == 0 or positions[i] != positions[i - 1] + 1 or i % dates_per_task == 0
+    ]
+    tasks = []
+    task_bytes = []
+    for start, stop in zip(run_starts, run_starts[1:] + [len(positions)]):
+        run = slice(start, stop)
+        #one more row before the longest window for the first date's previous window
+        row_start, row_stop = max(0, positions[run.start] - windows[-1] - bool(changes)), positions[run.stop - 1]
+        block = source if source is not None else values[row_start:row_stop]
+        tasks.append((
+            (block, row_start, row_stop, dates_to_process[run], tickers, windows, neighbours, codes,
+             0 if group_names is None else len(group_names), approximate, archive, changes),
+            run.stop - run.start
+        ))
+        task_bytes.append(tickers.nbytes + (len(source) if source is not None else block.nbytes))
+
+    report = []
+    pending = {"summaries": [], "tasks": 0, "bytes_sent": 0}
+    bytes_per_window_day = values.shape[1] * values.itemsize
+
+    def flush(stats):
+        summaries = pending["summaries"]
+        _append_batch(summaries, output_directory, tickers, group_names)
+        report.append({
+            "batch": len(report) + 1,
+            "dates": len({summary["Date"] for summary in summaries}),
+            "tasks": pending["tasks"],
+            "bytes_sent": int(pending["bytes_sent"]),
+            "bytes_as_window_frames": int(sum(summary["window"] for summary in summaries) * bytes_per_window_day),
+            "dates_per_sec": stats["dates_per_sec"],
+            "in_flight": stats["in_flight"],
+            "rss_mb": stats["rss_mb"]
+        })
+        pending.update(summaries=[], tasks=0, bytes_sent=0)
+
+    #results arrive in completion order, the store does not need dates in order
+    def on_result(index, block_summaries, stats):
+        pending["summaries"].extend(block_summaries)
+        pending["tasks"] += 1
+        pending["bytes_sent"] += task_bytes[index]
+        if len(pending["summaries"]) >= batch_size * len(windows):
+            flush(stats)
+
+    stats = run_adaptive(
+        compute_block_summary_stats,
+        tasks,
+        on_result,
+        scheduler=scheduler,
+        max_workers=max_workers,
+        memory_limit=memory_limit,
+        progress=progress
+    )
+    if pending["summaries"]:
+        flush(stats)
+    return report
@@ -0,0 +1,193 @@
+import os
+import numpy as np
+import pandas as pd
+
+from src.summary_store import LEGACY_WINDOW
+from src.part_store import next_write_stamp, part_dir, write_part, list_parts, remove_partial_parts
+
+"""
+The purpose of this file is an optional archive of every day's full correlation matrix, so any pair's history or any
+day's whole distribution can be read back later instead of only the 45 pairs the summaries keep. In float32 the upper
+triangle is 50MB per day at 5000 tickers (~60GB for 5 years, ~100GB as full matrices), quantized it is 12.5MB (int8)
+or 25MB (int16) per day.
+
+Quantization uses a fixed scale, the same for every day and pair: q = round(r * M) with M = 127 (int8) or 32767
+(int16), and r = q / M when read back. The smallest value of the type (-128 / -32768) marks a NaN correlation.
+Worst case error against the float32 correlation is half a step, 0.5 / M: 3.9e-3 for int8 and 1.5e-5 for int16, on
+top of the kernels' own ~1e-6 difference from DataFrame.corr(). Correlations of +-1 are stored exactly.
+
+Pairs are numbered in row-major order of the strict upper triangle (pair_index), the order reduce_correlation_blocks
+walks its blocks of rows in, so each day is filled in as the summary is reduced and no N x N matrix is kept for it.
+
+The archive is a directory inside the summary store, one part per append and window (src/part_store.py):
+correlation_archive/window=<W>/<write stamp>-<first date>_<last date>/
+    dates.npy          datetime64[ns] (days,)
+    tickers.npy        ticker names (N,), the pair numbering is over these
+    correlations.npy   int8 or int16 (blocks x days x B), pair p is [p // B, day, p % B]
+The pairs are cut into blocks of B = BLOCK_BYTES / itemsize (32768 int8 or 16384 int16 pairs, the last block padded
+with the NaN marker) and each block keeps all of the part's days together, 32KB per day. Parts are chunks of
+consecutive days (batch_size dates per store append). They are read with plain file reads at offsets, not through a
+memory map, whose read-ahead around every page fault would pull in the neighbouring blocks:
+- a day's distribution is one 32KB read per block (382 at 5000 tickers), no more bytes than the day holds
+- a pair's history is one sequential read of its block's days x 32KB per part, instead of one random page per stored
+  day with a days x pairs layout
+With 5000 tickers and 40-day int8 parts, from a cold page cache a day takes ~90ms (50-100ms as one row of a days x
+pairs layout) and a pair's history ~15ms per part (~290ms).
+A date written more than once keeps the part with the highest write stamp.
+"""
+
+ARCHIVE_DIR = "correlation_archive"
+ARCHIVE_DTYPES = ("int8", "int16")
+BLOCK_BYTES = 32768 #one day of a pair block
+
+#Position of the pair (first, second) in the row-major strict upper triangle of an n x n matrix (order of the tickers
+#does not matter, vectorised over arrays of pairs)
+def pair_index(first, second, n_columns: int):
+    first, second = np.asarray(first, dtype=np.int64), np.asarray(second, dtype=np.int64)
+    if np.any(first == second):
+        raise ValueError("A ticker has no pair with itself")
+    row, column = np.minimum(first, second), np.maximum(first, second)
+    return row * (2 * n_columns - row - 1) // 2 + column - row - 1
+
+#Number of pairs of n tickers
+def pair_count(n_columns: int) -> int:
+    return n_columns * (n_columns - 1) // 2
+
+#Pairs per block of a part for a quantized type, BLOCK_BYTES of them per day
+def block_pairs(dtype: str) -> int:
+    return BLOCK_BYTES // np.dtype(dtype).itemsize
+
+#Fixed scale quantization of correlations in [-1, 1] (NaN -> the type's smallest value)
+def quantize_correlations(values: np.ndarray, dtype: str = "int8") -> np.ndarray:
+    info = np.iinfo(dtype)
+    scaled = np.rint(np.asarray(values, dtype=np.float32) * np.float32(info.max))
+    scaled[np.isnan(scaled)] = info.min
+    return scaled.astype(dtype)
+
+#Inverse of quantize_correlations, float32 with NaN for the missing marker
+def dequantize_correlations(values: np.ndarray) -> np.ndarray:
+    info = np.iinfo(values.dtype)
+    correlations = values.astype(np.float32) / np.float32(info.max)
+    correlations[values == info.min] = np.nan
+    return correlations
+
+"""
+Writes the quantized triangles carried by a batch of summaries (the "archive" entry added by reduce_correlation_blocks)
+as one new part per window. Days are copied into the memory-mapped file one at a time (one run per block), so writing
+does not need a second copy of the batch. Summaries without a triangle are skipped. Returns the part directories
+written.
+"""
+
+def append_archive(summaries: list, store_dir: str, tickers) -> list:
+    by_window = {}
+    for summary in summaries:
+        if summary.get("archive") is not None:
+            by_window.setdefault(int(summary.get("window", LEGACY_WINDOW)), []).append(summary)
+
+    part_dirs = []
+    write_stamp = next_write_stamp(store_dir, ARCHIVE_DIR)
+    for window, window_summaries in sorted(by_window.items()):
+        dates = pd.to_datetime([summary["Date"] for summary in window_summaries]).to_numpy(dtype="datetime64[ns]")
+        part_path = part_dir(store_dir, ARCHIVE_DIR, window, write_stamp, dates)
+        with write_part(part_path) as temp_dir:
+            np.save(os.path.join(temp_dir, "dates.npy"), dates)
+            np.save(os.path.join(temp_dir, "tickers.npy"), np.asarray(pd.Index(tickers).astype(str), dtype=str))
+            first = window_summaries[0]["archive"]
+            pairs_per_block = block_pairs(first.dtype)
+            blocks = -(-len(first) // pairs_per_block)
+            correlations = np.lib.format.open_memmap(
+                os.path.join(temp_dir, "correlations.npy"), mode="w+", dtype=first.dtype,
+                shape=(blocks, len(dates), pairs_per_block)
+            )
+            day = np.full(blocks * pairs_per_block, np.iinfo(first.dtype).min, dtype=first.dtype)
+            for row, summary in enumerate(window_summaries):
+                day[:len(first)] = summary["archive"]
+                correlations[:, row, :] = day.reshape(blocks, pairs_per_block)
+            correlations.flush()
+            del correlations
+        part_dirs.append(part_path)
+    return part_dirs
+
+#Part directories of one window in write order (".tmp" leftovers of killed runs are skipped)
+def archive_parts(store_dir: str, window: int = LEGACY_WINDOW) -> list:
+    return list_parts(store_dir, ARCHIVE_DIR, window)
+
+#Removes leftover temporary part directories of killed runs
+def remove_partial_archive(store_dir: str) -> list:
+    return remove_partial_parts(store_dir, ARCHIVE_DIR)
+
+#Reads runs of run_values values starting at each of the value offsets `starts` of a part's correlations.npy into one
+#array, returns it with the array's (blocks, days, B) shape
+def _read_runs(path: str, starts: list, run_values: int) -> tuple:
+    layout = np.load(path, mmap_mode="r") #header only: shape, dtype and where the values start
+    values = np.empty(len(starts) * run_values, dtype=layout.dtype)
+    run_bytes = run_values * layout.dtype.itemsize
+    buffer = memoryview(values.view(np.uint8))
+    with open(path, "rb", buffering=0) as f:
+        for i, start in enumerate(starts):
+            f.seek(layout.offset + start * layout.dtype.itemsize)
+            f.readinto(buffer[i * run_bytes:(i + 1) * run_bytes])
+    return values, layout.shape
+
+#Latest part and row holding every archived date of one window: {date: (part_dir, row)}
+def _latest_rows(store_dir: str, window: int) -> dict:
+    latest = {}
+    for part_dir in archive_parts(store_dir, window):
+        for row, date in enumerate(np.load(os.path.join(part_dir, "dates.npy"))):
+            latest[date] = (part_dir, row)
+    return latest
+
+#Dates in the archive for one window
+def archive_dates(store_dir: str, window: int = LEGACY_WINDOW) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(sorted(_latest_rows(store_dir, window)))
+
+"""
+Correlation history of one pair for every archived date in [start_date, end_date] (inclusive, None for open ends).
+Returns a DataFrame of Date and correlation (float32, dequantized), sorted by Date. Dates where either ticker is not in
+the part's universe are left out, a NaN correlation is kept as NaN.
+"""
+
+def load_pair_history(
+    store_dir: str,
+    ticker_1,
+    ticker_2,
+    start_date=None,
+    end_date=None,
+    window: int = LEGACY_WINDOW
+) -> pd.DataFrame:
+    start = None if start_date is None else np.datetime64(pd.Timestamp(start_date), "ns")
+    end = None if end_date is None else np.datetime64(pd.Timestamp(end_date), "ns")
+    by_part = {}
+    for date, (part_dir, row) in _latest_rows(store_dir, window).items():
+        if (start is None or date >= start) and (end is None or date <= end):
+            by_part.setdefault(part_dir, []).append((date, row))
+
+    dates, values = [], []
+    for part_dir, rows in by_part.items():
+        tickers = np.load(os.path.join(part_dir, "tickers.npy"))
+        first, second = np.flatnonzero(tickers == str(ticker_1)), np.flatnonzero(tickers == str(ticker_2))
+        if len(first) == 0 or len(second) == 0:
+            continue
+        pair = int(pair_index(first[0], second[0], len(tickers)))
+        path = os.path.join(part_dir, "correlations.npy")
+        _, days, pairs_per_block = np.load(path, mmap_mode="r").shape
+        block, offset = divmod(pair, pairs_per_block)
+        history, _ = _read_runs(path, [block * days * pairs_per_block], days * pairs_per_block) #the block's days
+        dates += [date for date, _ in rows]
+        values.append(history.reshape(days, pairs_per_block)[[row for _, row in rows], offset])
+
+    history = pd.DataFrame({
+        "Date": pd.to_datetime(np.asarray(dates, dtype="datetime64[ns]")),
+        "correlation": dequantize_correlations(np.concatenate(values)) if values else np.empty(0, dtype=np.float32)
+    })
+    return history.sort_values("Date").reset_index(drop=True)
+
+#Every correlation of one archived day as (float32 vector over pair_index order, tickers), KeyError when not archived
+def load_day_correlations(store_dir: str, date, window: int = LEGACY_WINDOW) -> tuple:
+    part_dir, row = _latest_rows(store_dir, window)[np.datetime64(pd.Timestamp(date), "ns")]
+    path = os.path.join(part_dir, "correlations.npy")
+    blocks, days, pairs_per_block = np.load(path, mmap_mode="r").shape
+    tickers = np.load(os.path.join(part_dir, "tickers.npy"))
+    starts = [(block * days + row) * pairs_per_block for block in range(blocks)] #the day's run in every block
+    day, _ = _read_runs(path, starts, pairs_per_block)
+    return dequantize_correlations(day[:pair_count(len(tickers))]), tickers
@@ -0,0 +1,182 @@
+import os
+import numpy as np
+import pandas as pd
+
+from src.summary_store import (
+    _append_table,
+    _load_table,
+    _next_write_stamp,
+    CHANGE_TABLE,
+    TOP_CHANGE_TABLE,
+    LEGACY_WINDOW
+)
+
+"""
+The purpose of this file is to detect regime shifts as large day-over-day moves in single pair correlations. For each
+date the change of every pair is delta = corr(today's window) - corr(the previous date's window), two windows that
+share all but one row. Pairs that are NaN in either window are left out.
+
+Neither matrix is kept: the walk over blocks of rows in reduce_correlation_blocks computes the same block of the
+previous window next to the current one (CorrelationWindow.tile, or a sliced in-memory matrix) and folds their
+difference into a ChangeReducer:
+- count and the float64 sums of delta and |delta| for the mean change and the mean absolute change
+- the largest |delta|
+- a histogram of |delta| over the fixed CHANGE_EDGES, the same bins every day so days can be compared
+- the k pairs with the largest |delta|, each tile first narrowed to its own k best with argpartition
+Peak memory is two blocks of rows instead of two N x N matrices. The window engine reuses each date's prepared window
+(its z-scores) as the next date's previous window, so a task of consecutive dates prepares one extra window.
+Reducers over disjoint tiles merge, so the tiles engine computes changes the same way.
+
+The summary gets a "changes" entry, stored in two tables of the summary store: correlation_changes (one row per date
+and window: pairs, mean_change, mean_abs_change, max_abs_change and one count per |delta| bin) and top_changes (the
+largest moves with both correlations).
+"""
+
+CHANGE_PAIRS = 20
+CHANGE_EDGES = np.array([0, 0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 2]) #|delta| bins, delta is within [-2, 2]
+CHANGE_HISTOGRAM_COLUMNS = [f"abs_change_{low:g}_{high:g}" for low, high in zip(CHANGE_EDGES[:-1], CHANGE_EDGES[1:])]
+CHANGE_COLUMNS = ["Date", "window", "pairs", "mean_change", "mean_abs_change", "max_abs_change"] + CHANGE_HISTOGRAM_COLUMNS
+TOP_CHANGE_COLUMNS = ["Date", "window", "rank", "ticker_1", "ticker_2", "correlation", "previous_correlation", "change"]
+
+
+class ChangeReducer:
+
+    def __init__(self, top_pairs: int = CHANGE_PAIRS):
+        self.top_pairs = top_pairs
+        self.count = 0
+        self.sum_change = 0.0
+        self.sum_abs_change = 0.0
+        self.max_abs_change = 0.0
+        self.histogram = np.zeros(len(CHANGE_EDGES) - 1, dtype=np.int64)
+        #the best pairs so far: rows, cols, current and previous correlations
+        self.best = (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32), np.empty(0, np.float32))
+
+    #Keeps the top_pairs largest |delta| of the kept pairs and the new candidates
+    def _keep_best(self, rows, cols, current, previous):
+        rows, cols, current, previous = [
+            np.concatenate([mine, new]) for mine, new in zip(self.best, (rows, cols, current, previous))
+        ]
+        if len(rows) > self.top_pairs:
+            best = np.argpartition(-np.abs(current - previous), self.top_pairs - 1)[:self.top_pairs]
+            rows, cols, current, previous = rows[best], cols[best], current[best], previous[best]
+        self.best = (rows, cols, current, previous)
+
+    #Folds the upper triangle of a tile of the current window and the same tile of the previous window into the state
+    def update(self, tile: np.ndarray, previous_tile: np.ndarray, row_start: int, col_start: int = 0):
+        delta = tile - previous_tile #NaN when either correlation is
+        tile_rows = np.arange(row_start, row_start + tile.shape[0])
+        keep = np.arange(col_start, col_start + tile.shape[1])[None, :] > tile_rows[:, None]
+        keep &= ~np.isnan(delta)
+        change = delta[keep]
+        if len(change) == 0:
+            return
+        abs_change = np.abs(change)
+        self.count += len(change)
+        self.sum_change += float(change.sum(dtype=np.float64))
+        self.sum_abs_change += float(abs_change.sum(dtype=np.float64))
+        self.max_abs_change = max(self.max_abs_change, float(abs_change.max()))
+        #bin counts from the number of values at or above each inner edge, one comparison per edge
+        at_least = [len(change)] + [int(np.count_nonzero(abs_change >= edge)) for edge in CHANGE_EDGES[1:-1]] + [0]
+        self.histogram -= np.diff(at_least)
+
+        #only values beating the current k-th largest move can enter, the tile's own k best of those are kept
+        if len(self.best[0]) == self.top_pairs:
+            candidates = np.flatnonzero(abs_change > np.abs(self.best[2] - self.best[3]).min())
+        else:
+            candidates = np.arange(len(change))
+        if len(candidates) > self.top_pairs:
+            candidates = candidates[np.argpartition(-abs_change[candidates], self.top_pairs - 1)[:self.top_pairs]]
+        if len(candidates) == 0:
+            return
+        row_ends = np.cumsum(np.count_nonzero(keep, axis=1))
+        rows = np.searchsorted(row_ends, candidates, side="right")
+        offsets = candidates - np.concatenate([[0], row_ends])[rows]
+        cols = np.array([np.flatnonzero(keep[row])[offset] for row, offset in zip(rows, offsets)], dtype=np.int64)
+        self._keep_best(rows + row_start, cols + col_start, tile[rows, cols], previous_tile[rows, cols])
+
+    #Combines the state of a reducer that saw a disjoint set of tiles
+    def merge(self, other: "ChangeReducer"):
+        self.count += other.count
+        self.sum_change += other.sum_change
+        self.sum_abs_change += other.sum_abs_change
+        self.max_abs_change = max(self.max_abs_change, other.max_abs_change)
+        self.histogram += other.histogram
+        self._keep_best(*other.best)
+
+    #The "changes" entry of a summary, largest move first and ticker names looked up for the winners only
+    def summary(self, tickers: np.ndarray) -> dict:
+        rows, cols, current, previous = self.best
+        order = np.lexsort((cols, rows, -np.abs(current - previous)))
+        count = max(self.count, 1)
+        return {
+            "pairs": self.count,
+            "mean_change": self.sum_change / count if self.count else float("nan"),
+            "mean_abs_change": self.sum_abs_change / count if self.count else float("nan"),
+            "max_abs_change": self.max_abs_change if self.count else float("nan"),
+            "histogram": self.histogram.copy(),
+            "top_changes": [
+                {
+                    "ticker_1": tickers[rows[i]],
+                    "ticker_2": tickers[cols[i]],
+                    "correlation": float(current[i]),
+                    "previous_correlation": float(previous[i]),
+                    "change": float(current[i] - previous[i])
+                }
+                for i in order
+            ]
+        }
+
+#The two change tables of a batch of summaries carrying a "changes" entry: (per date stats, top changes)
+def change_tables(summaries: list) -> tuple:
+    stats, top_changes = [], []
+    for summary in summaries:
+        changes = summary.get("changes")
+        if changes is None:
+            continue
+        key = {"Date": summary["Date"], "window": summary.get("window", LEGACY_WINDOW)}
+        stats.append({
+            **key,
+            "pairs": changes["pairs"],
+            "mean_change": changes["mean_change"],
+            "mean_abs_change": changes["mean_abs_change"],
+            "max_abs_change": changes["max_abs_change"],
+            **dict(zip(CHANGE_HISTOGRAM_COLUMNS, changes["histogram"].tolist()))
+        })
+        top_changes += [{**key, "rank": rank, **pair} for rank, pair in enumerate(changes["top_changes"], start=1)]
+
+    stats = pd.DataFrame(stats, columns=CHANGE_COLUMNS)
+    top_changes = pd.DataFrame(top_changes, columns=TOP_CHANGE_COLUMNS)
+    for table in (stats, top_changes):
+        table["Date"] = pd.to_datetime(table["Date"])
+        table["window"] = table["window"].astype("int16")
+    stats["pairs"] = stats["pairs"].astype("int64")
+    stats[CHANGE_HISTOGRAM_COLUMNS] = stats[CHANGE_HISTOGRAM_COLUMNS].astype("int64")
+    top_changes["rank"] = top_changes["rank"].astype("int16")
+    for column in ["correlation", "previous_correlation", "change"]:
+        top_changes[column] = top_changes[column].astype("float32")
+    return stats, top_changes
+
+#Appends the day-over-day changes carried by a batch of summaries to the store, returns the part files written
+def append_changes(summaries: list, store_dir: str) -> list:
+    stats, top_changes = change_tables(summaries)
+    if stats.empty:
+        return []
+    write_stamp = _next_write_stamp(store_dir)
+    filenames = _append_table(stats, os.path.join(store_dir, CHANGE_TABLE), write_stamp)
+    if not top_changes.empty:
+        filenames += _append_table(top_changes, os.path.join(store_dir, TOP_CHANGE_TABLE), write_stamp)
+    return filenames
+
+#Loads the change statistics for a date range (every date by default), one window or all, sorted by window and Date
+def load_change_stats(store_dir: str, start_date=None, end_date=None, window=None) -> pd.DataFrame:
+    table = _load_table(os.path.join(store_dir, CHANGE_TABLE), CHANGE_COLUMNS, start_date, end_date, window)
+    table = table.drop_duplicates(subset=["window", "Date"], keep="last")
+    return table.sort_values(["window", "Date"]).reset_index(drop=True)
+
+#Loads the largest changes of a date range (one date by default), one window or all, sorted by window, Date and rank
+def load_top_changes(store_dir: str, start_date, end_date=None, window=None) -> pd.DataFrame:
+    start_date = pd.Timestamp(start_date).normalize() #summaries are stored at day resolution
+    end_date = start_date if end_date is None else end_date
+    table = _load_table(os.path.join(store_dir, TOP_CHANGE_TABLE), TOP_CHANGE_COLUMNS, start_date, end_date, window)
+    table = table.drop_duplicates(subset=["window", "Date", "rank"], keep="last")
+    return table.sort_values(["window", "Date", "rank"]).reset_index(drop=True)
@@ -1,43 +1,168 @@
-import pandas as pd
+import io
+import os
 import zipfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
 
-""" 
+"""
 The purpose of this function is to load data from a .zip folder of multlipe .csv files and load the data into a Pandas DataFrame
 
-Each .csv file must contain the following columns: 
+Each .csv file must contain the following columns (any other columns are never parsed):
 
 - "Ticker": cast as a category for memory efficiency.
 - "Price": cast as float32 for memory efficiency.
 - "Date": cast as datatime.
 
-Arguments: The funciton takes one argument for the path for the data to be loaded
+Arguments:
+- zip_path: path for the data to be loaded
+- start_date / end_date (optional): only rows with start_date <= Date <= end_date are kept
+- tickers (optional): only rows for these tickers are kept
+- max_workers (optional): number of threads decoding .csv files, defaults to the number of CPUs
+- engine: "pyarrow" (default, pyarrow.csv, releases the GIL while parsing) or "c" (pandas' parser).
+  pyarrow only parses ISO dates, a file it cannot parse is read with pandas instead
+
+The filters are applied to each .csv as soon as it is parsed, so rows outside the date range or ticker list never reach
+the combined DataFrame. Files are decompressed and parsed on a thread pool, each worker thread opens its own handle on
+the .zip (zipfile handles are not safe to share), so reading and decompressing run in parallel as well as parsing. Each parsed file is reduced to plain arrays straight away, then the tickers from every file
+are collected into one shared, sorted category set and the combined DataFrame is built once with a categorical Ticker
+column (pd.concat of per-file categoricals would fall back to object or re-hash every file's categories).
 
 Return: Pandas DataFrame with rows of price sorted by Ticker and Date. NOTE: ALL ROWS CONTAINING MISSING PRICE DATA ARE DROPPED!
-    
+Rows with a missing or empty Ticker are dropped as well.
+
 """
 
-def data_load_zip(zip_path: str) -> pd.DataFrame:
-    data = [] # List to collect DataFrames from each CSV file
-    
-    
+COLUMNS = ["Ticker", "Date", "Price"]
+
+#Parses one .csv with pandas and applies the row filters
+def _read_csv_pandas(data: bytes, start_date, end_date, tickers) -> pd.DataFrame:
+    df = pd.read_csv(
+        io.BytesIO(data),
+        usecols=COLUMNS, #columns to load,
+        dtype={"Ticker": "category", "Price": "float32"}, #data casting
+        parse_dates=["Date"] #date parsing
+    )
+    keep = df["Price"].notna() #removes rows where price is NA
+    keep &= df["Ticker"].notna() #and rows without a ticker (empty cells are read as NA), they have no category code
+    if start_date is not None:
+        keep &= df["Date"] >= start_date
+    if end_date is not None:
+        keep &= df["Date"] <= end_date
+    if tickers is not None:
+        keep &= df["Ticker"].isin(tickers)
+    return df if keep.all() else df[keep]
+
+#Parses one .csv with pyarrow and applies the row filters before converting to pandas
+def _read_csv_pyarrow(data: bytes, start_date, end_date, tickers) -> pd.DataFrame:
+    try:
+        table = pa_csv.read_csv(
+            io.BytesIO(data),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=COLUMNS,
+                column_types={"Ticker": pa.string(), "Date": pa.timestamp("ns"), "Price": pa.float32()}
+            )
+        )
+    except pa.ArrowInvalid: #dates pyarrow cannot parse (not ISO), pandas infers the format instead
+        return _read_csv_pandas(data, start_date, end_date, tickers)
+    keep = pc.is_valid(table["Price"])
+    keep = pc.and_(keep, pc.and_(pc.is_valid(table["Ticker"]), pc.not_equal(table["Ticker"], ""))) #rows without a ticker
+    if start_date is not None:
+        keep = pc.and_(keep, pc.greater_equal(table["Date"], pa.scalar(start_date, pa.timestamp("ns"))))
+    if end_date is not None:
+        keep = pc.and_(keep, pc.less_equal(table["Date"], pa.scalar(end_date, pa.timestamp("ns"))))
+    if tickers is not None:
+        keep = pc.and_(keep, pc.is_in(table["Ticker"], value_set=pa.array(list(tickers), pa.string())))
+    df = table.filter(keep).to_pandas()
+    df["Ticker"] = df["Ticker"].astype("category")
+    return df
+
+#pool.map that keeps at most `in_flight` files submitted ahead of the consumer, so parsed files cannot pile up in memory
+def _bounded_map(pool: ThreadPoolExecutor, fn, items, in_flight: int):
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def data_load_zip(
+    zip_path: str,
+    start_date=None,
+    end_date=None,
+    tickers=None,
+    max_workers: int = None,
+    engine: str = "pyarrow"
+) -> pd.DataFrame:
+    if engine not in ("c", "pyarrow"):
+        raise ValueError(f"Unknown engine '{engine}', expected 'c' or 'pyarrow'")
+    read_csv = _read_csv_pyarrow if engine == "pyarrow" else _read_csv_pandas
+    start_date = pd.Timestamp(start_date) if start_date is not None else None
+    end_date = pd.Timestamp(end_date) if end_date is not None else None
+    tickers = sorted(set(map(str, tickers))) if tickers is not None else None
+
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        file_list = sorted(zip_ref.namelist()) #Open .zip
+        file_list = [name for name in sorted(zip_ref.namelist()) if name.endswith('.csv')] #skip anything not a .csv
+    local = threading.local()
+    handles, handles_lock = [], threading.Lock()
+
+    def load_member(file_name):
+        if not hasattr(local, "zip_ref"): #first file of this worker thread, opens its own handle
+            local.zip_ref = zipfile.ZipFile(zip_path, 'r')
+            with handles_lock:
+                handles.append(local.zip_ref)
+        return read_csv(local.zip_ref.read(file_name), start_date, end_date, tickers)
+
+    max_workers = max_workers or os.cpu_count()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            #each parsed file is reduced to plain arrays as soon as it arrives so its DataFrame can be freed
+            file_tickers, codes, dates, prices = [], [], [], []
+            for df in _bounded_map(pool, load_member, file_list, 2 * max_workers):
+                if len(df) == 0:
+                    continue
+                file_tickers.append(df["Ticker"].cat.categories)
+                codes.append(df["Ticker"].cat.codes.to_numpy())
+                dates.append(df["Date"].to_numpy(dtype="datetime64[ns]"))
+                prices.append(df["Price"].to_numpy())
+    finally:
+        for handle in handles:
+            handle.close()
 
-        for file_name in file_list:
-            if not file_name.endswith('.csv'): 
-                continue #skip anything not a .csv
+    if not codes:
+        return pd.DataFrame({
+            "Ticker": pd.Categorical([]), "Date": pd.to_datetime([]), "Price": pd.Series([], dtype="float32")
+        })
 
-            with zip_ref.open(file_name) as f:
-                df = pd.read_csv(
-                    f,
-                    usecols=["Ticker", "Date", "Price"], #columns to load, 
-                    dtype={"Ticker": "category", "Price": "float32"}, #data casting
-                    parse_dates=["Date"] #date parsing
-                )
-                data.append(df) #add the DataFrame for the .csv file to the list
+    #one shared, sorted category set: each file's local codes are mapped onto it and the Categorical is built once
+    categories = pd.Index(sorted(set().union(*file_tickers)))
+    codes = np.concatenate([
+        categories.get_indexer(local).astype(np.int32)[local_codes] for local, local_codes in zip(file_tickers, codes)
+    ])
+    dates = np.concatenate(dates)
+    prices = np.concatenate(prices)
 
+    #drops tickers whose rows were all filtered out (remove_unused_categories would sort every code to find them)
+    used = np.bincount(codes, minlength=len(categories)) > 0
+    if not used.all():
+        codes = (np.cumsum(used, dtype=np.int32) - 1)[codes]
+        categories = categories[used]
 
-    full_df = pd.concat(data, ignore_index=True) #combine DataFrames in list into one DataFrame
-    full_df = full_df.dropna(subset=["Price"]) #removes rows where price is NA
+    #files are read in name order, so the rows are usually sorted already and the sort can be skipped
+    in_order = (codes[1:] > codes[:-1]) | ((codes[1:] == codes[:-1]) & (dates[1:] >= dates[:-1]))
+    if not in_order.all():
+        order = np.lexsort((dates, codes))
+        codes, dates, prices = codes[order], dates[order], prices[order]
 
-    return full_df.sort_values(["Ticker", "Date"])
\ No newline at end of file
+    return pd.DataFrame({
+        "Ticker": pd.Categorical.from_codes(codes, categories=categories),
+        "Date": dates,
+        "Price": prices
+    }, copy=False)
@@ -0,0 +1,463 @@
+import warnings
+import numpy as np
+import pandas as pd
+
+from src.instrumentation import span
+
+"""
+The purpose of this file is to produce the daily rolling correlation matrices without recomputing every window from scratch.
+DataFrame.corr() costs O(N^2 * W) per day. Neighbouring windows share W-1 rows, so instead running sums are kept and
+each day only adds the newest row and removes the expired one (a rank-2 update) before normalising into correlations.
+
+Missing data follows pandas' pairwise-complete semantics: for every pair (i, j) only the rows where both tickers have a
+return are used. To do that with running sums four N x N matrices are kept, where X0 is the window with NaN set to 0
+and M is the 0/1 observed mask:
+- count  = M^T M        number of rows where both i and j are observed
+- sum_x  = X0^T M       sum of x_i over the rows where j is also observed
+- sum_xx = (X0^2)^T M   sum of x_i^2 over the rows where j is also observed
+- sum_xy = X0^T X0      sum of x_i * x_j
+
+The state is float32 by default (same as the return matrix). Adding and removing rows lets rounding error build up, so
+the state is rebuilt from the raw window ("re-anchored") every reanchor_every days. Each column is also shifted by its
+window mean at re-anchor time which keeps the variance subtraction well conditioned (correlation is shift invariant).
+
+Accuracy: with float32 state and reanchor_every=50 the correlations match DataFrame.corr() to within 1e-4 absolute
+on daily return data. With dtype=np.float64 they match to within 1e-9.
+That holds for pairs sharing enough rows. The variance of 2-4 shared rows is tiny next to the rounding error the running
+sums pick up from every row that went through them (up to 0.05 off, or NaN on the wrong side of the constant column
+test, in a 5 day window), so
+- windows of at most LOW_OVERLAP_ROWS rows are computed from their raw rows with the batched kernel in float64
+  (CorrelationWindow), the running sums save little there anyway
+- in longer windows the pairs sharing at most LOW_OVERLAP_ROWS rows are recomputed in float64 from the window's raw
+  rows (pair_correlations), O(W) each. There are few of them (tickers listed a few days into the window)
+"""
+
+LOW_OVERLAP_ROWS = 8 #pairs sharing at most this many rows of a window are recomputed from the raw rows
+
+#Computes the four pairwise moment matrices for a block of rows in one GEMM each. rows: (W x N) array with NaN for missing
+def pairwise_moments(rows: np.ndarray, dtype=np.float32) -> tuple:
+    mask = ~np.isnan(rows)
+    m = mask.astype(dtype)
+    x = np.where(mask, rows, 0).astype(dtype)
+    count = m.T @ m
+    sum_x = x.T @ m
+    sum_xx = (x * x).T @ m
+    sum_xy = x.T @ x
+    return count, sum_x, sum_xx, sum_xy
+
+#Turns pairwise sums into pairwise-complete correlations between the columns of x and the columns of y (NaN where pandas
+#would give NaN). All arguments are (Nx x Ny) matrices, shift_x/shift_y are the per-column shifts applied before summing
+def _correlation_from_sums(count, sum_x, sum_y, sum_xx, sum_yy, sum_xy, shift_x=None, shift_y=None) -> np.ndarray:
+    eps = np.finfo(sum_xy.dtype).eps
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inverse_count = 1 / count #computed in place below to keep the number of N x N temporaries down
+        cov = sum_x * sum_y
+        cov *= inverse_count
+        np.subtract(sum_xy, cov, out=cov)
+
+        #variance of x over the rows shared with y (and of y over the rows shared with x)
+        var_x = sum_x * sum_x
+        var_x *= inverse_count
+        np.subtract(sum_xx, var_x, out=var_x)
+        var_y = sum_y * sum_y
+        var_y *= inverse_count
+        np.subtract(sum_yy, var_y, out=var_y)
+
+        #variances at the level of rounding noise come from constant columns, pandas returns NaN for those
+        for variance, sum_sq, shift, axis in [(var_x, sum_xx, shift_x, 1), (var_y, sum_yy, shift_y, 0)]:
+            tolerance = sum_sq * (16 * eps)
+            if shift is not None:
+                tolerance += count * np.expand_dims((16 * eps * np.abs(shift)) ** 2, axis)
+            np.copyto(variance, np.nan, where=variance <= tolerance)
+
+        var_x *= var_y
+        np.sqrt(var_x, out=var_x)
+        cov /= var_x
+    corr = cov
+
+    np.copyto(corr, np.nan, where=count < 2) #pandas needs at least 2 shared observations (min_periods=1 still gives NaN for 1)
+    np.clip(corr, -1, 1, out=corr)
+    return corr
+
+#Turns the symmetric pairwise moment matrices from pairwise_moments into a pairwise-complete correlation matrix
+def correlation_from_moments(count, sum_x, sum_xx, sum_xy, shift=None) -> np.ndarray:
+    return _correlation_from_sums(count, sum_x, sum_x.T, sum_xx, sum_xx.T, sum_xy, shift, shift)
+
+#Pairwise-complete correlations of the column pairs (first[k], second[k]) of a (W x N) window, straight from the rows in
+#float64 (centred on the shared rows' mean, so no cancellation). O(W) per pair
+def pair_correlations(rows: np.ndarray, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    x, y = rows[:, first].astype(np.float64), rows[:, second].astype(np.float64)
+    shared = ~np.isnan(x) & ~np.isnan(y)
+    count = shared.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_x, mean_y = np.where(shared, x, 0).sum(axis=0) / count, np.where(shared, y, 0).sum(axis=0) / count
+        x, y = np.where(shared, x - mean_x, 0), np.where(shared, y - mean_y, 0)
+        sum_xx, sum_yy = (x * x).sum(axis=0), (y * y).sum(axis=0)
+        corr = (x * y).sum(axis=0) / np.sqrt(sum_xx * sum_yy)
+    eps = np.finfo(np.float64).eps
+    constant = (sum_xx <= count * (16 * eps * mean_x) ** 2) | (sum_yy <= count * (16 * eps * mean_y) ** 2)
+    return np.where((count >= 2) & ~constant, np.clip(corr, -1, 1), np.nan)
+
+
+"""
+Correlation kernel for a single window, used in place of DataFrame.corr().
+Most tickers have a return on every day of a 20 day window, so the tickers are split in two:
+- Fully observed columns are z-scored and correlated with one float32 GEMM (z^T z)
+- Columns with at least one NaN are correlated against every column with masked pairwise-complete sums
+  (mask-matrix products), which is O(P * N * W) for P such columns instead of pandas' O(N^2 * W) pair loop
+The result keeps pandas' semantics: pairwise-complete observations, NaN for constant columns or < 2 shared rows.
+
+CorrelationWindow does the O(N * W) preparation once and then hands out any rectangular tile of the correlation matrix,
+so callers that reduce the matrix block by block never need to hold all N x N values at once.
+"""
+
+class CorrelationWindow:
+
+    def __init__(self, rows: np.ndarray, dtype=np.float32):
+        rows = np.asarray(rows, dtype=dtype)
+        self.n_rows, self.n_columns = rows.shape
+        eps = np.finfo(dtype).eps
+        observed = ~np.isnan(rows)
+        full = observed.all(axis=0)
+        self.partial = ~full
+
+        # Fully observed columns: z-scores for the GEMM. Partial columns are zeroed here and overwritten per tile,
+        # which is cheaper than scattering the GEMM result into a sub-block of the output
+        dense = np.where(full, rows, 0)
+        mean = dense.mean(axis=0)
+        centred = dense - mean
+        sum_sq = (centred * centred).sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.z = centred / np.sqrt(sum_sq)
+        self.z[:, self.partial] = 0
+        self.z[:, full & (sum_sq <= self.n_rows * (16 * eps * np.abs(mean)) ** 2)] = np.nan #constant columns
+
+        # NaN-containing columns: shifted, zero-filled values and masks for the masked pairwise-complete sums
+        if self.partial.any():
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning) #all-NaN columns give a NaN mean, replaced with 0 below
+                self.shift = np.nan_to_num(np.nanmean(rows, axis=0)).astype(dtype)
+            self.mask = observed.astype(dtype)
+            self.x = np.where(observed, rows - self.shift, 0).astype(dtype)
+
+    #Masked pairwise-complete correlations between two sets of columns (slices or index arrays)
+    def _masked(self, a, b) -> np.ndarray:
+        x_a, mask_a, x_b, mask_b = self.x[:, a], self.mask[:, a], self.x[:, b], self.mask[:, b]
+        return _correlation_from_sums(
+            mask_a.T @ mask_b,
+            x_a.T @ mask_b,
+            mask_a.T @ x_b,
+            (x_a * x_a).T @ mask_b,
+            mask_a.T @ (x_b * x_b),
+            x_a.T @ x_b,
+            self.shift[a],
+            self.shift[b]
+        )
+
+    #Returns corr[row_start:row_stop, col_start:col_stop] (columns default to all tickers)
+    def tile(self, row_start: int, row_stop: int, col_start: int = 0, col_stop: int = None) -> np.ndarray:
+        col_stop = self.n_columns if col_stop is None else col_stop
+        block = self.z[:, row_start:row_stop].T @ self.z[:, col_start:col_stop]
+        np.clip(block, -1, 1, out=block)
+        if self.n_rows < 2:
+            block[:] = np.nan
+            return block
+
+        # NaN-touching pairs in this tile are overwritten with the masked computation
+        partial_cols = np.flatnonzero(self.partial[col_start:col_stop])
+        if len(partial_cols):
+            block[:, partial_cols] = self._masked(slice(row_start, row_stop), partial_cols + col_start)
+        partial_rows = np.flatnonzero(self.partial[row_start:row_stop])
+        if len(partial_rows):
+            block[partial_rows, :] = self._masked(partial_rows + row_start, slice(col_start, col_stop))
+        return block
+
+#Full N x N correlation matrix for one (W x N) window of returns
+def batched_correlation(rows: np.ndarray) -> np.ndarray:
+    window = CorrelationWindow(rows)
+    return window.tile(0, window.n_columns)
+
+
+"""
+Running pairwise moments for a sliding window of rows. add/remove are rank-1 updates, slide is the rank-2 update
+used once per day. reset rebuilds the state from the raw window and picks a new per-column shift (or uses the one given).
+
+tile(row_start, row_stop, col_start, col_stop) normalises any rectangle of the moments into correlations. Columns
+observed on every row of the window need only their diagonal sums: for those pairs count is the window length and
+sum_x/sum_xx are per-column, so the tile is (sum_xy - s s^T / n) scaled by 1 / sd on both sides. Rows and columns of
+tickers with a missing day are overwritten with the general pairwise-complete formula, like CorrelationWindow.tile does
+for the batched kernel. When those would cover most of the tile (long windows, where most tickers miss a day) the
+general formula is applied to the whole tile instead.
+The state also keeps the window's raw rows (rows) for the pairs that share only a few of them (see LOW_OVERLAP_ROWS).
+remove_row removes the oldest row equal to the one given; if there is none the rows are dropped and those pairs keep
+the running sums' value.
+"""
+
+class SlidingCorrelationState:
+
+    def __init__(self, n_columns: int, dtype=np.float32):
+        self.n_columns = n_columns
+        self.dtype = np.dtype(dtype)
+        self.shift = np.zeros(n_columns, dtype=self.dtype)
+        self.count = self.sum_x = self.sum_xx = self.sum_xy = None
+        self.rows = None
+        self._raw = None #float64 CorrelationWindow of rows for short windows, built on the first tile after an update
+        self.n_rows = 0
+        self.updates_since_reset = 0
+
+    #Rebuilds the moments from scratch from a (W x N) window
+    def reset(self, rows: np.ndarray, shift: np.ndarray = None):
+        rows = np.asarray(rows, dtype=self.dtype)
+        if shift is None:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning) #all-NaN columns give a NaN mean, replaced with 0 below
+                shift = np.nanmean(rows, axis=0)
+        self.shift = np.nan_to_num(shift).astype(self.dtype)
+        self.count, self.sum_x, self.sum_xx, self.sum_xy = pairwise_moments(rows - self.shift, self.dtype)
+        self.rows = rows
+        self._raw = None
+        self.n_rows = len(rows)
+        self.updates_since_reset = 0
+
+    #Expands a set of rows into (x, mask) factors for the low rank update
+    def _factors(self, rows: np.ndarray):
+        rows = np.asarray(rows, dtype=self.dtype) - self.shift
+        mask = ~np.isnan(rows)
+        return np.where(mask, rows, 0).astype(self.dtype), mask.astype(self.dtype)
+
+    #Applies sum over k of sign_k * (row_k moments) using one (N x k) @ (k x N) product per matrix, x and m are the
+    #(k x N) factors from _factors
+    def _apply(self, x: np.ndarray, m: np.ndarray, signs):
+        signs = np.asarray(signs, dtype=self.dtype)[:, None]
+        self.count += m.T @ (signs * m)
+        self.sum_x += x.T @ (signs * m)
+        self.sum_xx += (x * x).T @ (signs * m)
+        self.sum_xy += x.T @ (signs * x)
+        self.n_rows += int(signs.sum())
+        self.updates_since_reset += 1
+        self._raw = None
+
+    def _update(self, rows: np.ndarray, signs):
+        self._apply(*self._factors(np.atleast_2d(rows)), signs)
+
+    def add_row(self, row: np.ndarray):
+        self._update(row, [1])
+        if self.rows is not None:
+            self.rows = np.vstack([self.rows, np.asarray(row, dtype=self.dtype)])
+
+    def remove_row(self, row: np.ndarray):
+        self._update(row, [-1])
+        if self.rows is not None:
+            row = np.asarray(row, dtype=self.dtype)
+            matches = np.flatnonzero(((self.rows == row) | (np.isnan(self.rows) & np.isnan(row))).all(axis=1))
+            self.rows = np.delete(self.rows, matches[0], axis=0) if len(matches) else None
+
+    #Adds the newest row and removes the expired one in a single rank-2 update
+    def slide(self, new_row: np.ndarray, old_row: np.ndarray):
+        self._update(np.vstack([new_row, old_row]), [1, -1])
+        if self.rows is not None:
+            self.rows = np.vstack([self.rows[1:], np.asarray(new_row, dtype=self.dtype)])
+
+    #Correlations corr[row_start:row_stop, col_start:col_stop] of the current window (columns default to all tickers)
+    def tile(self, row_start: int, row_stop: int, col_start: int = 0, col_stop: int = None) -> np.ndarray:
+        col_stop = self.n_columns if col_stop is None else col_stop
+        if self.n_rows < 2:
+            return np.full((row_stop - row_start, col_stop - col_start), np.nan, dtype=self.dtype)
+
+        if self.n_rows <= LOW_OVERLAP_ROWS and self.rows is not None: #every pair shares only a few rows
+            if self._raw is None:
+                self._raw = CorrelationWindow(self.rows, dtype=np.float64)
+            return self._raw.tile(row_start, row_stop, col_start, col_stop).astype(self.dtype, copy=False)
+
+        rows, cols = slice(row_start, row_stop), slice(col_start, col_stop)
+        diagonal = np.arange(self.n_columns)
+        full = self.count[diagonal, diagonal] == self.n_rows
+        partial_rows = np.flatnonzero(~full[rows]) + row_start
+        partial_cols = np.flatnonzero(~full[cols]) + col_start
+        masked_share = (len(partial_rows) * (col_stop - col_start) + (row_stop - row_start) * len(partial_cols)) \
+            / max((row_stop - row_start) * (col_stop - col_start), 1)
+        if masked_share > 0.5: #long windows: most tickers miss a day, the general formula on the whole tile is cheaper
+            return self._masked(rows, cols)
+
+        sums, squares = self.sum_x[diagonal, diagonal], self.sum_xx[diagonal, diagonal]
+        eps = np.finfo(self.dtype).eps
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variance = squares - sums * sums / self.n_rows
+            tolerance = 16 * eps * squares + self.n_rows * (16 * eps * np.abs(self.shift)) ** 2
+            inverse_sd = 1 / np.sqrt(np.where(variance > tolerance, variance, np.nan))
+
+        block = sums[row_start:row_stop, None] * (sums[None, col_start:col_stop] / self.n_rows)
+        np.subtract(self.sum_xy[row_start:row_stop, col_start:col_stop], block, out=block)
+        block *= inverse_sd[row_start:row_stop, None]
+        block *= inverse_sd[None, col_start:col_stop]
+        np.clip(block, -1, 1, out=block)
+
+        #pairs touching a ticker with a missing day use the pairwise-complete sums
+        if len(partial_cols):
+            block[:, partial_cols - col_start] = self._masked(rows, partial_cols)
+        if len(partial_rows):
+            block[partial_rows - row_start, :] = self._masked(partial_rows, cols)
+        return block
+
+    #General pairwise-complete correlations between two sets of columns (slices or index arrays), pairs sharing only a
+    #few rows recomputed from the raw rows
+    def _masked(self, a, b) -> np.ndarray:
+        def pick(matrix, first, second):
+            return matrix[first, second] if isinstance(first, slice) and isinstance(second, slice) else matrix[first][:, second]
+        count = pick(self.count, a, b)
+        corr = _correlation_from_sums(
+            count,
+            pick(self.sum_x, a, b),
+            pick(self.sum_x, b, a).T,
+            pick(self.sum_xx, a, b),
+            pick(self.sum_xx, b, a).T,
+            pick(self.sum_xy, a, b),
+            self.shift[a],
+            self.shift[b]
+        )
+        low = np.nonzero((count >= 2) & (count <= LOW_OVERLAP_ROWS) & (count < self.n_rows))
+        if len(low[0]) and self.rows is not None:
+            columns = np.arange(self.n_columns)
+            corr[low] = pair_correlations(self.rows, columns[a][low[0]], columns[b][low[1]])
+        return corr
+
+    def correlation(self) -> np.ndarray:
+        return self.tile(0, self.n_columns)
+
+
+"""
+Sliding state for several window lengths over the same return matrix, updated in one pass.
+The windows share everything that does not depend on their length:
+- one per-column shift, picked from the longest window at re-anchor time
+- the (x, mask) factors of each row, computed once when the row enters and reused when it expires from every window
+- the re-anchor itself: the windows are nested (all end at the same row), so the shortest window's moments are built
+  from its rows and each longer window adds only the segment of rows it has on top of the next shorter one. One pass
+  over the longest window's rows rebuilds every state instead of one pass per window
+Each day every window then applies its own rank-2 update (shared new row in, its own expired row out).
+Windows that do not have a full history yet only add rows until they do.
+"""
+
+class MultiWindowCorrelationState:
+
+    def __init__(self, n_columns: int, windows: list, dtype=np.float32):
+        self.windows = sorted(set(int(window) for window in windows))
+        self.dtype = np.dtype(dtype)
+        self.states = {window: SlidingCorrelationState(n_columns, dtype) for window in self.windows}
+        self.updates_since_reset = 0
+        self._row_factors = {} #row position -> (x, mask) relative to the current shift
+
+    #Rebuilds every window's moments for the windows ending at row `end` (exclusive) of values
+    def reset(self, values: np.ndarray, end: int):
+        longest = values[max(0, end - self.windows[-1]):end]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning) #all-NaN columns give a NaN mean, replaced with 0 below
+            shift = np.nan_to_num(np.nanmean(longest, axis=0)).astype(self.dtype)
+
+        previous = None
+        for window in self.windows:
+            state = self.states[window]
+            if previous is None:
+                state.reset(values[max(0, end - window):end], shift)
+            else:
+                state.shift = shift
+                state.count, state.sum_x, state.sum_xx, state.sum_xy = [
+                    moment.copy() for moment in (previous.count, previous.sum_x, previous.sum_xx, previous.sum_xy)
+                ]
+                segment = values[max(0, end - window):max(0, end - previous_window)]
+                if len(segment):
+                    for moment, extra in zip(
+                        (state.count, state.sum_x, state.sum_xx, state.sum_xy),
+                        pairwise_moments(np.asarray(segment, dtype=self.dtype) - shift, self.dtype)
+                    ):
+                        moment += extra
+                state.rows = values[max(0, end - window):end]
+                state._raw = None
+                state.n_rows = previous.n_rows + len(segment)
+                state.updates_since_reset = 0
+            previous, previous_window = state, window
+        self.updates_since_reset = 0
+        self._row_factors = {}
+
+    def _factors(self, values: np.ndarray, position: int):
+        if position not in self._row_factors:
+            self._row_factors[position] = self.states[self.windows[0]]._factors(values[position][None, :])
+        return self._row_factors[position]
+
+    #Moves every window forward by one row: row end - 1 enters, row end - 1 - window leaves each window
+    def slide(self, values: np.ndarray, end: int):
+        x_new, m_new = self._factors(values, end - 1)
+        for window in self.windows:
+            expired = end - 1 - window
+            self.states[window].rows = values[max(0, end - window):end]
+            if expired < 0: #window still filling up
+                self.states[window]._apply(x_new, m_new, [1])
+                continue
+            x_old, m_old = self._factors(values, expired)
+            self.states[window]._apply(np.vstack([x_new, x_old]), np.vstack([m_new, m_old]), [1, -1])
+        self.updates_since_reset += 1
+        for position in [p for p in self._row_factors if p < end - 1 - self.windows[-1]]:
+            del self._row_factors[position] #expired from the longest window, no longer needed
+
+
+"""
+Yields (current_date, {window: SlidingCorrelationState}) for every date where at least one window has a full trailing
+history, covering every window length in one pass over the return matrix (see MultiWindowCorrelationState).
+The window for a date is the `window` rows before it, which matches orchestrate_daily_correlation_summary_stats.
+A date only includes the windows with `window` rows before it. The states are updated in place when the generator
+advances, so read them (state.tile / state.correlation) before asking for the next date.
+If first_date is given, dates before it are skipped without being computed.
+If dates is given only those dates are yielded; the running sums still slide over the dates in between, but their
+matrices are never normalised (used to fill gaps when resuming a run).
+"""
+
+def rolling_correlation_states(
+    return_matrix: pd.DataFrame,
+    windows: list,
+    reanchor_every: int = 50, #rebuild the running sums from the raw windows this often to limit float drift
+    dtype=np.float32,
+    first_date=None,
+    dates=None
+):
+    values = return_matrix.to_numpy(dtype=dtype)
+    state = MultiWindowCorrelationState(values.shape[1], windows, dtype=dtype)
+    shortest = state.windows[0]
+    first = shortest if first_date is None else max(shortest, return_matrix.index.searchsorted(pd.Timestamp(first_date)))
+    last = len(values)
+    wanted = None
+    if dates is not None:
+        positions = return_matrix.index.get_indexer(pd.DatetimeIndex(dates))
+        positions = positions[positions >= 0]
+        if len(positions) == 0:
+            return
+        wanted = np.zeros(len(values), dtype=bool)
+        wanted[positions] = True
+        first, last = max(first, positions.min()), positions.max() + 1
+
+    for end in range(first, last):
+        if end == first or state.updates_since_reset >= reanchor_every:
+            with span("reanchor", "sliding"):
+                state.reset(values, end)
+        else:
+            with span("slide", "sliding"):
+                state.slide(values, end)
+        if wanted is None or wanted[end]:
+            yield return_matrix.index[end], {window: state.states[window] for window in state.windows if end >= window}
+
+"""
+Yields (current_date, correlation matrix) for every date in the return matrix with a full trailing window.
+The yielded array is a new (N x N) array each day, columns in the same order as return_matrix.columns.
+first_date and dates work as in rolling_correlation_states.
+"""
+
+def rolling_correlation_matrices(
+    return_matrix: pd.DataFrame,
+    window: int = 20,
+    reanchor_every: int = 50, #rebuild the running sums from the raw window this often to limit float drift
+    dtype=np.float32,
+    first_date=None,
+    dates=None
+):
+    for current_date, states in rolling_correlation_states(
+        return_matrix, [window], reanchor_every, dtype, first_date, dates
+    ):
+        yield current_date, states[window].correlation()
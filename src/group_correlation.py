@@ -0,0 +1,166 @@
+import os
+import numpy as np
+import pandas as pd
+
+from src.summary_store import (
+    _append_table,
+    _load_table,
+    _next_write_stamp,
+    GROUP_TABLE,
+    LEGACY_WINDOW
+)
+
+"""
+The purpose of this file is to summarise correlations by sector (or any grouping of tickers): for every day the G x G
+matrix of average correlations between the tickers of two groups (and within one group on the diagonal), without the
+N x N correlation matrix.
+
+Every fully observed ticker's returns in the window are centred and scaled to unit length (z_i), so
+corr(i, j) = z_i . z_j and the sum of the correlations between fully observed tickers of groups A and B is
+    sum over i in A, j in B of z_i . z_j = (sum over i in A of z_i) . (sum over j in B of z_j) = S_A . S_B
+S = Z @ H, with H the N x G 0/1 group indicator, is one (W x N) @ (N x G) product, so a day costs O(N * G * W) instead of
+O(N^2 * W). (S_A . S_A counts every within-group pair twice and holds z_i . z_i = 1 for each ticker, which is taken
+out so a ticker is not paired with itself.)
+
+Missing returns: z_i . z_j with zeros on a ticker's missing days would be a shrunk correlation, not pandas'
+pairwise-complete one. The P tickers with missing days (IPOs, delistings, gaps) are therefore left out of S and their
+correlations with every other ticker are computed pairwise-complete from masked sums over the shared days: count, sums,
+sums of squares and cross products, each a (P x W) @ (W x N) product, so O(P * N * W). Their pairs are added to the
+group totals with the same indicator products. Pairs whose correlation is NaN in DataFrame.corr() (fewer than 2 shared
+days, constant over them) are left out of the average and of the pair count.
+Between groups A != B the mean is the total over the pairs / their count, within group A the same over the
+n_A * (n_A - 1) / 2 pairs of distinct tickers. Tickers without a correlation that day (fewer than 2 returns or constant)
+are left out.
+
+The mapping is a CSV with a Ticker column and a Group (or Sector) column. Tickers missing from it are left out.
+Results are stored in the summary store's group_correlations table (one row per date, window and pair of groups with
+group_1 <= group_2 by name) and read back with load_group_correlations.
+"""
+
+GROUP_COLUMNS = ("Group", "Sector")
+
+#Reads a ticker -> group CSV into a Series indexed by ticker (str)
+def read_group_mapping(csv_path: str) -> pd.Series:
+    mapping = pd.read_csv(csv_path, dtype=str)
+    group_column = next((column for column in GROUP_COLUMNS if column in mapping.columns), None)
+    if "Ticker" not in mapping.columns or group_column is None:
+        raise ValueError(f"{csv_path} needs a Ticker column and one of {GROUP_COLUMNS}, got {list(mapping.columns)}")
+    mapping = mapping.dropna(subset=["Ticker", group_column]).drop_duplicates(subset="Ticker", keep="last")
+    return pd.Series(mapping[group_column].str.strip().to_numpy(), index=mapping["Ticker"].str.strip(), name="Group")
+
+#(group code of every ticker in column order, -1 when unmapped; sorted group names the codes index into)
+def group_codes(tickers, mapping: pd.Series) -> tuple:
+    groups = pd.Index(tickers).astype(str).map(mapping)
+    names = sorted(set(groups.dropna()))
+    codes = pd.Categorical(groups, categories=names).codes.astype(np.int16)
+    return codes, names
+
+"""
+Average correlations between and within groups for one window of returns.
+rows: (W x N) returns with NaN for missing, codes: group code per column (-1 to leave a column out).
+Returns (mean, pairs): G x G float64 average correlations (NaN without any pair) and the number of pairs behind them,
+the same as averaging the entries of DataFrame.corr().
+"""
+
+#Pairwise-complete correlations (P x N) of the centred columns `partial` against every column of centred (W x N, 0 on
+#missing days), from masked sums over the days each pair shares. NaN with fewer than 2 shared days or no variance
+def _masked_correlations(centred: np.ndarray, observed: np.ndarray, partial: np.ndarray) -> np.ndarray:
+    observed = observed.astype(np.float64)
+    x, x_observed = centred[:, partial], observed[:, partial]
+    count = x_observed.T @ observed
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sum_x, sum_y = x.T @ observed, x_observed.T @ centred
+        sum_xx, sum_yy = (x * x).T @ observed, x_observed.T @ (centred * centred)
+        var_x = sum_xx - sum_x * sum_x / count
+        var_y = sum_yy - sum_y * sum_y / count
+        covariance = x.T @ centred - sum_x * sum_y / count
+        #constant over the shared days: the variance is rounding noise on the sum of squares
+        tolerance = 64 * np.finfo(np.float64).eps
+        valid = (count >= 2) & (var_x > tolerance * sum_xx) & (var_y > tolerance * sum_yy)
+        correlation = covariance / np.sqrt(var_x * var_y)
+    return np.where(valid, np.clip(correlation, -1, 1), np.nan)
+
+def group_correlation(rows: np.ndarray, codes: np.ndarray, n_groups: int) -> tuple:
+    rows = np.asarray(rows, dtype=np.float64)
+    observed = ~np.isnan(rows)
+    count = observed.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(observed, rows, 0).sum(axis=0) / count
+    centred = np.where(observed, rows - mean, 0)
+    sum_sq = (centred * centred).sum(axis=0)
+    scale = np.abs(np.nan_to_num(mean))
+    valid = (codes >= 0) & (count >= 2) & (sum_sq > count * (16 * np.finfo(np.float64).eps * scale) ** 2)
+    valid &= sum_sq > 0
+
+    full = valid & (count == rows.shape[0])
+    partial = np.flatnonzero(valid & ~full)
+    indicator = np.zeros((rows.shape[1], n_groups))
+    indicator[np.flatnonzero(valid), codes[valid]] = 1
+
+    #fully observed tickers: ordered pair totals and counts from the group sums of z-scores, self pairs taken out
+    z = np.zeros_like(centred)
+    z[:, full] = centred[:, full] / np.sqrt(sum_sq[full])
+    full_indicator = indicator * full[:, None]
+    group_sums = z @ full_indicator #(W x G)
+    full_members = full_indicator.sum(axis=0)
+    totals = group_sums.T @ group_sums - np.diag(full_members)
+    pairs = np.outer(full_members, full_members) - np.diag(full_members)
+
+    #tickers with missing days: pairwise-complete rows against every ticker, each pair of two such tickers kept once
+    if len(partial):
+        correlations = _masked_correlations(centred, observed, partial)
+        keep = valid[None, :] & ~np.isnan(correlations)
+        keep[:, partial] &= np.arange(len(partial))[None, :] > np.arange(len(partial))[:, None]
+        partial_indicator = indicator[partial]
+        row_totals = partial_indicator.T @ np.where(keep, correlations, 0) @ indicator
+        row_pairs = partial_indicator.T @ keep.astype(np.float64) @ indicator
+        totals += row_totals + row_totals.T #(p, j) and (j, p) as ordered pairs
+        pairs += row_pairs + row_pairs.T
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average = np.where(pairs > 0, totals / pairs, np.nan)
+    np.fill_diagonal(pairs, np.diag(pairs) / 2) #ordered within-group pairs count every pair twice
+    return np.clip(average, -1, 1), np.rint(pairs).astype(np.int64)
+
+#Long table of a batch of summaries carrying a "groups" entry: Date, window, group_1, group_2, mean_correlation, pairs
+def group_table(summaries: list, names: list) -> pd.DataFrame:
+    first, second = np.triu_indices(len(names))
+    frames = []
+    for summary in summaries:
+        if summary.get("groups") is None:
+            continue
+        average, pairs = summary["groups"]
+        frames.append(pd.DataFrame({
+            "Date": pd.Timestamp(summary["Date"]),
+            "window": summary.get("window", LEGACY_WINDOW),
+            "group_1": np.asarray(names, dtype=object)[first],
+            "group_2": np.asarray(names, dtype=object)[second],
+            "mean_correlation": average[first, second].astype(np.float32),
+            "pairs": pairs[first, second].astype(np.int32)
+        }))
+    columns = ["Date", "window", "group_1", "group_2", "mean_correlation", "pairs"]
+    table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+    table["Date"] = pd.to_datetime(table["Date"])
+    table["window"] = table["window"].astype("int16")
+    return table[columns]
+
+#Appends the group averages carried by a batch of summaries to the store, returns the part files written
+def append_group_correlations(summaries: list, store_dir: str, names: list) -> list:
+    table = group_table(summaries, names)
+    if table.empty:
+        return []
+    return _append_table(table, os.path.join(store_dir, GROUP_TABLE), _next_write_stamp(store_dir))
+
+#Loads the group averages for a date range (every date by default), one window or all, sorted by window, Date, groups
+def load_group_correlations(store_dir: str, start_date=None, end_date=None, window=None) -> pd.DataFrame:
+    columns = ["Date", "window", "group_1", "group_2", "mean_correlation", "pairs"]
+    table = _load_table(os.path.join(store_dir, GROUP_TABLE), columns, start_date, end_date, window)
+    table = table.drop_duplicates(subset=["window", "Date", "group_1", "group_2"], keep="last")
+    return table.sort_values(["window", "Date", "group_1", "group_2"]).reset_index(drop=True)
+
+#G x G matrix (DataFrame indexed and labelled by group) of one date from a table returned by load_group_correlations
+def group_matrix(table: pd.DataFrame) -> pd.DataFrame:
+    matrix = table.pivot(index="group_1", columns="group_2", values="mean_correlation")
+    names = sorted(set(matrix.index) | set(matrix.columns))
+    matrix = matrix.reindex(index=names, columns=names)
+    return matrix.combine_first(matrix.T)
@@ -1,11 +1,30 @@
 import pickle
 import os
+import threading
+from contextlib import contextmanager
+
+#Yields a temporary path next to filename and renames it onto filename once the block finishes without an error, so
+#readers see either the old file or the complete new one, never a partial write. The temporary name starts with "."
+#so dataset scans (pyarrow ignores "." and "_" prefixes) skip it
+@contextmanager
+def atomic_path(filename):
+    directory, basename = os.path.split(os.path.abspath(filename))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".{basename}.tmp-{os.getpid()}-{threading.get_ident()}")
+    try:
+        yield temp_path
+        with open(temp_path, "rb+") as f:
+            os.fsync(f.fileno()) #data on disk before the rename makes it visible
+        os.replace(temp_path, filename)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
 def pickle_save(data, filename):
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    with open(filename, "wb") as f:
-        pickle.dump(data, f)
+    with atomic_path(filename) as temp_path:
+        with open(temp_path, "wb") as f:
+            pickle.dump(data, f)
 
 def pickle_load(filename):
     with open(filename, "rb") as f:
-        return pickle.load(f)
\ No newline at end of file
+        return pickle.load(f)
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+"""
+The purpose of this file is to record where a run spends its time and memory without slowing it down when nobody is
+looking. Stages and sub-steps of the pipeline are wrapped in spans:
+
+    with span("reduce_tile", rows=256):
+        ...
+
+- Turned off (the default) span() returns one shared do-nothing context manager after a single flag check, a few
+  hundred nanoseconds, so the spans can stay in the hot loops and instrumentation can be switched on for any run.
+- Turned on (enable(), or orchestrate_pipeline(trace=...) / --trace) every span is kept as a Chrome trace "complete"
+  event: name, category, start and duration in microseconds, process and thread id and its keyword arguments.
+  add_counter accumulates named totals and sample records a value over time (e.g. the RSS of the process tree).
+
+Tasks that run in other processes (scheduler="processes" or "distributed") record into their own memory, so
+run_adaptive submits them through run_traced, which hands the task's events and counters back with its result to be
+merged here. run_traced leaves the worker's instrumentation as it found it once the last traced task on it finishes,
+so long-lived workers do not keep recording after the run.
+Timestamps are time.perf_counter_ns(), a system wide monotonic clock on Linux, so spans of worker processes line up.
+
+write_chrome_trace writes the events as JSON that chrome://tracing or https://ui.perfetto.dev opens, with one row per
+process and thread. run_report turns them into a short text report: the share of the run spent in each stage, the
+slowest dates, the peak RSS per task and the scheduler's idle worker time.
+"""
+
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+
+    def __init__(self, recorder, name: str, category: str, args: dict):
+        self.recorder = recorder
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.recorder.record({
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": self.start / 1000,
+            "dur": (end - self.start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": self.args
+        })
+        return False
+
+
+"""
+Holds the events of one process. Spans and counters recorded inside run_traced go to per-thread buffers instead of the
+shared ones, so they can be handed back to the process that submitted the task.
+"""
+
+class Recorder:
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._traced_calls = 0 #run_traced calls in progress on any thread
+        self._enabled_before = False #enabled when the first of them started
+
+    def record(self, event: dict):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is not None:
+            buffer.append(event)
+        else:
+            with self._lock:
+                self.events.append(event)
+
+    def reset(self):
+        with self._lock:
+            self.events = []
+            self.counters = {}
+
+_RECORDER = Recorder()
+
+def enable():
+    _RECORDER.enabled = True
+
+def disable():
+    _RECORDER.enabled = False
+
+def is_enabled() -> bool:
+    return _RECORDER.enabled
+
+#Drops every event and counter recorded so far
+def reset():
+    _RECORDER.reset()
+
+#Context manager timing the block as `name` when instrumentation is on, a no-op otherwise
+def span(name: str, category: str = "stage", **args):
+    if not _RECORDER.enabled:
+        return _NULL_SPAN
+    return _Span(_RECORDER, name, category, args)
+
+#Adds value to the named counter (reported at the end of the run)
+def add_counter(name: str, value: float = 1):
+    if _RECORDER.enabled:
+        buffer = getattr(_RECORDER._local, "counters", None)
+        if buffer is not None:
+            buffer[name] = buffer.get(name, 0) + value
+            return
+        with _RECORDER._lock:
+            _RECORDER.counters[name] = _RECORDER.counters.get(name, 0) + value
+
+#Records the current value of one or more series (a Chrome trace counter event, drawn as a graph over time)
+def sample(name: str, **values):
+    if _RECORDER.enabled:
+        _RECORDER.record({
+            "name": name,
+            "ph": "C",
+            "ts": time.perf_counter_ns() / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": values
+        })
+
+#Adds events recorded elsewhere (returned by run_traced) to this process
+def merge_events(events: list):
+    with _RECORDER._lock:
+        _RECORDER.events.extend(events)
+
+#Adds counters recorded elsewhere (returned by run_traced) to this process's totals
+def merge_counters(counters: dict):
+    with _RECORDER._lock:
+        for name, value in counters.items():
+            _RECORDER.counters[name] = _RECORDER.counters.get(name, 0) + value
+
+def events() -> list:
+    with _RECORDER._lock:
+        return list(_RECORDER.events)
+
+def counters() -> dict:
+    with _RECORDER._lock:
+        return dict(_RECORDER.counters)
+
+#Runs fn(*args) with instrumentation on and returns (result, events, counters recorded by the call). Used to bring back
+#the spans and counters of tasks that run in worker processes; neither is kept in the worker, and instrumentation is
+#switched back to its previous state when no other traced call is running in the worker
+def run_traced(fn, *args):
+    with _RECORDER._lock:
+        if _RECORDER._traced_calls == 0:
+            _RECORDER._enabled_before = _RECORDER.enabled
+        _RECORDER._traced_calls += 1
+        _RECORDER.enabled = True
+    _RECORDER._local.buffer, _RECORDER._local.counters = [], {}
+    try:
+        result = fn(*args)
+    finally:
+        recorded, counted = _RECORDER._local.buffer, _RECORDER._local.counters
+        _RECORDER._local.buffer = _RECORDER._local.counters = None
+        with _RECORDER._lock:
+            _RECORDER._traced_calls -= 1
+            if _RECORDER._traced_calls == 0:
+                _RECORDER.enabled = _RECORDER._enabled_before
+    return result, recorded, counted
+
+#Writes every event (and the counters as metadata) as a Chrome trace JSON file
+def write_chrome_trace(path: str):
+    trace = {"traceEvents": events(), "displayTimeUnit": "ms", "otherData": {"counters": counters()}}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(trace, f, default=str)
+
+"""
+Short text report of the recorded events:
+- wall time from the first to the last event
+- total time per span name, as a share of the wall time (nested spans are counted in their parent too, and spans on
+  several threads or processes can add up to more than 100%)
+- the `top` slowest "date" spans with their date and window
+- the largest peak RSS seen while a task was in flight, and the scheduler's idle worker time (counters recorded by
+  run_adaptive)
+"""
+
+def run_report(top: int = 5) -> str:
+    spans = [event for event in events() if event["ph"] == "X"]
+    if not spans:
+        return "No spans recorded"
+    start = min(event["ts"] for event in spans)
+    wall = max(event["ts"] + event["dur"] for event in spans) - start
+
+    totals = {}
+    for event in spans:
+        calls, total = totals.get(event["name"], (0, 0.0))
+        totals[event["name"]] = (calls + 1, total + event["dur"])
+    lines = [f"Run report: {wall / 1e6:.2f}s wall time, {len(spans)} spans"]
+    lines.append(f"  {'stage':<28}{'calls':>8}{'seconds':>10}{'share':>8}")
+    for name, (calls, total) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        lines.append(f"  {name:<28}{calls:>8}{total / 1e6:>10.3f}{total / max(wall, 1e-9):>8.1%}")
+
+    dates = sorted((event for event in spans if event["name"] == "date"), key=lambda event: -event["dur"])[:top]
+    if dates:
+        lines.append(f"  slowest dates:")
+        for event in dates:
+            window = f" (window {event['args']['window']})" if "window" in event["args"] else ""
+            lines.append(f"    {event['args'].get('date')}{window}: {event['dur'] / 1e6:.3f}s")
+
+    tasks = [event for event in spans if event["name"] == "task"]
+    if tasks:
+        peak = max(event["args"].get("peak_rss_mb", 0) for event in tasks)
+        lines.append(f"  tasks: {len(tasks)}, largest process tree RSS while a task was in flight {peak:.0f}MB")
+    counter_values = counters()
+    if "idle_worker_seconds" in counter_values:
+        lines.append(
+            f"  scheduler idle: {counter_values['idle_worker_seconds']:.2f} worker-seconds without a task "
+            f"({counter_values.get('worker_seconds', 0):.2f} worker-seconds available)"
+        )
+    return "\n".join(lines)
+
+#Turns instrumentation on for the block, then writes the Chrome trace to path (if given) and prints the report
+@contextmanager
+def instrumented(path: str = None, report: bool = True):
+    was_enabled = is_enabled()
+    reset()
+    enable()
+    try:
+        yield
+    finally:
+        if not was_enabled:
+            disable()
+        if path is not None:
+            write_chrome_trace(path)
+            print(f"Trace written to {path}")
+        if report:
+            print(run_report())
@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import socket
+import selectors
+import numpy as np
+import pandas as pd
+
+from src.correlation import daily_return_matrix
+from src.fast_correlation import SlidingCorrelationState, _correlation_from_sums
+from src.summary_reducer import reduce_correlation_blocks
+from src.helpers import atomic_path
+from src.instrumentation import span
+
+"""
+The purpose of this file is a live mode: the summary of the window ending with today's partial day, refreshed as prices
+arrive during the day instead of once the day's prices are in the archive.
+
+The window is the last window - 1 completed days of returns plus today's row, where each ticker's return is its latest
+price today against its previous close (NaN until its first price today). Once today closes this is the same window the
+batch pipeline summarises for the next trading date. The moments of the window are kept in a SlidingCorrelationState
+(src/fast_correlation.py) for the completed days only, built once per day. Today's row is a rank-1 term added to the
+moments of each tile as the summary reducer asks for it (LiveWindowState), so a price update only writes the ticker's
+entry of today's row: O(1) per update, with no running sums to drift. The correlations are never held as an N x N
+matrix. The median is the fine-histogram estimate (within 1.25e-4, see src/summary_reducer.py), which saves the second
+pass over the tiles.
+A price with a later date closes today: its row joins the completed days, the oldest day leaves the window and the
+completed days' moments are rebuilt once.
+
+Price updates are text lines "Ticker,Date,Price" (the first columns of the archive's .csv files, later columns such as
+Volume and a header line are skipped).
+They are read from
+- a file another process appends to (tail_lines), or
+- a local TCP socket standing in for a feed (socket_lines, e.g. `nc localhost 9009 < prices.csv`).
+Both sources yield every complete line available at once, so updates that arrive during a refresh are applied together
+in the next one. Lines for unknown tickers, older dates or that do not parse are skipped and counted.
+
+Every refresh is written atomically to live_summary.json in the summary store directory (same keys as a stored
+summary plus window, as_of, tickers_updated and the refresh latency). The dashboard polls it.
+"""
+
+LIVE_FILE = "live_summary.json"
+LIVE_POLL_INTERVAL = 0.1 #seconds between checks for new lines
+LIVE_PORT = 9009
+
+
+"""
+Correlations of a window made of fixed completed days plus today's row, tile by tile.
+The moments of the completed days (SlidingCorrelationState) are built once per day. Today's row is kept as its (x, mask)
+factors and added to each tile's moments as a rank-1 term, so a price update only writes one entry of the factors.
+A pair of tickers observed on every completed day shares
+- all window rows when both have a price today: n = window, sums over the completed days plus today's x
+- only the completed days otherwise: n = window - 1, the completed days' sums alone
+Both are dense formulas over the (sum_xy + x x^T) tile, picked per pair with the outer product of today's masks.
+Pairs touching a ticker with a missing completed day use the general pairwise-complete formula on the moments plus
+today's rank-1 terms.
+"""
+
+class LiveWindowState:
+
+    def __init__(self, completed: np.ndarray):
+        self.base = SlidingCorrelationState(completed.shape[1])
+        self.base.reset(completed)
+        self.n_columns = completed.shape[1]
+        self.base_rows = len(completed)
+        diagonal = np.arange(self.n_columns)
+        self.partial = self.base.count[diagonal, diagonal] != self.base_rows
+        self.sums = self.base.sum_x[diagonal, diagonal].copy()
+        self.squares = self.base.sum_xx[diagonal, diagonal].copy()
+        self.x = np.zeros(self.n_columns, dtype=self.base.dtype)
+        self.mask = np.zeros(self.n_columns, dtype=self.base.dtype)
+        self.inverse_sd = self._inverse_sd(self.sums, self.squares, self.base_rows)
+        self._today = None #(sums, inverse sd) including today's row, recomputed after an update
+
+    #1 / standard deviation * sqrt(n) of every column, NaN for constant columns (same tolerance as the sliding state)
+    def _inverse_sd(self, sums: np.ndarray, squares: np.ndarray, n: int) -> np.ndarray:
+        eps = np.finfo(self.base.dtype).eps
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variance = squares - sums * sums / n
+            tolerance = 16 * eps * squares + n * (16 * eps * np.abs(self.base.shift)) ** 2
+            return 1 / np.sqrt(np.where(variance > tolerance, variance, np.nan))
+
+    #Sets today's returns of some columns (NaN: no price today yet)
+    def set_today(self, columns: np.ndarray, returns: np.ndarray):
+        shifted = returns - self.base.shift[columns]
+        observed = ~np.isnan(shifted)
+        self.x[columns] = np.where(observed, shifted, 0)
+        self.mask[columns] = observed
+        self._today = None
+
+    def _today_moments(self):
+        if self._today is None:
+            sums = self.sums + self.x
+            self._today = sums, self._inverse_sd(sums, self.squares + self.x * self.x, self.base_rows + 1)
+        return self._today
+
+    #General pairwise-complete correlations between two sets of columns (slices or index arrays)
+    def _masked(self, a, b) -> np.ndarray:
+        base = self.base
+        def pick(matrix, first, second):
+            return matrix[first, second] if isinstance(first, slice) and isinstance(second, slice) else matrix[first][:, second]
+        x_a, x_b, m_a, m_b = self.x[a], self.x[b], self.mask[a], self.mask[b]
+        return _correlation_from_sums(
+            pick(base.count, a, b) + np.outer(m_a, m_b),
+            pick(base.sum_x, a, b) + np.outer(x_a, m_b),
+            pick(base.sum_x, b, a).T + np.outer(m_a, x_b),
+            pick(base.sum_xx, a, b) + np.outer(x_a * x_a, m_b),
+            pick(base.sum_xx, b, a).T + np.outer(m_a, x_b * x_b),
+            pick(base.sum_xy, a, b) + np.outer(x_a, x_b),
+            base.shift[a],
+            base.shift[b]
+        )
+
+    #Correlations corr[row_start:row_stop, col_start:col_stop] of the live window
+    def tile(self, row_start: int, row_stop: int, col_start: int = 0, col_stop: int = None) -> np.ndarray:
+        col_stop = self.n_columns if col_stop is None else col_stop
+        rows, cols = slice(row_start, row_stop), slice(col_start, col_stop)
+        sum_xy = self.base.sum_xy[rows, cols]
+        with np.errstate(invalid="ignore"):
+            #pairs without a shared price today: the completed days only
+            block = np.outer(self.sums[rows], self.sums[cols] / self.base_rows)
+            np.subtract(sum_xy, block, out=block)
+            block *= self.inverse_sd[rows, None]
+            block *= self.inverse_sd[None, cols]
+            if self.base_rows < 2:
+                block[:] = np.nan
+
+            #pairs that both have a price today: every row of the window
+            both_today = np.outer(self.mask[rows], self.mask[cols]) > 0
+            if both_today.any():
+                sums, inverse_sd = self._today_moments()
+                today = np.outer(self.x[rows], self.x[cols])
+                today += sum_xy
+                today -= np.outer(sums[rows], sums[cols] / (self.base_rows + 1))
+                today *= inverse_sd[rows, None]
+                today *= inverse_sd[None, cols]
+                np.copyto(block, today, where=both_today)
+        np.clip(block, -1, 1, out=block)
+
+        partial_cols = np.flatnonzero(self.partial[cols]) + col_start
+        if len(partial_cols):
+            block[:, partial_cols - col_start] = self._masked(rows, partial_cols)
+        partial_rows = np.flatnonzero(self.partial[rows]) + row_start
+        if len(partial_rows):
+            block[partial_rows - row_start, :] = self._masked(partial_rows, cols)
+        return block
+
+
+"""
+The live window for one window length over a fixed set of tickers.
+returns: the completed days of returns (Date x Ticker, at least window - 1 rows), closes: the last close of every
+ticker (Series indexed like the returns' columns).
+apply(updates) takes (ticker, date, price) tuples and returns the number applied, summary() the current summary.
+"""
+
+class LiveCorrelation:
+
+    def __init__(self, returns: pd.DataFrame, closes: pd.Series, window: int = 20):
+        if window < 2:
+            raise ValueError(f"window must be at least 2 days, got {window}")
+        if len(returns) < window - 1:
+            raise ValueError(f"Need {window - 1} completed days of returns, got {len(returns)}")
+        self.window = window
+        self.tickers = np.asarray(returns.columns.astype(str), dtype=str)
+        self.columns = {ticker: column for column, ticker in enumerate(self.tickers)}
+        self.completed = returns.to_numpy(dtype=np.float32)[len(returns) - (window - 1):]
+        self.last_completed_date = pd.Timestamp(returns.index[-1])
+        self.closes = closes.reindex(returns.columns).to_numpy(dtype=np.float64)
+        self.skipped = 0
+        self.as_of = None
+        self._open_day(None)
+
+    #Live window from an archive's prices (DataFrame[Ticker, Date, Price] as returned by data_load_zip)
+    @classmethod
+    def from_prices(cls, prices: pd.DataFrame, window: int = 20) -> "LiveCorrelation":
+        returns = daily_return_matrix(prices)
+        returns.columns = returns.columns.astype(str)
+        closes = prices.sort_values("Date").groupby("Ticker", observed=True)["Price"].last()
+        closes.index = closes.index.astype(str)
+        return cls(returns, closes, window)
+
+    #Starts a new day with no prices yet, the completed days' moments are built once here
+    def _open_day(self, date):
+        self.today = date
+        self.today_prices = np.full(len(self.tickers), np.nan)
+        with span("live_open_day", "live"):
+            self.state = LiveWindowState(self.completed)
+
+    #Today's returns become a completed day, the oldest completed day leaves the window
+    def _close_day(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            today_row = (self.today_prices / self.closes - 1).astype(np.float32)
+        self.completed = np.vstack([self.completed, today_row])[1:]
+        self.closes = np.where(np.isnan(self.today_prices), self.closes, self.today_prices)
+        self.last_completed_date = self.today
+
+    #Applies a batch of (ticker, date, price) updates, returns how many were applied. Later updates of the same ticker
+    #win, a later date closes today first
+    def apply(self, updates: list) -> int:
+        applied = 0
+        changed = {}
+        for ticker, date, price in updates:
+            column = self.columns.get(str(ticker))
+            date = pd.Timestamp(date).normalize()
+            if column is None or date <= self.last_completed_date or (self.today is not None and date < self.today) \
+                    or not np.isfinite(price):
+                self.skipped += 1
+                continue
+            if self.today is None or date > self.today:
+                self._flush(changed)
+                changed = {}
+                if self.today is not None:
+                    self._close_day()
+                self._open_day(date)
+            changed[column] = price
+            applied += 1
+        self._flush(changed)
+        return applied
+
+    #Writes the latest prices of the changed columns into today's row (O(changed tickers))
+    def _flush(self, changed: dict):
+        if not changed:
+            return
+        columns = np.fromiter(changed.keys(), dtype=np.int64, count=len(changed))
+        prices = np.fromiter(changed.values(), dtype=np.float64, count=len(changed))
+        self.today_prices[columns] = prices
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.state.set_today(columns, (prices / self.closes[columns] - 1).astype(np.float32))
+        self.as_of = pd.Timestamp.now()
+
+    #Summary of the current window (the same dictionary the batch pipeline stores) plus live details. Before the first
+    #price it is dated with the calendar date
+    def summary(self) -> dict:
+        today = self.today if self.today is not None else pd.Timestamp.now().normalize()
+        with span("live_summary", "live"):
+            summary = reduce_correlation_blocks(
+                self.state.tile, len(self.tickers), self.tickers, today, exact_median=False
+            )
+        return {
+            **summary,
+            "window": self.window,
+            "as_of": None if self.as_of is None else self.as_of.isoformat(),
+            "tickers_updated": int(np.count_nonzero(~np.isnan(self.today_prices))),
+            "tickers": len(self.tickers),
+            "skipped_updates": self.skipped
+        }
+
+#(ticker, date, price) of a "Ticker,Date,Price[,...]" line, None for a header or a line that does not parse
+def parse_price_line(line: str):
+    parts = [part.strip() for part in line.strip().split(",")]
+    if len(parts) < 3 or parts[0] == "Ticker":
+        return None
+    try:
+        return parts[0], pd.Timestamp(parts[1]), float(parts[2])
+    except ValueError:
+        return None
+
+"""
+Yields the complete lines appended to path since the last batch (a list, empty when nothing arrived within
+poll_interval), until stop (a threading.Event) is set. from_start=False skips what the file already holds. A file that
+does not exist yet is waited for, one that shrinks (truncated or replaced) is read again from the start.
+"""
+
+def tail_lines(path: str, poll_interval: float = LIVE_POLL_INTERVAL, from_start: bool = True, stop=None):
+    position = 0 if from_start or not os.path.exists(path) else os.path.getsize(path)
+    partial = ""
+    while stop is None or not stop.is_set():
+        if not os.path.exists(path) or os.path.getsize(path) == position:
+            time.sleep(poll_interval)
+            yield []
+            continue
+        if os.path.getsize(path) < position:
+            position, partial = 0, ""
+        with open(path, "r") as f:
+            f.seek(position)
+            data = f.read()
+            position = f.tell()
+        lines = (partial + data).split("\n")
+        partial = lines.pop() #a line without its newline yet is kept for the next read
+        yield [line for line in lines if line.strip()]
+
+"""
+Same as tail_lines for a local TCP socket: listens on host:port, accepts any number of connections and yields the
+complete lines received from all of them since the last batch.
+"""
+
+def socket_lines(port: int = LIVE_PORT, host: str = "127.0.0.1", poll_interval: float = LIVE_POLL_INTERVAL, stop=None):
+    selector = selectors.DefaultSelector()
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen()
+    server.setblocking(False)
+    selector.register(server, selectors.EVENT_READ, data=None)
+    partial = {} #connection -> text received after its last newline
+    try:
+        while stop is None or not stop.is_set():
+            lines = []
+            for key, _ in selector.select(timeout=poll_interval):
+                if key.data is None:
+                    connection, _ = server.accept()
+                    connection.setblocking(False)
+                    selector.register(connection, selectors.EVENT_READ, data="connection")
+                    partial[connection] = ""
+                    continue
+                connection = key.fileobj
+                data = connection.recv(1 << 16)
+                if not data:
+                    selector.unregister(connection)
+                    connection.close()
+                    data = b"\n" #a last line without a newline still counts once the sender closes
+                received = (partial.pop(connection, "") + data.decode()).split("\n")
+                if data != b"\n":
+                    partial[connection] = received.pop()
+                lines += [line for line in received if line.strip()]
+            yield lines
+    finally:
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+
+#Writes a live summary to the store directory (atomically, so the dashboard never reads half a file)
+def publish_live_summary(summary: dict, store_dir: str) -> str:
+    path = os.path.join(store_dir, LIVE_FILE)
+    with atomic_path(path) as temp_path:
+        with open(temp_path, "w") as f:
+            json.dump(summary, f, default=str)
+    return path
+
+#Latest live summary in the store directory, None when live mode has not published one
+def read_live_summary(store_dir: str):
+    path = os.path.join(store_dir, LIVE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+"""
+Runs the live loop: every batch of lines from source (tail_lines or socket_lines) is applied and, when anything
+changed, a refreshed summary is published. latency_seconds in the summary is the time from the batch arriving to the
+summary being written. on_publish(summary) is called after every refresh.
+"""
+
+def run_live(live: LiveCorrelation, source, store_dir: str, on_publish=None):
+    for lines in source:
+        received = time.perf_counter()
+        updates = [update for update in map(parse_price_line, lines) if update is not None]
+        live.skipped += len(lines) - len(updates)
+        if not updates or live.apply(updates) == 0:
+            continue
+        summary = live.summary()
+        summary["latency_seconds"] = time.perf_counter() - received
+        publish_live_summary(summary, store_dir)
+        if on_publish is not None:
+            on_publish(summary)
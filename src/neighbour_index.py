@@ -0,0 +1,197 @@
+import os
+import numpy as np
+import pandas as pd
+
+from src.summary_store import LEGACY_WINDOW
+from src.part_store import next_write_stamp, part_dir, write_part, list_parts, remove_partial_parts
+
+"""
+The purpose of this file is to keep every ticker's k most and least correlated peers for every day. The summaries only
+hold the market wide top pairs and full N x N matrices are far too large to store (5000 tickers: 100MB per day in
+float32), while k = 10 peers per side is ~0.6MB per day.
+
+The peers are found alongside the summary reduction: reduce_correlation_blocks hands every block of full rows to
+top_k_per_row, which uses argpartition per row, so no more than one block of rows is held at once.
+- most   the k highest correlations of the row (most positively correlated peers)
+- least  the k lowest correlations of the row (most negatively correlated peers, the hedging candidates)
+A ticker is never its own peer and NaN correlations are skipped. When a ticker has fewer than k peers with a correlation
+the remaining slots hold peer -1 and a NaN correlation.
+
+The index is a directory inside the summary store, one part directory per append and window (src/part_store.py):
+neighbours/window=<W>/<write stamp>-<first date>_<last date>/
+    dates.npy               datetime64[ns] (days,)
+    tickers.npy             ticker names (N,), peer numbers index into this
+    most_index.npy          int32 (days x N x k), peer column numbers sorted from the highest correlation down
+    most_correlation.npy    float16 (days x N x k)
+    least_index.npy         int32 (days x N x k), sorted from the lowest correlation up
+    least_correlation.npy   float16 (days x N x k)
+Parts are opened with np.load(mmap_mode="r"), so a query for one ticker only reads that ticker's rows. A date written
+more than once keeps the part with the highest write stamp.
+"""
+
+NEIGHBOUR_DIR = "neighbours"
+NEIGHBOURS = 10 #default peers kept per side
+NEIGHBOUR_KINDS = ("most", "least")
+
+CHUNK_COLUMNS = 64 #columns per chunk when narrowing a row down to its k best candidates
+
+#Column numbers of the k smallest keys of every row, sorted ascending. keys is (b x CHUNK_COLUMNS * C), padded with inf.
+#Columns are dealt into C interleaved chunks (chunk j holds columns j, j + C, j + 2C, ...). The k chunks with the
+#smallest minimum hold the k smallest keys (each of those minimums is a distinct key), so only k * CHUNK_COLUMNS keys per
+#row go through argpartition instead of the whole row
+def _smallest_k(keys: np.ndarray, k: int) -> np.ndarray:
+    n_rows, width = keys.shape
+    n_chunks = width // CHUNK_COLUMNS
+    chunks = keys.reshape(n_rows, CHUNK_COLUMNS, n_chunks)
+    if n_chunks > k:
+        best_chunks = np.argpartition(chunks.min(axis=1), k - 1, axis=1)[:, :k]
+    else:
+        best_chunks = np.broadcast_to(np.arange(n_chunks), (n_rows, n_chunks))
+    candidates = np.take_along_axis(chunks, best_chunks[:, None, :], axis=2).reshape(n_rows, -1)
+    columns = (np.arange(CHUNK_COLUMNS)[None, :, None] * n_chunks + best_chunks[:, None, :]).reshape(n_rows, -1)
+    best = np.argpartition(candidates, k - 1, axis=1)[:, :k]
+    best = np.take_along_axis(best, np.argsort(np.take_along_axis(candidates, best, axis=1), axis=1, kind="stable"), axis=1)
+    return np.take_along_axis(columns, best, axis=1)
+
+#(most_index, most_correlation, least_index, least_correlation) of the rows of one tile of full rows (b x N) that
+#starts at row row_start. Index arrays are int32 (b x k) with -1 for missing peers, correlations float16
+def top_k_per_row(tile: np.ndarray, row_start: int, k: int) -> tuple:
+    n_rows, n_columns = tile.shape
+    k_kept = min(k, n_columns - 1)
+    missing = np.isnan(tile)
+    rows = np.arange(n_rows)
+    diagonal = rows + row_start
+    inside = diagonal < n_columns
+    missing[rows[inside], diagonal[inside]] = True #a ticker is not its own peer
+
+    results = []
+    width = -(-n_columns // CHUNK_COLUMNS) * CHUNK_COLUMNS
+    for sign in (-1, 1): #-1: highest first, 1: lowest first
+        keys = np.full((n_rows, width), np.inf, dtype=np.float32)
+        np.multiply(tile, sign, out=keys[:, :n_columns], casting="unsafe")
+        np.copyto(keys[:, :n_columns], np.inf, where=missing) #NaN sorts after every real correlation
+        peers = np.full((n_rows, k), -1, dtype=np.int32)
+        correlations = np.full((n_rows, k), np.nan, dtype=np.float16)
+        if k_kept > 0:
+            candidates = _smallest_k(keys, k_kept)
+            found = ~np.isinf(np.take_along_axis(keys, candidates, axis=1))
+            peers[:, :k_kept] = np.where(found, candidates, -1)
+            correlations[:, :k_kept] = np.where(found, np.take_along_axis(tile, np.minimum(candidates, n_columns - 1), axis=1), np.nan)
+        results += [peers, correlations]
+    return tuple(results)
+
+"""
+Accumulates the peers of one date block by block. update takes tiles of full rows in any order, arrays() returns
+(most_index, most_correlation, least_index, least_correlation) for all N rows.
+"""
+
+class NeighbourReducer:
+
+    def __init__(self, n_columns: int, k: int = NEIGHBOURS):
+        self.k = k
+        self.most_index = np.full((n_columns, k), -1, dtype=np.int32)
+        self.most_correlation = np.full((n_columns, k), np.nan, dtype=np.float16)
+        self.least_index = np.full((n_columns, k), -1, dtype=np.int32)
+        self.least_correlation = np.full((n_columns, k), np.nan, dtype=np.float16)
+
+    def update(self, tile: np.ndarray, row_start: int):
+        row_stop = row_start + tile.shape[0]
+        (
+            self.most_index[row_start:row_stop],
+            self.most_correlation[row_start:row_stop],
+            self.least_index[row_start:row_stop],
+            self.least_correlation[row_start:row_stop]
+        ) = top_k_per_row(tile, row_start, self.k)
+
+    def arrays(self) -> tuple:
+        return self.most_index, self.most_correlation, self.least_index, self.least_correlation
+
+
+"""
+Writes the peers carried by a batch of summaries (the "neighbours" entry added by reduce_correlation_blocks) as one
+new part per window. Summaries without peers are skipped. Returns the part directories written.
+"""
+
+def append_neighbours(summaries: list, store_dir: str, tickers) -> list:
+    by_window = {}
+    for summary in summaries:
+        if summary.get("neighbours") is not None:
+            by_window.setdefault(int(summary.get("window", LEGACY_WINDOW)), []).append(summary)
+
+    part_dirs = []
+    write_stamp = next_write_stamp(store_dir, NEIGHBOUR_DIR)
+    for window, window_summaries in sorted(by_window.items()):
+        dates = pd.to_datetime([summary["Date"] for summary in window_summaries]).to_numpy(dtype="datetime64[ns]")
+        part_path = part_dir(store_dir, NEIGHBOUR_DIR, window, write_stamp, dates)
+        with write_part(part_path) as temp_dir:
+            np.save(os.path.join(temp_dir, "dates.npy"), dates)
+            np.save(os.path.join(temp_dir, "tickers.npy"), np.asarray(pd.Index(tickers).astype(str), dtype=str))
+            names = ["most_index", "most_correlation", "least_index", "least_correlation"]
+            for i, name in enumerate(names):
+                arrays = np.stack([summary["neighbours"][i] for summary in window_summaries])
+                np.save(os.path.join(temp_dir, f"{name}.npy"), arrays)
+        part_dirs.append(part_path)
+    return part_dirs
+
+#Part directories of one window in write order (".tmp" leftovers of killed runs are skipped)
+def neighbour_parts(store_dir: str, window: int = LEGACY_WINDOW) -> list:
+    return list_parts(store_dir, NEIGHBOUR_DIR, window)
+
+#Removes leftover temporary part directories of killed runs
+def remove_partial_neighbours(store_dir: str) -> list:
+    return remove_partial_parts(store_dir, NEIGHBOUR_DIR)
+
+#Dates with peers in the index for one window
+def neighbour_dates(store_dir: str, window: int = LEGACY_WINDOW) -> pd.DatetimeIndex:
+    dates = [np.load(os.path.join(part_dir, "dates.npy")) for part_dir in neighbour_parts(store_dir, window)]
+    return pd.DatetimeIndex(np.unique(np.concatenate(dates))) if dates else pd.DatetimeIndex([])
+
+"""
+Peers of one ticker for every stored date in [start_date, end_date] (inclusive, None for open ends).
+kind is "most" or "least". Returns a long DataFrame: Date, rank (1 = strongest), peer, correlation, sorted by Date and
+rank. Empty slots (fewer than k peers with a correlation) are left out.
+"""
+
+def load_neighbours(
+    store_dir: str,
+    ticker,
+    start_date=None,
+    end_date=None,
+    window: int = LEGACY_WINDOW,
+    kind: str = "most"
+) -> pd.DataFrame:
+    if kind not in NEIGHBOUR_KINDS:
+        raise ValueError(f"Unknown kind '{kind}', expected one of {NEIGHBOUR_KINDS}")
+    start = None if start_date is None else np.datetime64(pd.Timestamp(start_date), "ns")
+    end = None if end_date is None else np.datetime64(pd.Timestamp(end_date), "ns")
+
+    latest = {} #date -> (part tickers, peer row, correlation row), later parts overwrite earlier ones
+    for part_dir in neighbour_parts(store_dir, window):
+        dates = np.load(os.path.join(part_dir, "dates.npy"))
+        selected = np.ones(len(dates), dtype=bool)
+        if start is not None:
+            selected &= dates >= start
+        if end is not None:
+            selected &= dates <= end
+        if not selected.any():
+            continue
+        tickers = np.load(os.path.join(part_dir, "tickers.npy"))
+        column = np.flatnonzero(tickers == str(ticker))
+        if len(column) == 0:
+            continue
+        peers = np.load(os.path.join(part_dir, f"{kind}_index.npy"), mmap_mode="r")
+        correlations = np.load(os.path.join(part_dir, f"{kind}_correlation.npy"), mmap_mode="r")
+        for row in np.flatnonzero(selected):
+            latest[dates[row]] = (tickers, np.array(peers[row, column[0]]), np.array(correlations[row, column[0]]))
+
+    records = [
+        (date, rank, tickers[peer], float(correlation))
+        for date, (tickers, peers, correlations) in sorted(latest.items())
+        for rank, (peer, correlation) in enumerate(zip(peers, correlations), start=1)
+        if peer >= 0
+    ]
+    neighbours = pd.DataFrame(records, columns=["Date", "rank", "peer", "correlation"])
+    neighbours["Date"] = pd.to_datetime(neighbours["Date"])
+    neighbours["rank"] = neighbours["rank"].astype("int16")
+    neighbours["correlation"] = neighbours["correlation"].astype("float32")
+    return neighbours
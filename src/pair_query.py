@@ -0,0 +1,145 @@
+from collections import OrderedDict
+import warnings
+import numpy as np
+import pandas as pd
+
+from src.fast_correlation import _correlation_from_sums
+from src.return_cache import load_cached_return_matrix
+
+"""
+The purpose of this file is to answer pair level questions that the summary store cannot: only the top/bottom pairs of
+every day are stored, so the correlation history of one pair or the peers of one ticker have to come from the returns.
+
+Both queries read only the columns they need from the return matrix (usually the memory-mapped cache, so nothing but the
+touched pages is read) and never build an N x N matrix:
+- pair_history(t1, t2, start, end)  rolling correlation of one pair for every date in [start, end]. Cumulative sums of
+                                    the six pairwise moments over the two columns give each window's sums by a
+                                    difference, O(W + T) for T dates
+- ticker_vs_all(t, date)            correlation of one ticker with every other ticker over the window of one date,
+                                    six matrix-vector products over the W x N window, O(N * W)
+
+The window of a date is the `window` rows before it, the same rows the pipeline summarises for that date, and missing
+returns follow pandas' pairwise-complete semantics (NaN for < 2 shared rows or a constant column). Sums are float64 and
+every column is shifted by its mean first, so results match DataFrame.corr() to within 1e-9.
+
+CorrelationQuery keeps the answers in a bounded LRU cache, so a dashboard that redraws on every interaction does not
+recompute them. pair_history is symmetric and cached once per unordered pair.
+"""
+
+QUERY_CACHE_SIZE = 256 #query results kept per CorrelationQuery, least recently used are dropped first
+
+class CorrelationQuery:
+
+    def __init__(self, return_matrix: pd.DataFrame, window: int = 20, cache_size: int = QUERY_CACHE_SIZE):
+        if window < 2:
+            raise ValueError(f"Window lengths must be at least 2 days, got {window}")
+        self.values = return_matrix.to_numpy() #a view for the single dtype (memory-mapped) return matrix
+        self.dates = pd.DatetimeIndex(return_matrix.index)
+        self.tickers = pd.Index(return_matrix.columns.astype(str))
+        self.window = window
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    #Query over a return matrix cache entry (see src/return_cache.py)
+    @classmethod
+    def from_cache(cls, entry_dir: str, window: int = 20, cache_size: int = QUERY_CACHE_SIZE):
+        return cls(load_cached_return_matrix(entry_dir), window, cache_size)
+
+    def cache_info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "max_size": self.cache_size}
+
+    def clear_cache(self):
+        self._cache.clear()
+        self.hits = self.misses = 0
+
+    #Cached value for key, computing it with compute() and evicting the least recently used entry on a miss
+    def _cached(self, key, compute):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return self._cache[key]
+        self.misses += 1
+        result = compute()
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def _column(self, ticker) -> int:
+        position = self.tickers.get_indexer([str(ticker)])[0]
+        if position < 0:
+            raise ValueError(f"Unknown ticker '{ticker}'")
+        return position
+
+    """
+    Rolling correlation of ticker_1 and ticker_2 for every date in [start, end] (inclusive, None for open ends) that
+    has a full window before it. Returns a float64 Series indexed by Date, NaN where the pair has < 2 shared returns.
+    """
+
+    def pair_history(self, ticker_1, ticker_2, start=None, end=None) -> pd.Series:
+        columns = (self._column(ticker_1), self._column(ticker_2))
+        first = max(self.window, 0 if start is None else self.dates.searchsorted(pd.Timestamp(start), side="left"))
+        stop = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side="right")
+        key = ("pair", min(columns), max(columns), first, stop)
+        history = self._cached(key, lambda: self._pair_history(min(columns), max(columns), first, stop))
+        return pd.Series(history, index=self.dates[first:max(first, stop)], name=f"{ticker_1}/{ticker_2}", copy=True)
+
+    def _pair_history(self, i: int, j: int, first: int, stop: int) -> np.ndarray:
+        if stop <= first:
+            return np.empty(0)
+        #rows first - window .. stop - 1 cover the windows of dates first .. stop - 1
+        block = np.asarray(self.values[first - self.window:stop - 1, [i, j]], dtype=np.float64)
+        observed = ~np.isnan(block).any(axis=1)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning) #a column with no shared rows gives a NaN mean
+            shift = np.nan_to_num(block[observed].mean(axis=0))
+        x, y = np.where(observed[:, None], block - shift, 0).T
+        m = observed.astype(np.float64)
+
+        #cumulative moments with a leading 0, the sums of the k-th window are cum[k + window] - cum[k]
+        moments = np.stack([m, x, y, x * x, y * y, x * y])
+        cumulative = np.zeros((6, len(m) + 1))
+        np.cumsum(moments, axis=1, out=cumulative[:, 1:])
+        count, sum_x, sum_y, sum_xx, sum_yy, sum_xy = (cumulative[:, self.window:] - cumulative[:, :-self.window])[:, :, None]
+        return _correlation_from_sums(
+            count, sum_x, sum_y, sum_xx, sum_yy, sum_xy, shift[:1], shift[1:]
+        ).ravel()
+
+    """
+    Correlation of ticker with every ticker over the window before date (which must be in the return matrix and have a
+    full window before it). Returns a float64 Series indexed by Ticker, the ticker itself included (1.0 unless constant).
+    """
+
+    def ticker_vs_all(self, ticker, date) -> pd.Series:
+        column = self._column(ticker)
+        position = self.dates.get_indexer([pd.Timestamp(date)])[0]
+        if position < 0:
+            raise ValueError(f"No returns for {pd.Timestamp(date).strftime('%Y-%m-%d')}")
+        if position < self.window:
+            raise ValueError(f"{pd.Timestamp(date).strftime('%Y-%m-%d')} has fewer than {self.window} days before it")
+        correlations = self._cached(("ticker", column, position), lambda: self._ticker_vs_all(column, position))
+        return pd.Series(correlations, index=self.tickers, name=str(ticker), copy=True)
+
+    def _ticker_vs_all(self, column: int, position: int) -> np.ndarray:
+        rows = np.asarray(self.values[position - self.window:position], dtype=np.float64)
+        observed = ~np.isnan(rows)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning) #all-NaN columns give a NaN mean
+            shift = np.nan_to_num(np.nanmean(rows, axis=0))
+        others = np.where(observed, rows - shift, 0)
+        m = observed.astype(np.float64)
+        mx, x = m[:, column], others[:, column]
+
+        #pairwise-complete sums of the ticker (x) against every column (y), each a (W,) @ (W x N) product
+        count = mx @ m
+        sum_x = x @ m
+        sum_xx = (x * x) @ m
+        sum_y = mx @ others
+        sum_yy = mx @ (others * others)
+        sum_xy = x @ others
+        return _correlation_from_sums(
+            *(moment[None, :] for moment in (count, sum_x, sum_y, sum_xx, sum_yy, sum_xy)),
+            shift[column:column + 1], shift
+        ).ravel()
@@ -0,0 +1,53 @@
+import os
+import glob
+import time
+import shutil
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+"""
+The purpose of this file is the part directory layout shared by the stages that keep numpy arrays next to the summary
+tables (the neighbour index and the correlation archive). Each stage has its own directory inside the store, with one
+part directory per append and window:
+<stage dir>/window=<W>/<write stamp>-<first date>_<last date>/
+holding one .npy file per array, so they can be opened with np.load(mmap_mode="r").
+Parts are written to a "."-prefixed temporary directory and renamed into place (write_part), so readers never see a
+half written part and the leftovers of killed runs are easy to find (remove_partial_parts). Like the summary tables a
+date written more than once keeps the part with the highest write stamp.
+"""
+
+#Write stamp for the next part of a stage, increasing even if the clock does not move between two appends
+def next_write_stamp(store_dir: str, stage_dir: str) -> int:
+    names = [os.path.basename(path) for path in glob.glob(os.path.join(store_dir, stage_dir, "window=*", "[0-9]*"))]
+    return max([time.time_ns()] + [int(name[:20]) + 1 for name in names if name[:20].isdigit()])
+
+#Part directory of a window: 20 digit write stamp, then the date range (same naming as the summary tables' part files)
+def part_dir(store_dir: str, stage_dir: str, window: int, write_stamp: int, dates: np.ndarray) -> str:
+    first, last = pd.Timestamp(dates.min()).strftime('%Y-%m-%d'), pd.Timestamp(dates.max()).strftime('%Y-%m-%d')
+    return os.path.join(store_dir, stage_dir, f"window={int(window)}", f"{write_stamp:020d}-{first}_{last}")
+
+#Yields a temporary directory next to part_path and renames it onto part_path once the block finishes without an error
+@contextmanager
+def write_part(part_path: str):
+    window_dir, name = os.path.split(part_path)
+    temp_dir = os.path.join(window_dir, f".{name}.tmp-{os.getpid()}")
+    os.makedirs(temp_dir, exist_ok=True)
+    try:
+        yield temp_dir
+        os.replace(temp_dir, part_path)
+    finally:
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+#Part directories of one window in write order (".tmp" leftovers of killed runs are skipped)
+def list_parts(store_dir: str, stage_dir: str, window: int) -> list:
+    window_dir = os.path.join(store_dir, stage_dir, f"window={int(window)}")
+    return sorted(path for path in glob.glob(os.path.join(window_dir, "[0-9]*")) if os.path.isdir(path))
+
+#Removes leftover temporary part directories of killed runs, returns their paths
+def remove_partial_parts(store_dir: str, stage_dir: str) -> list:
+    removed = glob.glob(os.path.join(store_dir, stage_dir, "window=*", ".*.tmp-*"))
+    for path in removed:
+        shutil.rmtree(path, ignore_errors=True)
+    return removed
@@ -0,0 +1,144 @@
+import os
+import json
+import shutil
+import hashlib
+import zipfile
+import numpy as np
+import pandas as pd
+
+"""
+The purpose of this file is to keep the float32 Date x Ticker return matrix on disk so a run does not have to repeat
+data_load_zip and daily_return_matrix when the input archive has not changed.
+
+Each cache entry is a directory named after its key holding raw .npy files:
+- values.npy   float32 (dates x tickers) return matrix, C order so a window of dates is one contiguous slice
+- dates.npy    datetime64[ns] row index
+- tickers.npy  ticker names (fixed width unicode, no pickling needed to read them back)
+- meta.json    archive path, load parameters and matrix shape, for humans
+
+The key is a sha256 of the archive fingerprint, the load parameters and RETURN_CACHE_VERSION. The fingerprint hashes
+every member's name, uncompressed size and CRC-32 from the zip central directory, so it follows the contents of the
+archive without decompressing it (the CRCs are computed over the data when the zip is written).
+
+Entries are opened with np.load(mmap_mode="r"): the DataFrame handed back is a read-only view of the mapped file and
+worker processes can open the same entry and slice rows out of it (read_return_window) instead of having the matrix
+pickled into every task. Pages are shared through the OS page cache.
+"""
+
+RETURN_CACHE_DIR = "return_matrix_cache"
+RETURN_CACHE_VERSION = 1 #bump when the way returns are computed changes, old entries are then never matched
+RETURN_CACHE_ENTRIES = 4 #entries kept per cache directory, least recently used are removed first
+
+#sha256 over the (name, size, CRC-32) of every .csv member of the archive
+def archive_fingerprint(zip_path: str) -> str:
+    digest = hashlib.sha256()
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for info in sorted(zip_ref.infolist(), key=lambda info: info.filename):
+            if info.filename.endswith('.csv'):
+                digest.update(f"{info.filename}\0{info.file_size}\0{info.CRC:08x}\n".encode())
+    return digest.hexdigest()
+
+#Cache key for a return matrix built from zip_path with the given data_load_zip filters
+def return_cache_key(zip_path: str, start_date=None, end_date=None, tickers=None) -> str:
+    parameters = {
+        "version": RETURN_CACHE_VERSION,
+        "archive": archive_fingerprint(zip_path),
+        "start_date": None if start_date is None else pd.Timestamp(start_date).isoformat(),
+        "end_date": None if end_date is None else pd.Timestamp(end_date).isoformat(),
+        "tickers": None if tickers is None else sorted(map(str, tickers)),
+    }
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+#Writes a return matrix as a cache entry. The files are written to a temporary directory first and moved into place,
+#so a reader never sees a half written entry
+def save_return_matrix(return_matrix: pd.DataFrame, entry_dir: str, meta: dict = None) -> str:
+    if os.path.isdir(entry_dir):
+        return entry_dir
+    parent = os.path.dirname(os.path.abspath(entry_dir))
+    os.makedirs(parent, exist_ok=True)
+    temp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    os.makedirs(temp_dir, exist_ok=True)
+
+    np.save(os.path.join(temp_dir, "values.npy"), np.ascontiguousarray(return_matrix.to_numpy(dtype=np.float32)))
+    np.save(os.path.join(temp_dir, "dates.npy"), return_matrix.index.to_numpy(dtype="datetime64[ns]"))
+    np.save(os.path.join(temp_dir, "tickers.npy"), np.asarray(return_matrix.columns.astype(str), dtype=str))
+    with open(os.path.join(temp_dir, "meta.json"), "w") as f:
+        json.dump({**(meta or {}), "shape": list(return_matrix.shape)}, f, indent=1)
+
+    try:
+        os.replace(temp_dir, entry_dir)
+    except OSError: #another process stored the same entry first
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return entry_dir
+
+#Maps a cache entry: (read-only float32 memmap, DatetimeIndex of dates, Index of tickers)
+def open_return_matrix(entry_dir: str) -> tuple:
+    values = np.load(os.path.join(entry_dir, "values.npy"), mmap_mode="r")
+    dates = pd.DatetimeIndex(np.load(os.path.join(entry_dir, "dates.npy")), name="Date")
+    tickers = pd.Index(np.load(os.path.join(entry_dir, "tickers.npy")).astype(object), name="Ticker")
+    return values, dates, tickers
+
+#The cached return matrix as a DataFrame backed by the mapping (no copy, read-only).
+#The entry path is kept in attrs so the orchestrator can hand workers the path instead of the rows (see cache_entry_of)
+def load_cached_return_matrix(entry_dir: str) -> pd.DataFrame:
+    values, dates, tickers = open_return_matrix(entry_dir)
+    return_matrix = pd.DataFrame(values, index=dates, columns=tickers, copy=False)
+    return_matrix.attrs["return_cache_entry"] = os.path.abspath(entry_dir)
+    return return_matrix
+
+#Cache entry holding exactly this return matrix (same dates and tickers), or None. attrs are carried over to slices
+#and copies, so the dates and tickers are checked before row offsets into the entry are trusted
+def cache_entry_of(return_matrix: pd.DataFrame):
+    entry_dir = return_matrix.attrs.get("return_cache_entry")
+    if entry_dir is None or not os.path.isdir(entry_dir):
+        return None
+    _, dates, tickers = open_return_matrix(entry_dir)
+    if not (dates.equals(return_matrix.index) and tickers.equals(return_matrix.columns.astype(str))):
+        return None
+    return entry_dir
+
+#Rows start:stop of a cached return matrix, for worker processes that are handed the entry path and row offsets
+def read_return_window(entry_dir: str, start: int, stop: int) -> np.ndarray:
+    return np.load(os.path.join(entry_dir, "values.npy"), mmap_mode="r")[start:stop]
+
+#Removes all but the `keep` most recently used entries (an entry's directory mtime is touched on every hit)
+def prune_return_cache(cache_dir: str, keep: int = RETURN_CACHE_ENTRIES):
+    if not os.path.isdir(cache_dir):
+        return
+    entries = [
+        os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+        if os.path.isfile(os.path.join(cache_dir, name, "values.npy"))
+    ]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for entry_dir in entries[keep:]:
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+"""
+Returns the return matrix for (zip_path, filters) from the cache, building it with build_fn() and storing it first on a
+miss. build_fn is called with no arguments and must return the float32 Date x Ticker DataFrame.
+The DataFrame returned is always the mapped (read-only) one, so hits and misses behave the same downstream.
+"""
+
+def cached_return_matrix(
+    zip_path: str,
+    build_fn,
+    start_date=None,
+    end_date=None,
+    tickers=None,
+    cache_dir: str = RETURN_CACHE_DIR,
+    keep: int = RETURN_CACHE_ENTRIES
+) -> pd.DataFrame:
+    key = return_cache_key(zip_path, start_date, end_date, tickers)
+    entry_dir = os.path.join(cache_dir, key)
+    if os.path.isdir(entry_dir):
+        os.utime(entry_dir) #marks the entry as recently used
+    else:
+        meta = {
+            "zip_path": os.path.abspath(zip_path),
+            "start_date": None if start_date is None else str(start_date),
+            "end_date": None if end_date is None else str(end_date),
+            "tickers": None if tickers is None else sorted(map(str, tickers)),
+        }
+        save_return_matrix(build_fn(), entry_dir, meta)
+        prune_return_cache(cache_dir, keep)
+    return load_cached_return_matrix(entry_dir)
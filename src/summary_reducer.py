@@ -0,0 +1,422 @@
+import heapq
+import numpy as np
+import pandas as pd
+
+from src.neighbour_index import NeighbourReducer
+from src.correlation_archive import quantize_correlations, pair_count
+from src.correlation_change import ChangeReducer
+from src.instrumentation import span
+
+"""
+The purpose of this file is to reduce a daily correlation matrix to its summary statistics without ever building the
+12.5M element upper triangle (at 5000 tickers) or the matching list of ticker pair tuples.
+
+The matrix is walked in tiles (usually blocks of whole rows). Only the upper triangle (column > row) of each tile is
+used and it is folded into running state:
+- count, mean and M2 (Chan's parallel variance update, in float64) for the mean and standard deviation
+- a count of |correlation| > 0.7
+- the 50 bin histogram over [-1, 1] used for the entropy (summed from the fine median histogram below, whose bins
+  split each of the 50 bins evenly)
+- bounded heaps of (key, row, col) for the closest to zero, closest to +-1 and most negative pairs.
+  Each tile first narrows itself to its own k best with argpartition, so only k candidates per tile touch the heaps.
+  The (row, col) of a value is only worked out for those candidates, from the tile's mask of kept values
+Ticker names are only looked up for the final winners.
+
+Median: a fine histogram (MEDIAN_BINS bins over [-1, 1]) is kept alongside. On its own it gives the median to within one
+fine bin width (2 / MEDIAN_BINS = 1.25e-4). For the exact median the values inside the bin(s) holding the middle rank(s)
+are needed, a few thousand values, then selected exactly. They are collected during the same walk: the reducer keeps
+every value inside a band of whole fine bins, which starts as all of [-1, 1] and is narrowed around the running median
+bin(s) whenever it holds more than median_band values. The band only ever narrows, so every value inside it has been
+kept, and the histogram gives the exact count below it. If the final median bin(s) are inside the band the median
+comes from the kept values; otherwise (the running median drifted out of the band, unusual for a walk over blocks
+of rows) the tiles are walked a second time for the values in the median bin(s). Tiles reduced elsewhere
+(src/tiled_summary.py) each keep a band around their own median; the merged reducer takes the median bin(s) from the
+bands that cover them (band_candidates) and only the tiles whose band does not are reduced a second time.
+Peak memory is O(tile) for the walk plus O(k + MEDIAN_BINS + median_band) for the state.
+
+NaN correlations (tickers with no overlapping data or constant prices) are left out of every statistic.
+Reducers over disjoint tiles can be combined with merge, so the same state works for tiles reduced in other processes.
+"""
+
+HISTOGRAM_BINS = 50
+MEDIAN_BINS = HISTOGRAM_BINS * 320
+MEDIAN_BAND = 2**20 #values kept for the one pass exact median before the band is narrowed (4MB of float32)
+HIGH_CORRELATION = 0.7
+TOP_PAIRS = 20
+NEGATIVE_PAIRS = 5
+
+#Bin index of each value for a histogram with `bins` equal bins over [-1, 1] (1.0 goes in the last bin like np.histogram)
+def _bin_index(values: np.ndarray, bins: int) -> np.ndarray:
+    index = ((values.astype(np.float64, copy=False) + 1) * (bins / 2)).astype(np.int64)
+    return np.clip(index, 0, bins - 1, out=index)
+
+#float32 bounds (low, high) of the values _bin_index puts in the fine bins first_bin..last_bin, so a band of bins can be
+#cut from float32 values with two comparisons (the bin index only grows with the value)
+def _bin_limits(first_bin: int, last_bin: int) -> tuple:
+    #float32 values in order as integers: the sign bit flips the order of the negative half
+    def to_float(key):
+        bits = key if key >= 0 else (-key) | -2**31
+        return np.array([bits], dtype=np.int32).view(np.float32)[0]
+    def smallest_in(bin_number):
+        if bin_number == 0:
+            return np.float32(-np.inf)
+        low, high = -int(np.float32(2).view(np.int32)), int(np.float32(2).view(np.int32)) #keys of -2 and 2
+        while low < high:
+            middle = (low + high) // 2
+            if _bin_index(np.array([to_float(middle)]), MEDIAN_BINS)[0] >= bin_number:
+                high = middle
+            else:
+                low = middle + 1
+        return to_float(low)
+    if last_bin == MEDIAN_BINS - 1:
+        return smallest_in(first_bin), np.float32(np.inf)
+    return smallest_in(first_bin), np.nextafter(smallest_in(last_bin + 1), np.float32(-np.inf))
+
+
+"""
+Keeps the k smallest keys seen so far with the (row, col, correlation) they came from.
+heapq is a min-heap, so keys are stored negated and the root is the worst of the current k.
+"""
+
+class BoundedPairHeap:
+
+    def __init__(self, k: int):
+        self.k = k
+        self.heap = []
+
+    #positions(indices) returns the (rows, cols) of the values at those indices, only called for the tile's k best
+    def push_many(self, keys: np.ndarray, values: np.ndarray, positions):
+        if len(keys) > self.k: #narrow the tile to its own k best before touching the heap
+            best = np.argpartition(keys, self.k - 1)[:self.k]
+            keys, values = keys[best], values[best]
+        else:
+            best = np.arange(len(keys))
+        rows, cols = positions(best)
+        for entry in zip((-keys).tolist(), rows.tolist(), cols.tolist(), values.tolist()):
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, entry)
+            elif entry > self.heap[0]:
+                heapq.heapreplace(self.heap, entry)
+
+    def merge(self, other: "BoundedPairHeap"):
+        for entry in other.heap:
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, entry)
+            elif entry > self.heap[0]:
+                heapq.heapreplace(self.heap, entry)
+
+    #(row, col, correlation) from best to worst
+    def winners(self) -> list:
+        return [(row, col, value) for _, row, col, value in sorted(self.heap, reverse=True)]
+
+
+class CorrelationSummaryReducer:
+
+    def __init__(self, top_pairs: int = TOP_PAIRS, negative_pairs: int = NEGATIVE_PAIRS, median_band: int = 0):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.above_threshold = 0
+        self.median_histogram = np.zeros(MEDIAN_BINS, dtype=np.int64)
+        self.closest_to_zero = BoundedPairHeap(top_pairs)
+        self.closest_to_one = BoundedPairHeap(top_pairs)
+        self.most_negative = BoundedPairHeap(negative_pairs)
+        self.median_candidates = None #values in the median bin(s), filled by update_median or median_from_band
+        self.median_band = median_band #values kept inside the band before it is narrowed, 0 keeps no band
+        self.band = (0, MEDIAN_BINS - 1) #first and last fine bin of the band, None once the median left it
+        self.band_limits = _bin_limits(*self.band)
+        self.band_values = []
+        self.band_count = 0
+        self.changes = None #day-over-day changes against the previous window, filled by update_changes
+
+    #50 bin histogram for the entropy, each of its bins is MEDIAN_BINS // HISTOGRAM_BINS fine bins
+    @property
+    def histogram(self) -> np.ndarray:
+        return self.median_histogram.reshape(HISTOGRAM_BINS, -1).sum(axis=1)
+
+    #Upper triangle values of a tile (NaNs dropped, row by row) and the mask they were taken with
+    @staticmethod
+    def _upper_triangle(tile: np.ndarray, row_start: int, col_start: int):
+        rows = np.arange(row_start, row_start + tile.shape[0])
+        cols = np.arange(col_start, col_start + tile.shape[1])
+        keep = cols[None, :] > rows[:, None]
+        keep &= ~np.isnan(tile)
+        return tile[keep], keep
+
+    #Global (row, col) of the values at `indices` of tile[keep], without building index arrays for the whole tile
+    @staticmethod
+    def _positions(keep: np.ndarray, row_ends: np.ndarray, indices: np.ndarray, row_start: int, col_start: int):
+        rows = np.searchsorted(row_ends, indices, side="right")
+        offsets = indices - np.concatenate([[0], row_ends])[rows]
+        cols = np.array([np.flatnonzero(keep[row])[offset] for row, offset in zip(rows, offsets)], dtype=np.int64)
+        return rows + row_start, cols + col_start
+
+    #Folds one tile of the correlation matrix into the running state
+    def update(self, tile: np.ndarray, row_start: int, col_start: int = 0):
+        with span("triu", "reducer"):
+            values, keep = self._upper_triangle(tile, row_start, col_start)
+        if len(values) == 0:
+            return
+        row_ends = np.cumsum(np.count_nonzero(keep, axis=1))
+        def positions(indices):
+            return self._positions(keep, row_ends, indices, row_start, col_start)
+
+        #Chan et al. parallel update of count/mean/M2
+        with span("moments", "reducer"):
+            values64 = values.astype(np.float64)
+            tile_count = len(values64)
+            tile_mean = values64.mean()
+            tile_m2 = ((values64 - tile_mean) ** 2).sum()
+            delta = tile_mean - self.mean
+            total = self.count + tile_count
+            self.mean += delta * tile_count / total
+            self.m2 += tile_m2 + delta ** 2 * self.count * tile_count / total
+            self.count = total
+
+        with span("histogram", "reducer"):
+            abs_values = np.abs(values)
+            self.above_threshold += int(np.count_nonzero(abs_values > HIGH_CORRELATION))
+            bins = _bin_index(values64, MEDIAN_BINS)
+            self.median_histogram += np.bincount(bins, minlength=MEDIAN_BINS)
+            if self.median_band and self.band is not None:
+                low, high = self.band_limits
+                inside = values[(values >= low) & (values <= high)]
+                self.band_values.append(inside)
+                self.band_count += len(inside)
+                if self.band_count > self.median_band:
+                    with span("median_band", "reducer"):
+                        self._narrow_band()
+
+        with span("top_pairs", "reducer"):
+            self.closest_to_zero.push_many(abs_values, values, positions)
+            self.closest_to_one.push_many(-abs_values, values, positions)
+            self.most_negative.push_many(values, values, positions)
+
+    #Folds the change of a tile against the same tile of the previous date's window (see src/correlation_change.py)
+    def update_changes(self, tile: np.ndarray, previous_tile: np.ndarray, row_start: int, col_start: int = 0,
+                       top_pairs: int = TOP_PAIRS):
+        if self.changes is None:
+            self.changes = ChangeReducer(top_pairs)
+        with span("changes", "reducer"):
+            self.changes.update(tile, previous_tile, row_start, col_start)
+
+    #Combines the state of a reducer that saw a disjoint set of tiles
+    def merge(self, other: "CorrelationSummaryReducer"):
+        if other.count:
+            delta = other.mean - self.mean
+            total = self.count + other.count
+            self.mean += delta * other.count / total
+            self.m2 += other.m2 + delta ** 2 * self.count * other.count / total
+            self.count = total
+        self.above_threshold += other.above_threshold
+        self.median_histogram += other.median_histogram
+        self.closest_to_zero.merge(other.closest_to_zero)
+        self.closest_to_one.merge(other.closest_to_one)
+        self.most_negative.merge(other.most_negative)
+        if other.median_candidates is not None:
+            mine = self.median_candidates if self.median_candidates is not None else other.median_candidates[:0]
+            self.median_candidates = np.concatenate([mine, other.median_candidates])
+        if other.changes is not None:
+            if self.changes is None:
+                self.changes = ChangeReducer(other.changes.top_pairs)
+            self.changes.merge(other.changes)
+
+    #Fine histogram bins holding the middle rank(s) and the number of values below the first of them
+    def _median_bins(self):
+        cumulative = np.cumsum(self.median_histogram)
+        low_rank, high_rank = (self.count - 1) // 2, self.count // 2
+        first_bin = int(np.searchsorted(cumulative, low_rank, side="right"))
+        last_bin = int(np.searchsorted(cumulative, high_rank, side="right"))
+        below = int(cumulative[first_bin - 1]) if first_bin else 0
+        return first_bin, last_bin, below
+
+    #Narrows the band to the fine bins around the running median bin(s) holding about a quarter of median_band values
+    def _narrow_band(self):
+        first_bin, last_bin = self._median_bins()[:2]
+        low, high = self.band
+        if first_bin < low or last_bin > high:
+            #values below the band were dropped earlier, an exact median now needs the second walk
+            self.band, self.band_values, self.band_count = None, [], 0
+            return
+        cumulative = np.concatenate([[0], np.cumsum(self.median_histogram)])
+        def held(radius):
+            return cumulative[min(last_bin + radius, high) + 1] - cumulative[max(first_bin - radius, low)]
+        radius = 0
+        for step in 2 ** np.arange(int(np.log2(MEDIAN_BINS)), -1, -1):
+            if held(radius + step) <= self.median_band // 4:
+                radius += step
+        self.band = (max(first_bin - radius, low), min(last_bin + radius, high))
+        self.band_limits = _bin_limits(*self.band)
+        values = np.concatenate(self.band_values)
+        values = values[(values >= self.band_limits[0]) & (values <= self.band_limits[1])]
+        self.band_values, self.band_count = [values], len(values)
+
+    #Kept values inside the fine bins first_bin..last_bin, None when those bins are not all inside the band
+    def band_candidates(self, first_bin: int, last_bin: int):
+        if not self.median_band or self.band is None or first_bin < self.band[0] or last_bin > self.band[1]:
+            return None
+        values = np.concatenate(self.band_values) if self.band_values else np.empty(0, dtype=np.float32)
+        low, high = _bin_limits(first_bin, last_bin)
+        return values[(values >= low) & (values <= high)]
+
+    #Fills median_candidates from the band kept during the walk, False when the median bin(s) are outside it
+    def median_from_band(self) -> bool:
+        if self.count == 0:
+            return False
+        candidates = self.band_candidates(*self._median_bins()[:2])
+        if candidates is None:
+            return False
+        self.median_candidates = candidates
+        return True
+
+    #Second pass over a tile: keeps only the values inside the median bin(s) for exact selection. bins is the
+    #(first, last) fine bin pair when the histogram is held elsewhere (a merged reducer in another process)
+    def update_median(self, tile: np.ndarray, row_start: int, col_start: int = 0, bins: tuple = None):
+        first_bin, last_bin = self._median_bins()[:2] if bins is None else bins
+        values, _ = self._upper_triangle(tile, row_start, col_start)
+        bins = _bin_index(values, MEDIAN_BINS)
+        selected = values[(bins >= first_bin) & (bins <= last_bin)]
+        if self.median_candidates is None:
+            self.median_candidates = selected
+        else:
+            self.median_candidates = np.concatenate([self.median_candidates, selected])
+
+    #Exact median if the second pass was run, otherwise interpolated inside the fine bin (error <= 2 / MEDIAN_BINS)
+    def median(self) -> float:
+        if self.count == 0:
+            return float("nan")
+        first_bin, last_bin, below = self._median_bins()
+        low_rank, high_rank = (self.count - 1) // 2, self.count // 2
+        if self.median_candidates is not None:
+            candidates = self.median_candidates
+            middle = np.partition(candidates, [low_rank - below, high_rank - below])
+            return float(np.float32((middle[low_rank - below] + middle[high_rank - below]) / 2))
+        width = 2 / MEDIAN_BINS
+        fraction = (low_rank - below + 0.5) / self.median_histogram[first_bin]
+        return -1 + width * (first_bin + fraction)
+
+    def entropy(self) -> float:
+        total = self.histogram.sum()
+        if total == 0:
+            return float("nan")
+        probabilities = self.histogram / total
+        probabilities = probabilities[probabilities > 0]
+        return float(-np.sum(probabilities * np.log2(probabilities)))
+
+    #Builds the same summary dictionary the pipeline has always saved, ticker names looked up for the winners only
+    def summary(self, tickers: np.ndarray, current_date: pd.Timestamp) -> dict:
+        def get_top_pairs(heap):
+            return [
+                {
+                    "ticker_1": tickers[row],
+                    "ticker_2": tickers[col],
+                    "correlation": value
+                }
+                for row, col, value in heap.winners()
+            ]
+
+        count = max(self.count, 1)
+        summary = {
+            "Date": current_date.strftime('%Y-%m-%d'),
+            "mean_correlation": float(self.mean) if self.count else float("nan"),
+            "median_correlation": self.median(),
+            "std_correlation": float(np.sqrt(self.m2 / count)) if self.count else float("nan"),
+            "pct_above_0.7": self.above_threshold / count,
+            "correlation_entropy": self.entropy(),
+            "top_20_closest_to_zero": get_top_pairs(self.closest_to_zero),
+            "top_20_closest_to_one": get_top_pairs(self.closest_to_one),
+            "top_5_most_negative": get_top_pairs(self.most_negative),
+        }
+        if self.changes is not None:
+            summary["changes"] = self.changes.summary(tickers)
+        return summary
+
+
+"""
+Reduces a correlation matrix to its summary by walking it in blocks of rows.
+tile_fn(row_start, row_stop) returns corr[row_start:row_stop, :], either sliced from an in-memory matrix or computed
+on demand (CorrelationWindow.tile), so only one block is alive at a time.
+Rows only need columns to their right, so each block starts at its first row's column.
+With neighbours > 0 the blocks are whole rows instead, every ticker's top peers are taken from them (NeighbourReducer)
+and the summary gets a "neighbours" entry: (most_index, most_correlation, least_index, least_correlation).
+With previous_tile_fn (the tile_fn of the previous date's window) each block is also computed for that window and the
+summary gets a "changes" entry with the `changes` pairs that moved most and the distribution of the moves
+(src/correlation_change.py).
+"""
+
+def reduce_correlation_blocks(
+    tile_fn,
+    n_columns: int,
+    tickers: np.ndarray,
+    current_date: pd.Timestamp,
+    block_rows: int = 256,
+    exact_median: bool = True, #exact median instead of the fine-histogram estimate (usually without a second walk)
+    neighbours: int = 0, #peers per ticker and side for the neighbour index (src/neighbour_index.py), 0 skips them
+    archive: str = None, #"int8" or "int16" keeps the quantized upper triangle (src/correlation_archive.py), None skips it
+    previous_tile_fn=None, #tile_fn of the previous date's window, None skips the day-over-day changes
+    changes: int = 0 #pairs kept with the largest change against the previous window
+) -> dict:
+    reducer = CorrelationSummaryReducer(median_band=MEDIAN_BAND if exact_median else 0)
+    neighbour_reducer = NeighbourReducer(n_columns, neighbours) if neighbours else None
+    triangle = np.empty(pair_count(n_columns), dtype=archive) if archive else None
+    offset = 0
+    for row_start in range(0, n_columns, block_rows):
+        row_stop = min(row_start + block_rows, n_columns)
+        if neighbour_reducer is None:
+            with span("correlation_tile", "correlation", rows=row_stop - row_start):
+                tile = tile_fn(row_start, row_stop, row_start)
+            with span("reduce_tile", "reducer"):
+                reducer.update(tile, row_start, row_start)
+        else:
+            #peers need whole rows, the summary only the part from the diagonal on
+            with span("correlation_tile", "correlation", rows=row_stop - row_start):
+                rows = tile_fn(row_start, row_stop, 0)
+            tile = rows[:, row_start:]
+            with span("reduce_tile", "reducer"):
+                reducer.update(tile, row_start, row_start)
+            with span("neighbours", "reducer"):
+                neighbour_reducer.update(rows, row_start)
+        if previous_tile_fn is not None:
+            with span("correlation_tile", "correlation", rows=row_stop - row_start):
+                previous_tile = previous_tile_fn(row_start, row_stop, row_start)
+            reducer.update_changes(tile, previous_tile, row_start, row_start, changes)
+        if triangle is not None:
+            #blocks of whole rows from the diagonal on, so their upper triangles follow each other in pair_index order
+            with span("archive", "reducer"):
+                values = tile[np.arange(tile.shape[1]) > np.arange(tile.shape[0])[:, None]]
+                triangle[offset:offset + len(values)] = quantize_correlations(values, archive)
+                offset += len(values)
+
+    with span("median_band", "reducer"):
+        from_band = exact_median and reducer.median_from_band()
+    if exact_median and reducer.count and not from_band:
+        with span("median_pass", "reducer"):
+            for row_start in range(0, n_columns, block_rows):
+                row_stop = min(row_start + block_rows, n_columns)
+                reducer.update_median(tile_fn(row_start, row_stop, row_start), row_start, row_start)
+
+    with span("summary", "reducer"):
+        summary = reducer.summary(tickers, current_date)
+    if neighbour_reducer is not None:
+        summary["neighbours"] = neighbour_reducer.arrays()
+    if triangle is not None:
+        summary["archive"] = triangle
+    return summary
+
+#Summary of an in-memory N x N correlation matrix
+def reduce_correlation_matrix(
+    corr_matrix: np.ndarray,
+    tickers: np.ndarray,
+    current_date: pd.Timestamp,
+    block_rows: int = 256,
+    neighbours: int = 0,
+    archive: str = None,
+    previous_tile_fn=None,
+    changes: int = 0
+) -> dict:
+    def tile_fn(row_start, row_stop, col_start):
+        return corr_matrix[row_start:row_stop, col_start:]
+    return reduce_correlation_blocks(
+        tile_fn, corr_matrix.shape[1], tickers, current_date, block_rows, neighbours=neighbours, archive=archive,
+        previous_tile_fn=previous_tile_fn, changes=changes
+    )
@@ -0,0 +1,493 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.helpers import pickle_load, atomic_path
+
+"""
+The purpose of this file is to store the daily correlation summaries in a columnar format (Parquet) instead of one pickle
+file per day. A store is a directory with two tables, both hive-partitioned by year:
+
+- stats/year=YYYY/<write stamp>-<first date>_<last date>.parquet
+    one row per date and window: Date, window, mean_correlation, median_correlation, std_correlation, pct_above_0.7,
+    correlation_entropy
+- top_pairs/year=YYYY/<write stamp>-<first date>_<last date>.parquet
+    one row per reported pair: Date, window, category, rank, ticker_1, ticker_2, correlation
+    category is the summary key the pair came from (e.g. "top_20_closest_to_one"), rank starts at 1
+Next to them:
+- group_correlations/year=YYYY/<write stamp>-<first date>_<last date>.parquet (only with a group mapping)
+    one row per date, window and pair of groups: Date, window, group_1, group_2, mean_correlation, pairs
+    (see src/group_correlation.py)
+- rollups/weekly.parquet, rollups/monthly.parquet, rollups/dates.parquet
+    the stats table downsampled per window for long chart ranges and the index of stored dates (see write_rollups),
+    rebuilt after every run
+
+window is the rolling window length in days the summary was computed over (a summary dictionary's "window" key).
+Part files written before summaries were tagged have no window column, their rows are read as LEGACY_WINDOW days.
+
+Writes are append-only: every call to append_summaries adds new part files and never rewrites old ones.
+If a (window, date) is written more than once the most recently written row (highest write stamp) wins when loading.
+The loaders only read the requested columns and prune partitions/row groups outside the requested date range.
+
+Crash safety: part files are written under a temporary "."-prefixed name (skipped by dataset scans) and renamed into
+place, so a killed run never leaves a truncated part file behind. Once both tables of an append are in place a line
+is added to journal.jsonl listing the dates and part files of that append. A date is complete only when its journal
+line exists and every file it lists can be read (see completed_dates), which is what resumed runs skip.
+"""
+
+STATS_TABLE = "stats"
+TOP_PAIRS_TABLE = "top_pairs"
+GROUP_TABLE = "group_correlations" #written by src/group_correlation.py when the pipeline runs with a group mapping
+INTERVAL_TABLE = "confidence_intervals" #written by src/approximate_summary.py when the pipeline runs in approximate mode
+CHANGE_TABLE = "correlation_changes" #written by src/correlation_change.py when the pipeline tracks day-over-day changes
+TOP_CHANGE_TABLE = "top_changes"
+STAT_COLUMNS = ["mean_correlation", "median_correlation", "std_correlation", "pct_above_0.7", "correlation_entropy"]
+TOP_PAIR_CATEGORIES = ["top_20_closest_to_zero", "top_20_closest_to_one", "top_5_most_negative"]
+LEGACY_WINDOW = 20 #window of summaries stored without one (the pipeline's window used to be fixed at 20 days)
+
+#Sorted list of window lengths from a single window or a list of them
+def window_lengths(window) -> list:
+    windows = [window] if isinstance(window, (int, np.integer)) else list(window)
+    if not windows or min(windows) < 2:
+        raise ValueError(f"Window lengths must be at least 2 days, got {window}")
+    return sorted(set(int(length) for length in windows))
+
+#Splits a list of summary dictionaries into the scalar stats table and the long top pairs table
+def summaries_to_tables(summaries: list) -> tuple:
+    stats = pd.DataFrame(
+        [
+            {
+                "Date": summary["Date"],
+                "window": summary.get("window", LEGACY_WINDOW),
+                **{column: summary[column] for column in STAT_COLUMNS}
+            }
+            for summary in summaries
+        ],
+        columns=["Date", "window"] + STAT_COLUMNS
+    )
+    stats["Date"] = pd.to_datetime(stats["Date"])
+    stats["window"] = stats["window"].astype("int16")
+
+    top_pairs = pd.DataFrame(
+        [
+            {
+                "Date": summary["Date"],
+                "window": summary.get("window", LEGACY_WINDOW),
+                "category": category,
+                "rank": rank,
+                "ticker_1": str(pair["ticker_1"]),
+                "ticker_2": str(pair["ticker_2"]),
+                "correlation": pair["correlation"]
+            }
+            for summary in summaries
+            for category in TOP_PAIR_CATEGORIES
+            for rank, pair in enumerate(summary.get(category, []), start=1)
+        ],
+        columns=["Date", "window", "category", "rank", "ticker_1", "ticker_2", "correlation"]
+    )
+    top_pairs["Date"] = pd.to_datetime(top_pairs["Date"])
+    top_pairs["window"] = top_pairs["window"].astype("int16")
+    top_pairs["rank"] = top_pairs["rank"].astype("int16")
+    top_pairs["correlation"] = top_pairs["correlation"].astype("float32")
+    return stats, top_pairs
+
+#Writes one table as new part files, one per year partition, and returns their paths
+def _append_table(df: pd.DataFrame, table_dir: str, write_stamp: int) -> list:
+    filenames = []
+    for year, part in df.groupby(df["Date"].dt.year):
+        partition_dir = os.path.join(table_dir, f"year={year}")
+        first, last = part["Date"].min().strftime('%Y-%m-%d'), part["Date"].max().strftime('%Y-%m-%d')
+        filename = os.path.join(partition_dir, f"{write_stamp:020d}-{first}_{last}.parquet")
+        with atomic_path(filename) as temp_path:
+            part.sort_values("Date").to_parquet(temp_path, engine="pyarrow", index=False)
+        filenames.append(filename)
+    return filenames
+
+#Write stamp for the next append, increasing even if the clock does not move between two appends
+def _next_write_stamp(store_dir: str) -> int:
+    latest = 0
+    for _, _, files in os.walk(store_dir):
+        for fname in files:
+            if fname.endswith(".parquet") and fname[:20].isdigit():
+                latest = max(latest, int(fname[:20]))
+    return max(time.time_ns(), latest + 1)
+
+#Appends a batch of summary dictionaries (as built by summarize_correlation_matrix) to the store
+def append_summaries(summaries: list, store_dir: str):
+    if not summaries:
+        return
+    stats, top_pairs = summaries_to_tables(summaries)
+    write_stamp = _next_write_stamp(store_dir)
+    filenames = _append_table(stats, os.path.join(store_dir, STATS_TABLE), write_stamp)
+    filenames += _append_table(top_pairs, os.path.join(store_dir, TOP_PAIRS_TABLE), write_stamp)
+    _journal_append(store_dir, {
+        "write_stamp": write_stamp,
+        "dates": sorted(stats["Date"].dt.strftime('%Y-%m-%d').unique().tolist()),
+        "windows": sorted(int(window) for window in stats["window"].unique()),
+        "files": [os.path.relpath(filename, store_dir) for filename in filenames]
+    })
+
+#Arrow filters for a date range: one on the year partition (skips whole directories), one on Date (skips row groups)
+def _date_filters(start_date=None, end_date=None):
+    partition_filter = date_filter = None
+    for bound, year_test, date_test in [
+        (start_date, lambda year: ds.field("year") >= year, lambda date: ds.field("Date") >= date),
+        (end_date, lambda year: ds.field("year") <= year, lambda date: ds.field("Date") <= date)
+    ]:
+        if bound is None:
+            continue
+        bound = pd.Timestamp(bound)
+        year_expression, date_expression = year_test(bound.year), date_test(bound)
+        partition_filter = year_expression if partition_filter is None else partition_filter & year_expression
+        date_filter = date_expression if date_filter is None else date_filter & date_expression
+    return partition_filter, date_filter
+
+#Arrow filter keeping one window, untagged (legacy) rows count as LEGACY_WINDOW
+def _window_filter(window):
+    if window is None:
+        return None
+    expression = ds.field("window") == int(window)
+    return expression | ds.field("window").is_null() if int(window) == LEGACY_WINDOW else expression
+
+#Reads the requested columns of the part files that can hold the date range, oldest write first.
+#Files without a window column are read against the table schema with the column added, which fills it with nulls
+def _load_table(table_dir: str, columns: list, start_date=None, end_date=None, window=None) -> pd.DataFrame:
+    if not os.path.isdir(table_dir):
+        return pd.DataFrame(columns=columns)
+    dataset = ds.dataset(table_dir, format="parquet", partitioning="hive")
+    if "window" not in dataset.schema.names:
+        schema = dataset.schema.append(pa.field("window", pa.int16()))
+        dataset = ds.dataset(table_dir, format="parquet", partitioning="hive", schema=schema)
+    partition_filter, date_filter = _date_filters(start_date, end_date)
+    window_filter = _window_filter(window)
+    if window_filter is not None:
+        date_filter = window_filter if date_filter is None else date_filter & window_filter
+    fragments = sorted(dataset.get_fragments(filter=partition_filter), key=lambda fragment: os.path.basename(fragment.path))
+    tables = [fragment.to_table(schema=dataset.schema, columns=columns, filter=date_filter) for fragment in fragments]
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    df = pa.concat_tables(tables).to_pandas()
+    if "window" in columns:
+        df["window"] = df["window"].fillna(LEGACY_WINDOW).astype("int16")
+    return df
+
+#Loads the scalar stats table sorted by window then date, one row per window and date. Returns Date, window and every
+#stat by default, or Date plus the requested columns. window=None loads every window in the store
+def load_summary_stats(store_dir: str, columns: list = None, start_date=None, end_date=None, window=None) -> pd.DataFrame:
+    wanted = ["Date", "window"] + STAT_COLUMNS if columns is None else ["Date"] + [c for c in columns if c != "Date"]
+    read = ["Date", "window"] + [column for column in wanted if column not in ("Date", "window")]
+    stats = _load_table(os.path.join(store_dir, STATS_TABLE), read, start_date, end_date, window)
+    stats = stats.drop_duplicates(subset=["window", "Date"], keep="last")
+    return stats.sort_values(["window", "Date"]).reset_index(drop=True)[wanted]
+
+#Loads the top pairs for a date range (or a single date when only start_date is given), for one window or all of them
+def load_top_pairs(store_dir: str, start_date, end_date=None, categories: list = None, window=None) -> pd.DataFrame:
+    columns = ["Date", "window", "category", "rank", "ticker_1", "ticker_2", "correlation"]
+    start_date = pd.Timestamp(start_date).normalize() #summaries are stored at day resolution
+    end_date = start_date if end_date is None else end_date
+    top_pairs = _load_table(os.path.join(store_dir, TOP_PAIRS_TABLE), columns, start_date, end_date, window)
+    if categories is not None:
+        top_pairs = top_pairs[top_pairs["category"].isin(categories)]
+    top_pairs = top_pairs.drop_duplicates(subset=["window", "Date", "category", "rank"], keep="last")
+    return top_pairs.sort_values(["window", "Date", "category", "rank"]).reset_index(drop=True)
+
+#(Date, window) of every stored summary, from the date index written with the rollups when it is up to date
+def _date_index(store_dir: str) -> pd.DataFrame:
+    filename = os.path.join(store_dir, ROLLUP_DIR, "dates.parquet")
+    if _rollup_is_fresh(store_dir, filename):
+        return pd.read_parquet(filename, engine="pyarrow")
+    return load_summary_stats(store_dir, columns=["window"])
+
+#Dates already in the store (for any window unless one is given)
+def stored_dates(store_dir: str, window=None) -> pd.DatetimeIndex:
+    index = _date_index(store_dir)
+    if window is not None:
+        index = index[index["window"] == int(window)]
+    return pd.DatetimeIndex(sorted(index["Date"].unique()))
+
+#Window lengths present in the store
+def stored_windows(store_dir: str) -> list:
+    return sorted(int(window) for window in _date_index(store_dir)["window"].unique())
+
+"""
+Rollups: the stats table downsampled to one row per window and week or month, so charts over long ranges (20+ years is
+~5000 daily points per window) read a few hundred rows instead of every day. Each rollup row holds the mean of every
+stat over the period, the number of days behind it and Date = the last stored date of the period.
+write_rollups rebuilds them from the stats table into rollups/<name>.parquet (the orchestrator calls it after a run),
+together with rollups/dates.parquet, the (Date, window) of every summary, which stored_dates and stored_windows read
+instead of scanning every part file.
+load_rollup reads that file, or computes the rollup from the stats table when the file is missing or older than the
+journal (summaries were appended after it was written), so a reader never sees stale or missing periods. The same
+check makes stored_dates fall back to the stats table.
+"""
+
+ROLLUP_DIR = "rollups"
+ROLLUP_FREQUENCIES = {"weekly": "W-FRI", "monthly": "M"} #rollup name -> pandas period frequency
+MAX_CHART_POINTS = 1000 #load_summary_series picks the finest resolution with at most this many points per window
+
+#Rollup of a stats table (as returned by load_summary_stats) for one of ROLLUP_FREQUENCIES
+def compute_rollup(stats: pd.DataFrame, frequency: str) -> pd.DataFrame:
+    columns = ["Date", "window", "days"] + STAT_COLUMNS
+    if stats.empty:
+        return pd.DataFrame(columns=columns)
+    periods = stats["Date"].dt.to_period(ROLLUP_FREQUENCIES[frequency]).rename("period")
+    rollup = stats.groupby([stats["window"], periods]).agg(
+        Date=("Date", "max"),
+        days=("Date", "size"),
+        **{column: (column, "mean") for column in STAT_COLUMNS}
+    )
+    rollup = rollup.reset_index()[columns]
+    rollup["days"] = rollup["days"].astype("int16")
+    return rollup.sort_values(["window", "Date"]).reset_index(drop=True)
+
+#True when a file under rollups/ was written after the last append to the store
+def _rollup_is_fresh(store_dir: str, filename: str) -> bool:
+    journal = os.path.join(store_dir, JOURNAL_FILE)
+    return os.path.exists(filename) and (
+        not os.path.exists(journal) or os.path.getmtime(filename) >= os.path.getmtime(journal)
+    )
+
+#Rebuilds every rollup and the (Date, window) index of stored summaries from the stats table, returns the files written
+def write_rollups(store_dir: str) -> list:
+    stats = load_summary_stats(store_dir)
+    filenames = [os.path.join(store_dir, ROLLUP_DIR, "dates.parquet")]
+    with atomic_path(filenames[0]) as temp_path:
+        stats[["Date", "window"]].to_parquet(temp_path, engine="pyarrow", index=False)
+    for frequency in ROLLUP_FREQUENCIES:
+        filename = os.path.join(store_dir, ROLLUP_DIR, f"{frequency}.parquet")
+        with atomic_path(filename) as temp_path:
+            compute_rollup(stats, frequency).to_parquet(temp_path, engine="pyarrow", index=False)
+        filenames.append(filename)
+    return filenames
+
+#Loads one rollup ("weekly" or "monthly") for a date range and window, sorted by window then Date
+def load_rollup(store_dir: str, frequency: str, start_date=None, end_date=None, window=None) -> pd.DataFrame:
+    if frequency not in ROLLUP_FREQUENCIES:
+        raise ValueError(f"Unknown rollup '{frequency}', expected one of {list(ROLLUP_FREQUENCIES)}")
+    filename = os.path.join(store_dir, ROLLUP_DIR, f"{frequency}.parquet")
+    if _rollup_is_fresh(store_dir, filename):
+        rollup = pd.read_parquet(filename, engine="pyarrow")
+        if window is not None:
+            rollup = rollup[rollup["window"] == int(window)]
+    else:
+        #whole periods are needed, so the stats are read from the start of the first period on
+        start = None if start_date is None else pd.Timestamp(start_date).to_period(ROLLUP_FREQUENCIES[frequency]).start_time
+        rollup = compute_rollup(load_summary_stats(store_dir, start_date=start, end_date=end_date, window=window), frequency)
+    if start_date is not None:
+        rollup = rollup[rollup["Date"] >= pd.Timestamp(start_date)]
+    if end_date is not None:
+        rollup = rollup[rollup["Date"] <= pd.Timestamp(end_date)]
+    return rollup.reset_index(drop=True)
+
+"""
+Chart data for one window and date range at the finest resolution that keeps at most max_points points: the daily
+stats, else the weekly rollup, else the monthly one. Returns (resolution, DataFrame indexed by Date with STAT_COLUMNS).
+dates is the window's DatetimeIndex of stored dates (stored_dates), used to count the days in the range without
+reading them.
+"""
+
+def load_summary_series(
+    store_dir: str,
+    dates: pd.DatetimeIndex,
+    start_date=None,
+    end_date=None,
+    window=None,
+    max_points: int = MAX_CHART_POINTS
+) -> tuple:
+    first = 0 if start_date is None else dates.searchsorted(pd.Timestamp(start_date), side="left")
+    last = len(dates) if end_date is None else dates.searchsorted(pd.Timestamp(end_date), side="right")
+    days = max(last - first, 0)
+    if days <= max_points:
+        series = load_summary_stats(store_dir, STAT_COLUMNS, start_date, end_date, window)
+        return "daily", series.set_index("Date")
+    resolution = "weekly" if days / 5 + 1 <= max_points else "monthly" #+ 1 for a partial week at either end
+    series = load_rollup(store_dir, resolution, start_date, end_date, window)
+    return resolution, series.set_index("Date")[STAT_COLUMNS]
+
+"""
+Progress journal: one JSON line per append_summaries call, written after the part files are in place. A line cut off
+by a crash is ignored. completed_dates only trusts dates whose part files all still exist and have a readable Parquet
+footer, so missing or corrupt files make their dates count as not done.
+"""
+
+JOURNAL_FILE = "journal.jsonl"
+QUARANTINE_DIR = "_quarantine" #"_" prefix keeps it out of dataset scans
+
+def _journal_append(store_dir: str, record: dict):
+    with open(os.path.join(store_dir, JOURNAL_FILE), "a") as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+#Journal records in write order, skipping a torn last line
+def read_journal(store_dir: str) -> list:
+    path = os.path.join(store_dir, JOURNAL_FILE)
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+#True when path is a complete Parquet file (the footer is written last, so a truncated file fails here)
+def _readable_parquet(path: str) -> bool:
+    try:
+        pq.read_metadata(path)
+        return True
+    except (OSError, pa.ArrowInvalid):
+        return False
+
+#Dates whose journal record is intact: every part file it lists exists and is readable.
+#With a window only records holding that window count (records written before windows were journalled are LEGACY_WINDOW)
+def completed_dates(store_dir: str, window=None) -> pd.DatetimeIndex:
+    checked = {}
+    dates = set()
+    for record in read_journal(store_dir):
+        if window is not None and int(window) not in record.get("windows", [LEGACY_WINDOW]):
+            continue
+        paths = [os.path.join(store_dir, path) for path in record["files"]]
+        for path in paths:
+            if path not in checked:
+                checked[path] = os.path.exists(path) and _readable_parquet(path)
+        if all(checked[path] for path in paths):
+            dates.update(record["dates"])
+    return pd.DatetimeIndex(sorted(dates))
+
+#Moves unreadable part files and leftover temporary files into _quarantine so loading the store cannot fail on them.
+#Returns the paths that were moved (relative to the store)
+def repair_store(store_dir: str) -> list:
+    moved = []
+    for table in [STATS_TABLE, TOP_PAIRS_TABLE, GROUP_TABLE, INTERVAL_TABLE, CHANGE_TABLE, TOP_CHANGE_TABLE]:
+        for root, _, files in os.walk(os.path.join(store_dir, table)):
+            for fname in files:
+                path = os.path.join(root, fname)
+                leftover = fname.startswith(".") and ".tmp-" in fname
+                if leftover or (fname.endswith(".parquet") and not _readable_parquet(path)):
+                    relative = os.path.relpath(path, store_dir)
+                    target = os.path.join(store_dir, QUARANTINE_DIR, relative)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(path, target)
+                    moved.append(relative)
+    return moved
+
+"""
+The manifest records how the summaries in a store were produced so incremental runs can tell when old summaries are
+still valid: window lengths, ticker universe (list and sha256 hash), summary code version, the settings of the optional
+stages (stage_settings) and the last summarised date.
+"""
+
+MANIFEST_FILE = "manifest.json"
+
+#sha256 of the sorted ticker names
+def ticker_universe_hash(tickers) -> str:
+    return hashlib.sha256("\n".join(sorted(str(ticker) for ticker in tickers)).encode()).hexdigest()
+
+#Settings of the optional stages that decide what a store holds for every date: neighbour peers per side, the group
+#mapping (sha256 of its sorted Ticker,Group lines, None without one), archive type and changed pairs kept per day
+def stage_settings(neighbours: int = 0, groups=None, archive: str = None, changes: int = 0) -> dict:
+    groups_hash = None
+    if groups is not None:
+        lines = sorted(f"{ticker},{group}" for ticker, group in pd.Series(groups).items())
+        groups_hash = hashlib.sha256("\n".join(lines).encode()).hexdigest()
+    return {"neighbours": int(neighbours), "groups_hash": groups_hash, "archive": archive, "changes": int(changes)}
+
+#last_date=None marks a run that has started but not finished (written before the first summary, so a resumed run can
+#check it is continuing the same windows, universe and code version). window is one length or a list of them.
+#approximate is the number of sampled pairs of an approximate run (see src/approximate_summary.py), 0 for exact ones,
+#stages the stage_settings of the run (None for none of the optional stages). tickers=None records an unknown universe
+#(stores converted from pickles, which do not list it), the next run extending the store records its own
+def write_manifest(store_dir: str, window, tickers, code_version, last_date, approximate: int = 0, stages: dict = None):
+    manifest = {
+        "windows": window_lengths(window),
+        "code_version": code_version,
+        "approximate": int(approximate),
+        "stages": stage_settings() if stages is None else stages,
+        "ticker_universe_hash": None if tickers is None else ticker_universe_hash(tickers),
+        "tickers": None if tickers is None else sorted(str(ticker) for ticker in tickers),
+        "last_date": None if last_date is None else pd.Timestamp(last_date).strftime('%Y-%m-%d'),
+    }
+    with atomic_path(os.path.join(store_dir, MANIFEST_FILE)) as temp_path:
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f, indent=1)
+
+#Returns the manifest dictionary, or None for stores written before manifests existed.
+#Manifests from single window runs ("window": n) are returned with "windows": [n], ones from before approximate runs
+#with "approximate": 0 and ones from before stage settings were recorded with the settings of no optional stage
+def read_manifest(store_dir: str):
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if "windows" not in manifest:
+        manifest["windows"] = window_lengths(manifest.pop("window"))
+    manifest.setdefault("approximate", 0)
+    manifest.setdefault("stages", stage_settings())
+    return manifest
+
+"""
+One-shot converter for a directory of correlation_summary_YYYY-MM-DD.pkl files written by earlier versions.
+Pickles are converted in chunks so the store gets a handful of part files rather than one per day.
+Set remove_pickles=True to delete each pickle once its chunk has been written.
+Every chunk is journalled like any other append, and with code_version (the SUMMARY_CODE_VERSION the pickles were
+written with) a finished manifest is written too, so the converted store can be resumed and extended by incremental
+runs. The pickles do not record the ticker universe: pass tickers if it is known, otherwise the manifest leaves it
+unknown and the first run extending the store records its own.
+"""
+
+def convert_pickle_directory(
+    pickle_dir: str,
+    store_dir: str = None,
+    chunk_size: int = 250,
+    remove_pickles: bool = False,
+    code_version=None,
+    tickers=None
+):
+    store_dir = pickle_dir if store_dir is None else store_dir
+    filenames = sorted(fname for fname in os.listdir(pickle_dir) if fname.endswith(".pkl"))
+
+    skipped = []
+    windows, dates = set(), []
+    for i in range(0, len(filenames), chunk_size):
+        chunk = [os.path.join(pickle_dir, fname) for fname in filenames[i:i + chunk_size]]
+        summaries = []
+        for path in chunk:
+            try:
+                summaries.append(pickle_load(path))
+            except (EOFError, pickle.UnpicklingError): #truncated by a killed writer, the date has to be recomputed
+                skipped.append(os.path.basename(path))
+        append_summaries(summaries, store_dir)
+        for summary in summaries:
+            windows.add(int(summary.get("window", LEGACY_WINDOW)))
+            dates.append(pd.Timestamp(summary["Date"]))
+        if remove_pickles:
+            for path in chunk:
+                if os.path.basename(path) not in skipped:
+                    os.remove(path)
+
+    if code_version is not None and dates:
+        write_manifest(store_dir, sorted(windows), tickers, code_version, max(dates))
+    write_rollups(store_dir)
+    print(f"Converted {len(filenames) - len(skipped)} pickle files into {store_dir}")
+    if skipped:
+        print(f"Skipped {len(skipped)} unreadable pickle files (recompute those dates with --resume): {', '.join(skipped)}")
+
+if __name__ == "__main__":
+    import sys
+    from src.correlation import SUMMARY_CODE_VERSION
+    convert_pickle_directory(
+        sys.argv[1] if len(sys.argv) > 1 else "daily_correlations_summary_stats",
+        remove_pickles=True,
+        code_version=SUMMARY_CODE_VERSION
+    )
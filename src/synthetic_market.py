@@ -0,0 +1,97 @@
+import os
+import string
+import zipfile
+import numpy as np
+import pandas as pd
+
+"""
+The purpose of this file is to generate seeded synthetic stock prices shaped like the real data set, so benchmarks and
+tests can run without the private stock_data.zip.
+
+Returns follow a factor model: every ticker loads on a market factor and on one of n_factors sector factors, plus its
+own noise, which gives realistic positive average correlation with clusters of highly correlated pairs.
+r[t, i] = beta_i * market[t] + gamma_i * sector[t, s(i)] + noise[t, i]
+Prices are 100 * cumulative product of (1 + r). A share nan_density of prices is then set to NaN at random, the loader
+drops those rows just like missing prices in the real files.
+
+Everything is drawn from one numpy Generator seeded with `seed`, so the same arguments always give the same prices.
+"""
+
+MARKET_VOLATILITY = 0.01
+SECTOR_VOLATILITY = 0.008
+NOISE_VOLATILITY = 0.015
+
+#n distinct tickers of 1-5 upper case letters: A..Z, AA..ZZ, ... in order
+def ticker_names(n_tickers: int) -> list:
+    names = []
+    length = 1
+    while len(names) < n_tickers:
+        for i in range(min(26 ** length, n_tickers - len(names))):
+            letters = []
+            for _ in range(length):
+                i, remainder = divmod(i, 26)
+                letters.append(string.ascii_uppercase[remainder])
+            names.append("".join(reversed(letters)))
+        length += 1
+    return names
+
+#Date x Ticker matrix of daily simple returns from the factor model (no missing values)
+def generate_returns(
+    n_tickers: int,
+    n_days: int,
+    n_factors: int = 10, #sector factors, each ticker loads on one of them
+    seed: int = 0,
+    start_date: str = "2019-01-02"
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0, MARKET_VOLATILITY, (n_days, 1))
+    sectors = rng.normal(0, SECTOR_VOLATILITY, (n_days, max(n_factors, 1)))
+    sector_of = rng.integers(0, max(n_factors, 1), n_tickers)
+    beta = rng.uniform(0.5, 1.5, n_tickers)
+    gamma = rng.uniform(0.0, 1.5, n_tickers) if n_factors else np.zeros(n_tickers)
+    noise = rng.normal(0, NOISE_VOLATILITY, (n_days, n_tickers))
+
+    returns = market * beta + sectors[:, sector_of] * gamma + noise
+    dates = pd.bdate_range(start_date, periods=n_days, name="Date")
+    return pd.DataFrame(returns.astype("float32"), index=dates, columns=pd.Index(ticker_names(n_tickers), name="Ticker"))
+
+"""
+Long [Ticker, Date, Price] DataFrame in the layout data_load_zip returns, sorted by Ticker and Date.
+The first day of every ticker is its starting price, so n_days prices give n_days - 1 returns.
+"""
+
+def generate_prices(
+    n_tickers: int,
+    n_days: int,
+    nan_density: float = 0.01, #share of prices set to NaN
+    n_factors: int = 10,
+    seed: int = 0,
+    start_date: str = "2019-01-02"
+) -> pd.DataFrame:
+    returns = generate_returns(n_tickers, n_days, n_factors, seed, start_date)
+    values = returns.to_numpy(dtype=np.float64)
+    values[0] = 0 #day one is the starting price
+    prices = 100 * np.cumprod(1 + values, axis=0)
+
+    rng = np.random.default_rng(seed + 1)
+    prices[rng.random(prices.shape) < nan_density] = np.nan
+
+    return pd.DataFrame({
+        "Ticker": pd.Categorical(np.repeat(returns.columns.to_numpy(), n_days), categories=returns.columns),
+        "Date": np.tile(returns.index.to_numpy(), n_tickers),
+        "Price": prices.T.reshape(-1).astype("float32")
+    })
+
+#Writes the prices as a .zip with one <ticker>.csv per ticker (Ticker, Date, Price, Volume), like the real archive
+def write_price_zip(prices: pd.DataFrame, zip_path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(zip_path)), exist_ok=True)
+    dates = prices["Date"].dt.strftime("%Y-%m-%d").to_numpy()
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        for ticker, rows in prices.groupby("Ticker", observed=True).indices.items():
+            csv = pd.DataFrame({
+                "Ticker": ticker,
+                "Date": dates[rows],
+                "Price": prices["Price"].to_numpy()[rows],
+                "Volume": 1000
+            }).to_csv(index=False, float_format="%.4f")
+            zip_ref.writestr(f"{ticker}.csv", csv)
@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+
+from src.fast_correlation import CorrelationWindow
+from src.summary_reducer import CorrelationSummaryReducer
+from src.adaptive_scheduler import run_adaptive
+from src.instrumentation import span
+
+"""
+The purpose of this file is to split one day's correlation matrix over many workers, so a single huge universe is not
+bound to the memory and speed of one process. The other engines parallelise across dates only, every task still
+reduces a whole N x N matrix.
+
+The upper triangle of the matrix is cut into tile_size x tile_size tiles (diagonal tiles included). A tile task gets
+only the returns of its row tickers and column tickers (two W x tile_size slices of the window), computes its block of
+correlations (CorrelationWindow, same results as DataFrame.corr()) and sends back a CorrelationSummaryReducer holding
+its partial reductions: count/mean/M2, the threshold count, the fine histogram and bounded heaps of its best pairs.
+The reducers of a window's tiles are merged into one, which gives the same summary dictionary as the other engines.
+The exact median needs the merged histogram first. Each tile's reducer also keeps the values in a band of fine bins
+around the tile's own median (at most TILE_MEDIAN_BAND // 4 values, see src/summary_reducer.py); once a window's tiles
+are merged, the values in its median bin(s) come from the tiles whose band covers them. Only the tiles whose band
+missed (their median sits far from the window's, e.g. the cross-sector tiles of a universe with strong sectors) are
+queued for a second round, which recomputes the tile and sends back its values inside the median bin(s). It runs in
+the same scheduler run as the other windows' first-round tiles. In the worst case (every band missed) a window's tiles
+are computed twice, three times with `changes` (the first round also computes the previous date's tile).
+
+Per task memory is O(tile_size^2) for the tile plus O(W * tile_size) for its returns, whatever the universe size, and
+each result is a few hundred KB (mostly the fine histogram). Tasks go through run_adaptive (src/adaptive_scheduler.py)
+so the same code runs on threads, a process pool, a local dask.distributed cluster or the workers of a dask scheduler
+spread over several machines.
+"""
+
+TILE_SIZE = 1024
+TILE_MEDIAN_BAND = 2**16 #a tile's band is narrowed to at most a quarter of this around its median (64KB of float32)
+
+#Upper triangle tiles (row_start, row_stop, col_start, col_stop) of an n x n matrix, diagonal tiles included
+def tile_ranges(n_columns: int, tile_size: int = TILE_SIZE) -> list:
+    starts = range(0, n_columns, tile_size)
+    return [
+        (row_start, min(row_start + tile_size, n_columns), col_start, min(col_start + tile_size, n_columns))
+        for row_start in starts for col_start in starts if col_start >= row_start
+    ]
+
+#Correlations between the row tickers' returns (W x r) and the column tickers' returns (W x c, None on the diagonal)
+def _correlation_tile(row_returns: np.ndarray, column_returns: np.ndarray) -> np.ndarray:
+    if column_returns is None:
+        return CorrelationWindow(row_returns).tile(0, row_returns.shape[1])
+    window = CorrelationWindow(np.concatenate([row_returns, column_returns], axis=1))
+    return window.tile(0, row_returns.shape[1], row_returns.shape[1])
+
+#Tile task: the partial summary of one tile, or with bins (the window's median bins) only its values inside them.
+#previous is the (row returns, column returns) of the previous date's window, it adds the tile's `changes` largest moves
+def reduce_tile(
+    row_returns: np.ndarray,
+    column_returns,
+    row_start: int,
+    col_start: int,
+    bins: tuple = None,
+    previous: tuple = None,
+    changes: int = 0
+):
+    with span("correlation_tile", "correlation", rows=row_returns.shape[1]):
+        tile = _correlation_tile(row_returns, column_returns)
+    if bins is not None:
+        reducer = CorrelationSummaryReducer()
+        with span("median_pass", "reducer"):
+            reducer.update_median(tile, row_start, col_start, bins)
+        return reducer.median_candidates
+    reducer = CorrelationSummaryReducer(median_band=TILE_MEDIAN_BAND)
+    with span("reduce_tile", "reducer"):
+        reducer.update(tile, row_start, col_start)
+        if reducer.band_count > TILE_MEDIAN_BAND // 4: #small tiles too, the merging process keeps every tile's band
+            reducer._narrow_band()
+    if previous is not None:
+        with span("correlation_tile", "correlation", rows=row_returns.shape[1]):
+            previous_tile = _correlation_tile(*previous)
+        reducer.update_changes(tile, previous_tile, row_start, col_start, changes)
+    return reducer
+
+"""
+Summaries of several windows, each (current_date, rows) with rows a (W x N) array of returns, through tile tasks.
+All windows' tiles go through a single run_adaptive call (one probe task, no barrier between windows or rounds): a
+window's second-round (median) tiles, those whose band missed its median bin(s), are appended to the run when its last
+first-round tile has been merged, so they fill the slots left by the other windows' first-round tiles.
+scheduler, max_workers, memory_limit and progress are passed to run_adaptive (progress counts a window as done when
+its last first-round tile is), pool is an open worker_pool to reuse.
+previous (one (W x N) array or None per window, the previous date's window) adds the `changes` pairs that moved most
+against it: the first round tiles also get the previous window's slices and reduce the difference of the two tiles.
+"""
+
+def tiled_summaries(
+    windows: list,
+    tickers: np.ndarray,
+    tile_size: int = TILE_SIZE,
+    scheduler: str = "threads",
+    max_workers: int = None,
+    memory_limit: int = None,
+    progress=None,
+    pool=None,
+    previous: list = None,
+    changes: int = 0
+) -> list:
+    tiles = tile_ranges(len(tickers), tile_size)
+    reducers = [CorrelationSummaryReducer() for _ in windows]
+    previous = [None] * len(windows) if previous is None else previous
+    def tile_slices(rows, row_start, row_stop, col_start, col_stop):
+        return rows[:, row_start:row_stop], None if col_start == row_start else rows[:, col_start:col_stop]
+    def tile_tasks(owner, indices, bins=None):
+        rows = windows[owner][1]
+        return [
+            (
+                (*tile_slices(rows, *tiles[i]), tiles[i][0], tiles[i][2], bins,
+                 None if bins is not None or previous[owner] is None else tile_slices(previous[owner], *tiles[i]),
+                 changes),
+                int(bins is None and i == len(tiles) - 1)
+            )
+            for i in indices
+        ]
+    tasks = [task for owner in range(len(windows)) for task in tile_tasks(owner, range(len(tiles)))]
+    task_owners = [(owner, False) for owner in range(len(windows)) for _ in tiles] #(window, second round) per task
+    first_round_left = [len(tiles)] * len(windows)
+    tile_reducers = [[None] * len(tiles) for _ in windows] #first-round reducers, kept for their median band
+
+    def add_candidates(reducer, values):
+        if reducer.median_candidates is None:
+            reducer.median_candidates = values
+        else:
+            reducer.median_candidates = np.concatenate([reducer.median_candidates, values])
+
+    def on_result(index, result, stats):
+        owner, second_round = task_owners[index]
+        reducer = reducers[owner]
+        if second_round:
+            add_candidates(reducer, result)
+            return
+        reducer.merge(result)
+        result.median_histogram = None #only the band is needed from here on
+        tile_reducers[owner][index % len(tiles)] = result
+        first_round_left[owner] -= 1
+        if first_round_left[owner] or not reducer.count:
+            return
+        #values in the window's median bin(s) from the tiles' bands, a second round only for the tiles that missed
+        bins = reducer._median_bins()[:2]
+        missed = []
+        with span("median_band", "reducer"):
+            for i, tile_reducer in enumerate(tile_reducers[owner]):
+                candidates = tile_reducer.band_candidates(*bins)
+                if candidates is None:
+                    missed.append(i)
+                else:
+                    add_candidates(reducer, candidates)
+        tile_reducers[owner] = None
+        tasks.extend(tile_tasks(owner, missed, bins))
+        task_owners.extend((owner, True) for _ in missed)
+    run_adaptive(
+        reduce_tile, tasks, on_result, scheduler=scheduler, max_workers=max_workers, memory_limit=memory_limit,
+        progress=progress, pool=pool
+    )
+
+    with span("summary", "reducer"):
+        return [reducer.summary(tickers, current_date) for reducer, (current_date, _) in zip(reducers, windows)]
+
+#Summary of a single (W x N) window of returns through tile tasks, same dictionary as summarize_rows
+def summarize_rows_tiled(
+    rows: np.ndarray,
+    tickers: np.ndarray,
+    current_date: pd.Timestamp,
+    tile_size: int = TILE_SIZE,
+    scheduler: str = "threads",
+    max_workers: int = None
+) -> dict:
+    return tiled_summaries(
+        [(current_date, np.asarray(rows, dtype=np.float32))], tickers, tile_size, scheduler, max_workers,
+        progress=lambda stats: None
+    )[0]
@@ -0,0 +1,91 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.adaptive_scheduler import run_adaptive, process_tree_rss, worker_pool, MemorySampler
+
+import pytest
+import time
+import numpy as np
+
+#task that holds a few MB for a moment so the memory sampler can see it
+def hold_memory(i: int, megabytes: int = 8) -> int:
+    block = np.ones(megabytes * 2**17) #megabytes of float64
+    time.sleep(0.02)
+    return i + int(block[0])
+
+#Testing every task runs once, results reach on_result with their task index and the stats add up
+def testing_run_adaptive_completes_all_tasks():
+    tasks = [((i,), 2) for i in range(12)]
+    results, snapshots = {}, []
+
+    def on_result(index, result, stats):
+        results[index] = result
+
+    stats = run_adaptive(hold_memory, tasks, on_result, max_workers=3, progress=snapshots.append)
+    assert results == {i: i + 1 for i in range(12)}, f"Unexpected results {results}"
+    assert stats["completed_tasks"] == 12 and stats["completed_dates"] == stats["total_dates"] == 24, f"Bad totals {stats}"
+    assert stats["dates_per_sec"] > 0, "Throughput should be reported"
+    assert len(snapshots) == 12, f"Progress should be reported after every task, got {len(snapshots)} reports"
+    assert all(snapshot["in_flight"] <= 3 and snapshot["limit"] <= 3 for snapshot in snapshots), "More tasks in flight than workers"
+
+#Testing a memory budget smaller than one task keeps a single task in flight
+def testing_run_adaptive_respects_memory_limit():
+    snapshots = []
+    stats = run_adaptive(hold_memory, [((i,), 1) for i in range(6)], lambda *args: None,
+                         max_workers=4, memory_limit=1, progress=snapshots.append)
+    assert stats["peak_task_mb"] > 0, "Per-task memory should have been measured"
+    assert all(snapshot["limit"] == 1 and snapshot["in_flight"] == 0 for snapshot in snapshots), "Only one task should run at a time"
+
+#Testing a memory spike counts in full when it is sampled and then fades, so the in-flight limit can grow again
+def testing_memory_sampler_peak_decays():
+    sampler = MemorySampler(half_life=0.05)
+    sampler.in_flight = 1
+    block = np.ones(64 * 2**17) #64MB spike
+    sampler.sample()
+    spike = sampler.peak_per_task
+    assert spike >= 32 * 2**20, f"The spike should be measured, got {spike / 2**20:.0f}MB"
+    del block
+    sampler.in_flight = 0
+    time.sleep(0.5)
+    sampler.sample()
+    assert sampler.peak_per_task < spike / 100, f"The peak should decay after ten half-lives, got {sampler.peak_per_task}"
+
+#Testing the process pool runs module level tasks and is counted in the RSS
+def testing_run_adaptive_processes():
+    results = {}
+    run_adaptive(hold_memory, [((i,), 1) for i in range(4)], lambda index, result, stats: results.update({index: result}),
+                 scheduler="processes", max_workers=2, progress=lambda stats: None)
+    assert results == {i: i + 1 for i in range(4)}, f"Unexpected results {results}"
+    assert process_tree_rss() > 0, "RSS of the process tree should be measurable"
+
+#Testing an unknown scheduler name is rejected
+def testing_run_adaptive_unknown_scheduler():
+    with pytest.raises(ValueError):
+        run_adaptive(hold_memory, [((0,), 1)], lambda *args: None, scheduler="gpu")
+
+#Testing several runs can share one pool, which stays open between them
+def testing_run_adaptive_shared_pool():
+    results = []
+    with worker_pool("threads", 2) as pool:
+        for run in range(2):
+            run_adaptive(hold_memory, [((i,), 1) for i in range(3)], lambda index, result, stats: results.append(result),
+                         max_workers=2, progress=lambda stats: None, pool=pool)
+        assert not pool.executor._shutdown, "A shared pool should stay open after a run"
+    assert sorted(results) == [1, 1, 2, 2, 3, 3], f"Unexpected results {results}"
+    assert pool.executor._shutdown, "The pool should be shut down when the block exits"
+
+#Testing tasks appended by on_result run in the same call and their dates are added to the total
+def testing_run_adaptive_appended_tasks():
+    tasks = [((i,), 1) for i in range(3)]
+    results = {}
+
+    def on_result(index, result, stats):
+        results[index] = result
+        if index < 3:
+            tasks.append(((10 + index,), 2))
+
+    stats = run_adaptive(hold_memory, tasks, on_result, max_workers=2, progress=lambda stats: None)
+    assert sorted(results.values()) == [1, 2, 3, 11, 12, 13], f"Appended tasks should run once each, got {results}"
+    assert stats["completed_tasks"] == 6 and stats["completed_dates"] == stats["total_dates"] == 9, f"Bad totals {stats}"
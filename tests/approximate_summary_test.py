@@ -0,0 +1,104 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.approximate_summary import (
+    prepare_window,
+    pair_correlations,
+    lsh_candidates,
+    approximate_summary,
+    load_intervals,
+    INTERVAL_STATS
+)
+from src.correlation import summarize_rows, orchestrate_daily_correlation_summary_stats
+from src.summary_store import load_summary_stats
+from src.synthetic_market import generate_returns
+from fast_correlation_test import sample_return_matrix, assert_matches_pandas
+
+import pytest
+import numpy as np
+import tempfile
+import shutil
+
+WINDOW = 20
+
+@pytest.fixture
+def temp_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+#One window of factor-driven returns for 600 tickers (179,700 pairs) with a few missing days
+@pytest.fixture
+def large_window():
+    returns = generate_returns(600, WINDOW, seed=3)
+    rows = returns.to_numpy(np.float32)
+    rng = np.random.default_rng(3)
+    rows[rng.integers(0, WINDOW, 30), rng.choice(600, 30, replace=False)] = np.nan
+    return rows, np.asarray(returns.columns), returns.index[-1]
+
+#Testing pair scoring gives pandas' pairwise-complete correlation for every pair (missing days and a constant column)
+def testing_pair_correlations_match_pandas(sample_return_matrix):
+    window_slice = sample_return_matrix.iloc[:WINDOW]
+    first, second = np.triu_indices(window_slice.shape[1], k=1)
+    scored = pair_correlations(prepare_window(window_slice.to_numpy()), first, second)
+
+    expected = window_slice.corr().to_numpy()[first, second]
+    assert_matches_pandas(scored, expected, 1e-5)
+
+#Testing the estimates' intervals cover the exact statistics and the top pairs are the exact ones
+def testing_approximate_summary_matches_exact(large_window):
+    rows, tickers, current_date = large_window
+    exact = summarize_rows(rows, tickers, current_date)
+    approximate = approximate_summary(rows, tickers, current_date, n_pairs=50_000)
+
+    for stat in INTERVAL_STATS:
+        low, high = approximate["intervals"][stat]
+        assert low <= approximate[stat] <= high, f"{stat} estimate {approximate[stat]} outside its interval"
+        assert low <= exact[stat] <= high, f"Exact {stat} {exact[stat]} outside the interval ({low}, {high})"
+    assert approximate["sample_pairs"] == 50_000 and approximate["candidate_pairs"] > 0, "Unexpected pair counts"
+
+    for category in ["top_20_closest_to_one", "top_5_most_negative"]:
+        expected = [pair["correlation"] for pair in exact[category]]
+        found = [pair["correlation"] for pair in approximate[category]]
+        assert np.allclose(found, expected, atol=1e-5), f"{category} differs from the exact pairs: {found} vs {expected}"
+    pairs = [(pair["ticker_1"], pair["ticker_2"]) for pair in approximate["top_20_closest_to_zero"]]
+    assert len(set(pairs)) == 20, "Closest to zero pairs should be distinct"
+
+    again = approximate_summary(rows, tickers, current_date, n_pairs=50_000)
+    assert again["mean_correlation"] == approximate["mean_correlation"], "A date should give the same sample every run"
+
+#Testing strongly positive and strongly negative pairs both become candidates
+def testing_lsh_finds_opposite_pairs():
+    rng = np.random.default_rng(0)
+    rows = rng.normal(0, 0.02, (WINDOW, 200))
+    rows[:, 1] = rows[:, 0] + rng.normal(0, 0.002, WINDOW)
+    rows[:, 3] = -rows[:, 2] + rng.normal(0, 0.002, WINDOW)
+    first, second = lsh_candidates(prepare_window(rows)["units"], 16, 14, rng)
+    candidates = set(zip(first.tolist(), second.tolist()))
+    assert {(0, 1), (2, 3)} <= candidates, "Both near copies should collide in some band"
+    assert len(candidates) < 200 * 199 // 2 // 10, f"{len(candidates)} candidates is not much of a filter"
+    assert all(i < j for i, j in candidates), "Candidates should be ordered pairs"
+
+#Testing the window engine stores approximate summaries and their intervals, and rejects what it cannot approximate
+def testing_window_engine_approximate(sample_return_matrix, temp_dir):
+    orchestrate_daily_correlation_summary_stats(
+        sample_return_matrix, window=WINDOW, output_directory=temp_dir, engine="window", approximate=2000,
+        progress=lambda stats: None
+    )
+    stats = load_summary_stats(temp_dir)
+    intervals = load_intervals(temp_dir)
+    assert len(stats) == len(sample_return_matrix) - WINDOW, f"Expected a summary per date, got {len(stats)}"
+    assert len(intervals) == len(stats) * len(INTERVAL_STATS), "Expected an interval per date and statistic"
+    means = intervals[intervals["stat"] == "mean_correlation"].set_index("Date")["estimate"]
+    assert np.allclose(means.to_numpy(), stats.set_index("Date")["mean_correlation"].loc[means.index].to_numpy()), \
+        "Stored estimates should match the stored statistics"
+    assert (intervals["low"] <= intervals["high"]).all() and (intervals["sample_pairs"] > 0).all(), "Bad intervals"
+
+    with pytest.raises(ValueError):
+        orchestrate_daily_correlation_summary_stats(sample_return_matrix, window=WINDOW, output_directory=temp_dir,
+                                                    engine="sliding", approximate=2000)
+    with pytest.raises(ValueError):
+        orchestrate_daily_correlation_summary_stats(sample_return_matrix, window=WINDOW, output_directory=temp_dir,
+                                                    engine="window", approximate=2000, neighbours=3)
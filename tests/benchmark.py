@@ -0,0 +1,204 @@
+"""Benchmark suite: times and memory-profiles every pipeline stage on synthetic markets and compares to a stored baseline
+
+Stages (each measured on its own):
+- data_load_zip            reading the .zip of per-ticker .csv files
+- computing_daily_returns  sort + groupby pct_change
+- pivot_returns            long returns -> Date x Ticker matrix
+- daily_return_matrix      prices -> Date x Ticker returns in one pass (what the pipeline uses, replaces the two above)
+- window_correlation       batched_correlation on one 20 day window
+- summary_reduction        reduce_correlation_matrix on that window's N x N matrix
+- summary_save             append_summaries of SAVED_SUMMARIES daily summaries
+- summary_load             load_summary_stats plus load_top_pairs for one date
+
+Every stage is run `repeat` times for the time (fastest run is kept) while the RSS of the process is sampled in the
+background, then once more under tracemalloc for the peak of Python/numpy allocations (tracemalloc slows pure Python
+code down, so the timed runs are kept separate from the traced one).
+
+Usage (from the project root):
+    python tests/benchmark.py                                  #500/2000/5000 tickers, compare to tests/benchmark_baseline.json
+    python tests/benchmark.py --tickers 500 --days 120         #quick run
+    python tests/benchmark.py --update-baseline                #store this run as the new baseline
+The exit code is 1 when any stage is slower or uses more memory than the baseline by more than the tolerance.
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.synthetic_market import generate_prices, write_price_zip
+from src.data_reader import data_load_zip
+from src.correlation import computing_daily_returns, pivot_returns, daily_return_matrix
+from src.fast_correlation import batched_correlation
+from src.summary_reducer import reduce_correlation_matrix
+from src.summary_store import append_summaries, load_summary_stats, load_top_pairs
+from src.adaptive_scheduler import MemorySampler
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), "benchmark_results.json")
+TICKER_COUNTS = [500, 2000, 5000]
+WINDOW = 20
+SAVED_SUMMARIES = 50
+TIME_TOLERANCE = 0.3 #a stage is a regression when it is more than 30% slower than the baseline
+MEMORY_TOLERANCE = 0.2
+MIN_SECONDS = 0.05 #stages faster than this in the baseline are too noisy to compare on time
+
+#Runs fn `repeat` times and once under tracemalloc: (result, fastest seconds, traced peak MB, RSS peak above start MB)
+def measure(fn, repeat: int = 3):
+    seconds = []
+    gc.collect()
+    sampler = MemorySampler(interval=0.01)
+    sampler.start()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+    sampler.stop()
+    rss_mb = (sampler.peak_rss - sampler.baseline) / 2**20
+
+    del result
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(seconds), peak / 2**20, max(rss_mb, 0.0)
+
+#Times every stage for one market size, returns {stage: {"seconds", "peak_mb", "rss_mb"}}
+def benchmark_size(n_tickers: int, n_days: int, nan_density: float, seed: int, repeat: int, work_dir: str) -> dict:
+    zip_path = os.path.join(work_dir, f"market_{n_tickers}.zip")
+    write_price_zip(generate_prices(n_tickers, n_days, nan_density=nan_density, seed=seed), zip_path)
+    results = {}
+
+    def record(stage, fn, stage_repeat=repeat):
+        result, seconds, peak_mb, rss_mb = measure(fn, stage_repeat)
+        results[stage] = {"seconds": round(seconds, 4), "peak_mb": round(peak_mb, 1), "rss_mb": round(rss_mb, 1)}
+        print(f"{n_tickers:>6} tickers  {stage:<24} {seconds:8.3f}s  peak {peak_mb:8.1f}MB  rss +{rss_mb:7.1f}MB")
+        return result
+
+    prices = record("data_load_zip", lambda: data_load_zip(zip_path))
+    returns = record("computing_daily_returns", lambda: computing_daily_returns(prices))
+    record("pivot_returns", lambda: pivot_returns(returns))
+    return_matrix = record("daily_return_matrix", lambda: daily_return_matrix(prices))
+
+    window_rows = return_matrix.iloc[:WINDOW].to_numpy()
+    tickers = return_matrix.columns.to_numpy()
+    current_date = return_matrix.index[WINDOW]
+    corr_matrix = record("window_correlation", lambda: batched_correlation(window_rows))
+    summary = record("summary_reduction", lambda: reduce_correlation_matrix(corr_matrix, tickers, current_date))
+
+    summaries = [{**summary, "Date": date.strftime('%Y-%m-%d')} for date in return_matrix.index[:SAVED_SUMMARIES]]
+    store_dir = os.path.join(work_dir, f"store_{n_tickers}")
+
+    def save():
+        shutil.rmtree(store_dir, ignore_errors=True)
+        append_summaries(summaries, store_dir)
+
+    def load():
+        return load_summary_stats(store_dir), load_top_pairs(store_dir, return_matrix.index[SAVED_SUMMARIES // 2])
+
+    record("summary_save", save)
+    record("summary_load", load)
+    return results
+
+def run_benchmarks(
+    ticker_counts: list = TICKER_COUNTS,
+    n_days: int = 260,
+    nan_density: float = 0.01,
+    seed: int = 0,
+    repeat: int = 3
+) -> dict:
+    work_dir = tempfile.mkdtemp()
+    try:
+        results = {
+            str(n_tickers): benchmark_size(n_tickers, n_days, nan_density, seed, repeat, work_dir)
+            for n_tickers in ticker_counts
+        }
+    finally:
+        shutil.rmtree(work_dir)
+    return {
+        "meta": {
+            "date": pd.Timestamp.now().strftime('%Y-%m-%d %H:%M'),
+            "days": n_days,
+            "nan_density": nan_density,
+            "seed": seed,
+            "repeat": repeat,
+            "cpu_count": os.cpu_count(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__
+        },
+        "results": results
+    }
+
+#Regressions of `results` against `baseline` as readable strings (sizes or stages missing from either side are skipped)
+def compare_to_baseline(
+    results: dict,
+    baseline: dict,
+    time_tolerance: float = TIME_TOLERANCE,
+    memory_tolerance: float = MEMORY_TOLERANCE,
+    min_seconds: float = MIN_SECONDS
+) -> list:
+    regressions = []
+    for size, stages in results["results"].items():
+        for stage, current in stages.items():
+            reference = baseline.get("results", {}).get(size, {}).get(stage)
+            if reference is None:
+                continue
+            if reference["seconds"] >= min_seconds and current["seconds"] > reference["seconds"] * (1 + time_tolerance):
+                regressions.append(
+                    f"{size} tickers {stage}: {current['seconds']:.3f}s vs baseline {reference['seconds']:.3f}s "
+                    f"(+{current['seconds'] / reference['seconds'] - 1:.0%})"
+                )
+            if reference["peak_mb"] >= 1 and current["peak_mb"] > reference["peak_mb"] * (1 + memory_tolerance):
+                regressions.append(
+                    f"{size} tickers {stage}: peak {current['peak_mb']:.1f}MB vs baseline {reference['peak_mb']:.1f}MB "
+                    f"(+{current['peak_mb'] / reference['peak_mb'] - 1:.0%})"
+                )
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline benchmark on synthetic markets")
+    parser.add_argument("--tickers", type=int, nargs="+", default=TICKER_COUNTS)
+    parser.add_argument("--days", type=int, default=260)
+    parser.add_argument("--nan-density", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=RESULTS_PATH, help="where this run's results are written")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.tickers, args.days, args.nan_density, args.seed, args.repeat)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Baseline updated: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.time_tolerance, args.memory_tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against the baseline")
+    else:
+        print(f"No baseline at {args.baseline}, run with --update-baseline to create one")
@@ -0,0 +1,48 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from benchmark import run_benchmarks, compare_to_baseline, BASELINE_PATH
+
+import json
+import copy
+
+STAGES = [
+    "data_load_zip", "computing_daily_returns", "pivot_returns", "daily_return_matrix", "window_correlation",
+    "summary_reduction", "summary_save", "summary_load"
+]
+
+#Testing a small run measures every stage and matches itself against itself
+def testing_small_benchmark_run():
+    results = run_benchmarks([30], n_days=60, repeat=1)
+    stages = results["results"]["30"]
+    assert list(stages) == STAGES, f"Unexpected stages {list(stages)}"
+    for stage, measured in stages.items():
+        assert measured["seconds"] >= 0 and measured["peak_mb"] >= 0, f"Invalid measurement for {stage}: {measured}"
+    assert compare_to_baseline(results, results) == [], "A run should not regress against itself"
+
+#Testing slower or larger stages are reported and noisy or missing stages are not
+def testing_compare_to_baseline():
+    baseline = {"results": {"500": {
+        "data_load_zip": {"seconds": 1.0, "peak_mb": 10.0, "rss_mb": 10.0},
+        "summary_load": {"seconds": 0.01, "peak_mb": 0.0, "rss_mb": 0.0}
+    }}}
+    results = copy.deepcopy(baseline)
+    results["results"]["500"]["data_load_zip"] = {"seconds": 1.5, "peak_mb": 13.0, "rss_mb": 10.0}
+    results["results"]["500"]["summary_load"] = {"seconds": 0.03, "peak_mb": 0.5, "rss_mb": 0.0}
+    results["results"]["2000"] = baseline["results"]["500"]
+
+    regressions = compare_to_baseline(results, baseline)
+    assert len(regressions) == 2, f"Expected a time and a memory regression, got {regressions}"
+    assert all(regression.startswith("500 tickers data_load_zip") for regression in regressions), regressions
+    assert compare_to_baseline(results, baseline, time_tolerance=0.6, memory_tolerance=0.4) == [], \
+        "Changes within the tolerance should pass"
+
+#Testing the stored baseline covers every stage at every size
+def testing_stored_baseline():
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+    assert sorted(baseline["results"], key=int) == ["500", "2000", "5000"], f"Unexpected sizes {list(baseline['results'])}"
+    for size, stages in baseline["results"].items():
+        assert list(stages) == STAGES, f"Baseline for {size} tickers is missing stages"
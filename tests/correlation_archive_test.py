@@ -0,0 +1,143 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.correlation_archive import (
+    pair_index,
+    quantize_correlations,
+    dequantize_correlations,
+    archive_parts,
+    archive_dates,
+    load_pair_history,
+    load_day_correlations,
+    remove_partial_archive,
+    append_archive,
+    block_pairs
+)
+from src.correlation import orchestrate_daily_correlation_summary_stats
+from src.summary_store import load_summary_stats
+from fast_correlation_test import sample_return_matrix, assert_matches_pandas
+
+import pytest
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+
+WINDOW = 20
+#worst case quantization error (half a step) on top of each engine's float32 tolerance against DataFrame.corr()
+STEP_ERROR = {"int8": 0.5 / 127, "int16": 0.5 / 32767}
+ENGINE_TOLERANCE = {"window": 1e-5, "sliding": 1e-4}
+
+@pytest.fixture
+def temp_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+#pandas' correlation matrix of the window ending the day before current_date
+def expected_matrix(return_matrix, current_date):
+    position = return_matrix.index.get_loc(current_date)
+    return return_matrix.iloc[position - WINDOW:position].corr().to_numpy()
+
+#Testing pairs are numbered in row-major upper triangle order whichever way round they are given
+def testing_pair_index_order():
+    n = 7
+    first, second = np.triu_indices(n, k=1)
+    assert (pair_index(first, second, n) == np.arange(n * (n - 1) // 2)).all(), "Pairs out of triangle order"
+    assert (pair_index(second, first, n) == pair_index(first, second, n)).all(), "Pair order should not matter"
+    with pytest.raises(ValueError):
+        pair_index(2, 2, n)
+
+#Testing the fixed scale keeps every correlation within half a step and NaN as NaN
+@pytest.mark.parametrize("dtype", ["int8", "int16"])
+def testing_quantization_error(dtype):
+    values = np.concatenate([np.linspace(-1, 1, 10001, dtype=np.float32), [np.nan]])
+    restored = dequantize_correlations(quantize_correlations(values, dtype))
+    assert restored.dtype == np.float32 and np.isnan(restored[-1]), "NaN should come back as NaN"
+    worst = np.abs(restored[:-1] - values[:-1]).max()
+    assert worst <= STEP_ERROR[dtype] + 1e-7, f"Quantization error {worst} above half a step for {dtype}"
+    assert restored[0] == -1 and restored[-2] == 1, "+-1 should be stored exactly"
+
+#Testing every archived day matches DataFrame.corr() within the quantization error, for both engines
+@pytest.mark.parametrize("engine", ["window", "sliding"])
+@pytest.mark.parametrize("dtype", ["int8", "int16"])
+def testing_archive_matches_pandas(sample_return_matrix, temp_dir, engine, dtype):
+    orchestrate_daily_correlation_summary_stats(
+        sample_return_matrix, window=WINDOW, output_directory=temp_dir, batch_size=40, engine=engine, archive=dtype,
+        progress=lambda stats: None
+    )
+    dates = archive_dates(temp_dir, WINDOW)
+    assert list(dates) == list(sample_return_matrix.index[WINDOW:]), "Expected every summarised date in the archive"
+    assert len(archive_parts(temp_dir, WINDOW)) >= 3, "Expected one part per store append"
+    assert len(load_summary_stats(temp_dir)) == len(dates), "The summaries should still be written"
+
+    n = sample_return_matrix.shape[1]
+    first, second = np.triu_indices(n, k=1)
+    tolerance = STEP_ERROR[dtype] + ENGINE_TOLERANCE[engine]
+    for current_date in dates[::15]:
+        values, tickers = load_day_correlations(temp_dir, current_date, WINDOW)
+        assert list(tickers) == list(sample_return_matrix.columns), "Archived tickers differ from the columns"
+        assert values.shape == (n * (n - 1) // 2,), f"Unexpected day shape {values.shape}"
+        assert_matches_pandas(values, expected_matrix(sample_return_matrix, current_date)[first, second], tolerance)
+
+    history = load_pair_history(temp_dir, "T9", "T2", window=WINDOW)
+    expected = [expected_matrix(sample_return_matrix, current_date)[2, 9] for current_date in dates]
+    assert list(history["Date"]) == list(dates), "Pair history should cover every archived date in order"
+    assert_matches_pandas(history["correlation"].to_numpy(), np.asarray(expected), tolerance)
+
+#Testing date filters, a rewritten date keeping its latest part, leftovers removal and rejected combinations
+def testing_archive_rewrites_and_filters(sample_return_matrix, temp_dir):
+    orchestrate_daily_correlation_summary_stats(
+        sample_return_matrix, window=WINDOW, output_directory=temp_dir, archive="int8", progress=lambda stats: None
+    )
+    last = sample_return_matrix.index[-1]
+    shifted = sample_return_matrix.copy()
+    shifted["T1"] = shifted["T0"] #only the last date is recomputed with T1 a copy of T0
+    orchestrate_daily_correlation_summary_stats(
+        shifted, window=WINDOW, output_directory=temp_dir, archive="int16", first_date=last,
+        progress=lambda stats: None
+    )
+    history = load_pair_history(temp_dir, "T0", "T1", start_date=sample_return_matrix.index[-3], window=WINDOW)
+    assert len(history) == 3, f"Expected the last 3 dates, got {len(history)}"
+    assert history["correlation"].iloc[-1] == 1, "The rewritten date should come from the latest part"
+    assert len(load_pair_history(temp_dir, "T0", "MISSING", window=WINDOW)) == 0, "Unknown tickers have no history"
+    with pytest.raises(KeyError):
+        load_day_correlations(temp_dir, sample_return_matrix.index[0], WINDOW)
+
+    leftover = os.path.join(temp_dir, "correlation_archive", f"window={WINDOW}", ".0-x.tmp-1")
+    os.makedirs(leftover)
+    assert remove_partial_archive(temp_dir) == [leftover] and not os.path.exists(leftover), "Leftover not removed"
+
+    for options in [{"engine": "tiles"}, {"approximate": 2000}, {"archive": "float16"}]:
+        with pytest.raises(ValueError):
+            orchestrate_daily_correlation_summary_stats(
+                sample_return_matrix, window=WINDOW, output_directory=temp_dir, **{"archive": "int8", **options}
+            )
+
+#Testing days and pair histories read back across several pair blocks, the last one padded
+def testing_archive_pair_blocks(temp_dir, monkeypatch):
+    monkeypatch.setattr("src.correlation_archive.BLOCK_BYTES", 64) #64 int8 pairs per block
+    n = 30 #435 pairs, 7 blocks
+    tickers = [f"T{i}" for i in range(n)]
+    rng = np.random.default_rng(5)
+    triangles = rng.uniform(-1, 1, (12, n * (n - 1) // 2)).astype(np.float32)
+    triangles[3, 100] = np.nan
+    dates = pd.bdate_range("2022-01-03", periods=12)
+    summaries = [
+        {"Date": date.strftime("%Y-%m-%d"), "window": WINDOW, "archive": quantize_correlations(triangle, "int8")}
+        for date, triangle in zip(dates, triangles)
+    ]
+    append_archive(summaries[:5], temp_dir, tickers)
+    append_archive(summaries[5:], temp_dir, tickers)
+    assert block_pairs("int8") == 64 and block_pairs("int16") == 32, "Blocks should hold one page of pairs per day"
+
+    expected = dequantize_correlations(quantize_correlations(triangles, "int8"))
+    values, _ = load_day_correlations(temp_dir, dates[3], WINDOW)
+    assert np.array_equal(values, expected[3], equal_nan=True), "Day read back differs across blocks"
+    for first, second in [(0, 1), (7, 22), (28, 29)]:
+        history = load_pair_history(temp_dir, f"T{second}", f"T{first}", window=WINDOW)
+        column = pair_index(first, second, n)
+        assert np.array_equal(history["correlation"].to_numpy(), expected[:, column]), \
+            f"History of T{first}-T{second} differs"
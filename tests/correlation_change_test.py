@@ -0,0 +1,104 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.correlation_change import (
+    ChangeReducer,
+    load_change_stats,
+    load_top_changes,
+    CHANGE_EDGES,
+    CHANGE_HISTOGRAM_COLUMNS
+)
+from src.correlation import orchestrate_daily_correlation_summary_stats, summarize_rows
+from src.summary_store import load_summary_stats
+from fast_correlation_test import sample_return_matrix
+
+import pytest
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+
+WINDOW = 20
+K = 10
+
+@pytest.fixture
+def temp_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+#Every pair's change between pandas' correlations of the window before position and the one before that
+def expected_changes(return_matrix, position):
+    first, second = np.triu_indices(return_matrix.shape[1], k=1)
+    current = return_matrix.iloc[position - WINDOW:position].corr().to_numpy()[first, second]
+    previous = return_matrix.iloc[position - WINDOW - 1:position - 1].corr().to_numpy()[first, second]
+    both = ~np.isnan(current) & ~np.isnan(previous)
+    return first[both], second[both], current[both] - previous[both]
+
+#Testing the reducer over tiles (merged) gives pandas' changes: counts, means, histogram and the largest moves
+def testing_change_reducer_matches_pandas(sample_return_matrix):
+    position = 60
+    current = sample_return_matrix.iloc[position - WINDOW:position].corr().to_numpy(np.float32)
+    previous = sample_return_matrix.iloc[position - WINDOW - 1:position - 1].corr().to_numpy(np.float32)
+    reducer = ChangeReducer(K)
+    for row_start, col_start in [(0, 0), (0, 16), (16, 16), (0, 32), (16, 32), (32, 32)]:
+        part = ChangeReducer(K)
+        tiles = slice(row_start, row_start + 16), slice(col_start, col_start + 16)
+        part.update(current[tiles], previous[tiles], row_start, col_start)
+        reducer.merge(part)
+    result = reducer.summary(sample_return_matrix.columns.to_numpy())
+
+    first, second, change = expected_changes(sample_return_matrix, position)
+    assert result["pairs"] == len(change), f"Expected {len(change)} pairs, got {result['pairs']}"
+    assert np.isclose(result["mean_change"], change.mean(), atol=1e-6), "Mean change differs from pandas"
+    assert np.isclose(result["mean_abs_change"], np.abs(change).mean(), atol=1e-6), "Mean |change| differs from pandas"
+    assert np.isclose(result["max_abs_change"], np.abs(change).max(), atol=1e-6), "Largest |change| differs from pandas"
+    histogram, _ = np.histogram(np.abs(change), CHANGE_EDGES)
+    assert np.abs(result["histogram"] - histogram).sum() <= 2, "Histogram should match up to values on an edge"
+
+    order = np.argsort(-np.abs(change))[:K]
+    expected = [(f"T{first[i]}", f"T{second[i]}") for i in order]
+    found = [(pair["ticker_1"], pair["ticker_2"]) for pair in result["top_changes"]]
+    assert found == expected, f"Largest moves {found} differ from pandas' {expected}"
+    for pair, i in zip(result["top_changes"], order):
+        assert np.isclose(pair["change"], change[i], atol=1e-5), "Stored change differs from pandas"
+        assert np.isclose(pair["correlation"] - pair["previous_correlation"], pair["change"], atol=1e-6), \
+            "Change should be the difference of the two correlations"
+
+#Testing every engine stores the same changes as pandas for each date after the first one with a previous window
+@pytest.mark.parametrize("engine", ["window", "sliding", "tiles"])
+def testing_engines_store_changes(sample_return_matrix, temp_dir, engine):
+    orchestrate_daily_correlation_summary_stats(
+        sample_return_matrix, window=WINDOW, output_directory=temp_dir, batch_size=30, engine=engine, changes=K,
+        tile_size=16, progress=lambda stats: None
+    )
+    stats = load_change_stats(temp_dir, window=WINDOW)
+    dates = sample_return_matrix.index
+    assert list(stats["Date"]) == list(dates[WINDOW + 1:]), "Expected changes for every date with a previous window"
+    assert len(load_summary_stats(temp_dir)) == len(dates) - WINDOW, "The summaries should still be written"
+    assert (stats[CHANGE_HISTOGRAM_COLUMNS].sum(axis=1) == stats["pairs"]).all(), "Histogram should count every pair"
+
+    for position in [WINDOW + 1, 70, len(dates) - 1]:
+        _, _, change = expected_changes(sample_return_matrix, position)
+        row = stats.set_index("Date").loc[dates[position]]
+        assert row["pairs"] == len(change), f"Expected {len(change)} pairs on {dates[position]}"
+        assert np.isclose(row["mean_abs_change"], np.abs(change).mean(), atol=1e-4), "Mean |change| differs"
+        top = load_top_changes(temp_dir, dates[position], window=WINDOW)
+        assert len(top) == K and list(top["rank"]) == list(range(1, K + 1)), "Expected K ranked moves"
+        assert np.allclose(np.abs(top["change"]), np.sort(np.abs(change))[::-1][:K], atol=1e-4), \
+            f"Largest moves on {dates[position]} differ from pandas"
+
+#Testing changes leave the rest of the summary untouched and cannot be combined with approximate summaries
+def testing_summarize_rows_previous_window(sample_return_matrix, temp_dir):
+    rows = sample_return_matrix.to_numpy()
+    tickers = sample_return_matrix.columns.to_numpy()
+    summary = summarize_rows(rows[41:61], tickers, sample_return_matrix.index[61], previous=rows[40:60], changes=K)
+    plain = summarize_rows(rows[41:61], tickers, sample_return_matrix.index[61])
+    assert {key: value for key, value in summary.items() if key != "changes"} == plain, \
+        "Changes should not alter the summary"
+    assert summary["changes"]["pairs"] > 0 and len(summary["changes"]["top_changes"]) == K, "Missing changes"
+    with pytest.raises(ValueError):
+        orchestrate_daily_correlation_summary_stats(sample_return_matrix, window=WINDOW, output_directory=temp_dir,
+                                                    approximate=2000, changes=K)
@@ -3,12 +3,17 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
 
+from src import correlation
 from src.correlation import (
     computing_daily_returns,
     pivot_returns,
+    daily_return_matrix,
     compute_and_save_summary_stats,
     orchestrate_daily_correlation_summary_stats
 )
+from src.summary_store import load_summary_stats, load_top_pairs, read_journal
+from src.return_cache import save_return_matrix, load_cached_return_matrix
+from src.synthetic_market import generate_prices
 
 import pytest
 import pandas as pd
@@ -16,7 +21,6 @@ import numpy as np
 import tempfile
 import shutil
 from datetime import datetime, timedelta
-import pickle
 import dask
 
 #creating some sample data
@@ -83,6 +87,23 @@ def testing_pivot_returns(sample_price_data):
     unique_dtypes = return_matrix.dtypes.nunique()
     assert unique_dtypes == 1, f"Expected all columns to have same dtype (float32), but found {unique_dtypes} different dtypes: {return_matrix.dtypes.unique()}"
 
+#Testing the single pass builder gives exactly the two step result: missing and NaN prices, categorical and string
+#tickers, unsorted rows, a ticker with a single price
+@pytest.mark.parametrize("categorical", [True, False])
+def testing_daily_return_matrix_matches_pivot(categorical):
+    prices = generate_prices(40, 60, nan_density=0.05, seed=2).sample(frac=0.9, random_state=1) #drops ~10% of rows
+    prices = pd.concat([prices, pd.DataFrame({"Ticker": ["ZZZ"], "Date": [prices["Date"].max()], "Price": [10.0]})])
+    prices["Ticker"] = prices["Ticker"].astype("category" if categorical else str)
+    prices["Price"] = prices["Price"].astype("float32")
+
+    expected = pivot_returns(computing_daily_returns(prices))
+    actual = daily_return_matrix(prices)
+    pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+    assert "ZZZ" not in actual.columns, "A ticker without a return should be left out like in the pivot"
+
+    with pytest.raises(ValueError):
+        daily_return_matrix(pd.concat([prices, prices.iloc[:1]])) #duplicate Ticker/Date like pivot
+
 #main calc test
 def testing_compute_and_save_summary_stats_creates_file(sample_price_data, temp_output_dir):
     # Prepare test data
@@ -97,20 +118,17 @@ def testing_compute_and_save_summary_stats_creates_file(sample_price_data, temp_
     task = compute_and_save_summary_stats(window_slice, current_date, temp_output_dir)
     dask.compute(task)
 
-    # Verify file was created with expected naming convention
-    expected_filename = os.path.join(temp_output_dir, f"correlation_summary_{current_date.strftime('%Y-%m-%d')}.pkl")
-    assert os.path.exists(expected_filename), f"Expected file not created: {expected_filename}. Files in directory: {os.listdir(temp_output_dir)}"
+    # Verify the summary was written to the store for the expected date
+    stats = load_summary_stats(temp_output_dir)
+    assert list(stats["Date"]) == [current_date.normalize()], f"Expected one row for {current_date}, got dates {list(stats['Date'])}"
 
-    # Verify file contents have expected structure
-    with open(expected_filename, "rb") as f:
-        summary = pickle.load(f)
-    
     # Check that key summary statistics are present
-    assert "mean_correlation" in summary, f"Missing 'mean_correlation' key. Available keys: {list(summary.keys())}"
-    assert "top_20_closest_to_zero" in summary, f"Missing 'top_20_closest_to_zero' key. Available keys: {list(summary.keys())}"
+    assert "mean_correlation" in stats.columns, f"Missing 'mean_correlation' column. Available columns: {list(stats.columns)}"
+    top_pairs = load_top_pairs(temp_output_dir, current_date)
+    assert "top_20_closest_to_zero" in set(top_pairs["category"]), f"Missing 'top_20_closest_to_zero' pairs. Categories: {set(top_pairs['category'])}"
     
     # Top 20 list should not exceed 20 items (could be less if fewer pairs exist)
-    top_20_count = len(summary["top_20_closest_to_zero"])
+    top_20_count = (top_pairs["category"] == "top_20_closest_to_zero").sum()
     assert top_20_count <= 20, f"Expected <= 20 items in top_20_closest_to_zero, got {top_20_count}"
 
 #Testing the main pipeline
@@ -127,20 +145,177 @@ def testing_orchestrate_daily_correlation_summary_stats_end_to_end(sample_price_
         batch_size=3  # Small batch size for testing
     )
 
-    # Verify that output files were created
-    saved_files = [f for f in os.listdir(temp_output_dir) if f.endswith(".pkl")]
-    file_count = len(saved_files)
-    expected_files = len(return_matrix.index) - 20  # Should have one file per day after 20-day window
-    assert file_count > 0, f"No output files created. Directory contents: {os.listdir(temp_output_dir)}"
-    
-    # More detailed check - should have roughly the expected number of files
-    assert file_count == expected_files, f"Expected {expected_files} files (one per day after 20-day window), got {file_count}. Files: {saved_files}"
+    # Verify that one row per date was written
+    stats = load_summary_stats(temp_output_dir)
+    expected_dates = list(return_matrix.index[20:].normalize())  # Should have one row per day after 20-day window
+    assert len(stats) > 0, f"No summaries written. Directory contents: {os.listdir(temp_output_dir)}"
+    assert list(stats["Date"]) == expected_dates, f"Expected {len(expected_dates)} dates (one per day after 20-day window), got {len(stats)}"
+
+    # Batches are appended as part files, not one file per day
+    part_files = [f for _, _, files in os.walk(temp_output_dir) for f in files if f.endswith(".parquet")]
+    assert len(part_files) < 2 * len(expected_dates), f"Expected a few part files per table, got {len(part_files)}"
+
+    # Verify the stored stats have the expected columns
+    assert "correlation_entropy" in stats.columns, f"Missing 'correlation_entropy' column. Available columns: {list(stats.columns)}"
+
+#Testing the sliding engine writes the same summaries as recomputing every window
+def testing_orchestrate_sliding_engine_matches_window_engine(sample_price_data, temp_output_dir):
+    df_returns = computing_daily_returns(sample_price_data)
+    return_matrix = pivot_returns(df_returns)
+
+    window_dir = os.path.join(temp_output_dir, "window")
+    sliding_dir = os.path.join(temp_output_dir, "sliding")
+    orchestrate_daily_correlation_summary_stats(return_matrix, window=20, output_directory=window_dir, batch_size=3)
+    orchestrate_daily_correlation_summary_stats(return_matrix, window=20, output_directory=sliding_dir, engine="sliding")
+
+    expected = load_summary_stats(window_dir)
+    actual = load_summary_stats(sliding_dir)
+    assert list(actual["Date"]) == list(expected["Date"]), "Engines wrote different sets of dates"
+
+    for key in ["mean_correlation", "median_correlation", "std_correlation"]:
+        difference = (actual[key] - expected[key]).abs().max()
+        assert difference < 1e-4, f"{key} differs between engines by up to {difference}"
+
+#Testing every engine names the tickers of its summaries with strings when the columns are not strings
+def testing_engines_name_tickers_with_strings(temp_output_dir, monkeypatch):
+    return_matrix = make_return_matrix()
+    return_matrix.columns = range(100, 100 + return_matrix.shape[1])
+    written = []
+    append_batch = correlation._append_batch
+    def recording_append_batch(summaries, *args):
+        written.extend(summaries)
+        append_batch(summaries, *args)
+    monkeypatch.setattr(correlation, "_append_batch", recording_append_batch)
+    for engine in ["window", "sliding", "tiles"]:
+        written.clear()
+        orchestrate_daily_correlation_summary_stats(return_matrix, output_directory=os.path.join(temp_output_dir, engine),
+                                                    engine=engine, progress=lambda stats: None)
+        names = {type(pair["ticker_1"]) for summary in written for pair in summary["top_20_closest_to_one"]}
+        assert names == {np.str_}, f"{engine} engine named tickers with {names}"
+
+#random return matrix long enough for several batches, with a few missing returns
+def make_return_matrix(n_dates=45, n_tickers=12, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(0, 0.02, (n_dates, n_tickers)).astype("float32")
+    values[rng.random(values.shape) < 0.02] = np.nan
+    return pd.DataFrame(values, index=pd.bdate_range("2022-01-03", periods=n_dates), columns=[f"T{i}" for i in range(n_tickers)])
+
+#Testing tasks get shared row blocks (or only a cache path) and give the same summaries as one window per date
+def testing_window_engine_sends_row_blocks(temp_output_dir):
+    return_matrix = make_return_matrix()
+    expected_dir, block_dir, mapped_dir = (os.path.join(temp_output_dir, name) for name in ["expected", "block", "mapped"])
+
+    #one task per date, the old way of shipping one window per date
+    report = orchestrate_daily_correlation_summary_stats(return_matrix, output_directory=expected_dir, batch_size=10, dates_per_task=1)
+    assert all(batch["bytes_sent"] >= batch["bytes_as_window_frames"] for batch in report), "One task per date cannot share rows"
+
+    report = orchestrate_daily_correlation_summary_stats(return_matrix, output_directory=block_dir, batch_size=10, dates_per_task=5)
+    for batch in report:
+        assert batch["tasks"] * 5 == batch["dates"], f"Expected one task per 5 dates, got {batch}"
+        assert batch["bytes_sent"] < batch["bytes_as_window_frames"] / 2, f"Overlapping rows were not shared: {batch}"
 
-    # Validate structure of one of the saved files
-    test_file = os.path.join(temp_output_dir, saved_files[0])
-    with open(test_file, "rb") as f:
-        summary = pickle.load(f)
+    #a memory-mapped return matrix is sent as its cache path, the workers slice the rows themselves
+    mapped = load_cached_return_matrix(save_return_matrix(return_matrix, os.path.join(temp_output_dir, "cache", "entry")))
+    report = orchestrate_daily_correlation_summary_stats(mapped, output_directory=mapped_dir, batch_size=10, dates_per_task=5)
+    assert all(batch["bytes_sent"] < 1000 + 2 * mapped.columns.size * 16 for batch in report), f"Rows should not be sent: {report}"
+
+    expected = load_summary_stats(expected_dir)
+    for output_dir in [block_dir, mapped_dir]:
+        actual = load_summary_stats(output_dir)
+        assert list(actual["Date"]) == list(return_matrix.index[20:]), f"Wrong dates written to {output_dir}"
+        for key in ["mean_correlation", "median_correlation", "std_correlation", "correlation_entropy"]:
+            difference = (actual[key] - expected[key]).abs().max()
+            assert difference < 1e-6, f"{key} in {output_dir} differs by up to {difference}"
+        top_pairs = load_top_pairs(output_dir, return_matrix.index[30])
+        expected_pairs = load_top_pairs(expected_dir, return_matrix.index[30])
+        assert top_pairs[["ticker_1", "ticker_2"]].equals(expected_pairs[["ticker_1", "ticker_2"]]), "Top pairs differ"
+
+#Testing a slice of a cached matrix is not mistaken for the whole cache entry
+def testing_window_engine_sliced_cached_matrix(temp_output_dir):
+    return_matrix = make_return_matrix()
+    mapped = load_cached_return_matrix(save_return_matrix(return_matrix, os.path.join(temp_output_dir, "entry")))
+    sliced_dir, expected_dir = os.path.join(temp_output_dir, "sliced"), os.path.join(temp_output_dir, "expected")
+
+    report = orchestrate_daily_correlation_summary_stats(mapped.iloc[5:], output_directory=sliced_dir, batch_size=50)
+    orchestrate_daily_correlation_summary_stats(return_matrix.iloc[5:], output_directory=expected_dir, batch_size=50)
+    assert report[0]["bytes_sent"] > 1000, "A slice should be sent as rows, not the cache path"
+    difference = (load_summary_stats(sliced_dir)["mean_correlation"] - load_summary_stats(expected_dir)["mean_correlation"]).abs().max()
+    assert difference < 1e-6, f"Sliced cached matrix gave different summaries (difference {difference})"
+
+#Testing the process scheduler writes the same summaries as the thread scheduler
+def testing_window_engine_process_scheduler(temp_output_dir):
+    return_matrix = make_return_matrix()
+    threads_dir, processes_dir = os.path.join(temp_output_dir, "threads"), os.path.join(temp_output_dir, "processes")
+    orchestrate_daily_correlation_summary_stats(return_matrix, output_directory=threads_dir, scheduler="threads")
+    orchestrate_daily_correlation_summary_stats(return_matrix, output_directory=processes_dir, scheduler="processes", max_workers=2)
+
+    expected, actual = load_summary_stats(threads_dir), load_summary_stats(processes_dir)
+    assert list(actual["Date"]) == list(expected["Date"]), "Schedulers wrote different sets of dates"
+    difference = (actual["mean_correlation"] - expected["mean_correlation"]).abs().max()
+    assert difference == 0, f"Process scheduler results differ by up to {difference}"
+
+#Testing resume fills a gap in the middle of the dates (runs are split at the gap so every window is still right)
+def testing_window_engine_resume_fills_gap(temp_output_dir):
+    return_matrix = make_return_matrix()
+    expected_dir, resumed_dir = os.path.join(temp_output_dir, "expected"), os.path.join(temp_output_dir, "resumed")
+    orchestrate_daily_correlation_summary_stats(return_matrix, output_directory=expected_dir, batch_size=10, dates_per_task=5)
+    orchestrate_daily_correlation_summary_stats(return_matrix, output_directory=resumed_dir, batch_size=10, dates_per_task=5)
+
+    #forget the middle append, as if the run died before journaling it
+    journal_path = os.path.join(resumed_dir, "journal.jsonl")
+    with open(journal_path) as f:
+        lines = f.readlines()
+    with open(journal_path, "w") as f:
+        f.writelines(lines[:1] + lines[2:])
+    lost = sorted(pd.to_datetime(read_journal(expected_dir)[1]["dates"]))
+
+    report = orchestrate_daily_correlation_summary_stats(
+        return_matrix, output_directory=resumed_dir, batch_size=10, dates_per_task=3, resume=True
+    )
+    assert sum(batch["dates"] for batch in report) == len(lost), f"Expected {len(lost)} dates recomputed, report {report}"
+    expected, actual = load_summary_stats(expected_dir), load_summary_stats(resumed_dir)
+    assert list(actual["Date"]) == list(expected["Date"]), "Resumed store should cover every date"
+    difference = (actual["median_correlation"] - expected["median_correlation"]).abs().max()
+    assert difference < 1e-6, f"Resumed summaries differ by up to {difference}"
+
+#Testing every engine reports its store appends, and a resume with nothing left returns an empty report
+@pytest.mark.parametrize("engine", ["window", "sliding", "tiles"])
+def testing_engines_return_report(temp_output_dir, engine):
+    return_matrix = make_return_matrix()
+    report = orchestrate_daily_correlation_summary_stats(
+        return_matrix, output_directory=temp_output_dir, batch_size=10, engine=engine, progress=lambda stats: None
+    )
+    assert [batch["batch"] for batch in report] == [1, 2, 3], f"Expected one entry per append, got {report}"
+    assert sum(batch["dates"] for batch in report) == len(return_matrix) - 20, f"Every date should be reported: {report}"
+    assert all(batch["dates_per_sec"] > 0 for batch in report), f"Expected the throughput in every entry: {report}"
+
+    report = orchestrate_daily_correlation_summary_stats(
+        return_matrix, output_directory=temp_output_dir, engine=engine, resume=True, progress=lambda stats: None
+    )
+    assert report == [], f"Nothing left to compute should give an empty report, got {report}"
+
+#Testing several windows in one pass give the same summaries as separate single window runs, for both engines
+def testing_multiple_windows_match_single_window_runs(temp_output_dir):
+    return_matrix = make_return_matrix(n_dates=50)
+    windows = [5, 20, 30]
+    orchestrate_daily_correlation_summary_stats(
+        return_matrix, window=windows, output_directory=os.path.join(temp_output_dir, "sliding"), engine="sliding",
+        batch_size=7
+    )
+    orchestrate_daily_correlation_summary_stats(
+        return_matrix, window=windows, output_directory=os.path.join(temp_output_dir, "window"), batch_size=7,
+        progress=lambda stats: None
+    )
+    for window in windows:
+        single_dir = os.path.join(temp_output_dir, f"single_{window}")
+        orchestrate_daily_correlation_summary_stats(return_matrix, window=window, output_directory=single_dir, engine="sliding")
+        expected = load_summary_stats(single_dir)
+        assert list(expected["Date"]) == list(return_matrix.index[window:]), f"Window {window} should start after {window} rows"
+        for engine in ["sliding", "window"]:
+            actual = load_summary_stats(os.path.join(temp_output_dir, engine), window=window)
+            assert list(actual["Date"]) == list(expected["Date"]), f"{engine} engine wrote different dates for window {window}"
+            assert set(actual["window"]) == {window}, f"Summaries should be tagged with window {window}"
+            for key in ["mean_correlation", "median_correlation", "std_correlation"]:
+                difference = (actual[key] - expected[key]).abs().max()
+                assert difference < 1e-4, f"{engine} engine {key} for window {window} differs by up to {difference}"
 
-    # Verify the summary is a dictionary with expected keys
-    assert isinstance(summary, dict), f"Expected summary to be dict, got {type(summary)}"
-    assert "correlation_entropy" in summary, f"Missing 'correlation_entropy' key in summary. Available keys: {list(summary.keys())}"
\ No newline at end of file
@@ -1,3 +1,5 @@
+import zipfile
+import numpy as np
 import pandas as pd
 import pytest
 import os #lines 3-5 added to work around issue running pytest from command line
@@ -30,4 +32,61 @@ def testing_empty_df(test_df):
     
 
     #testing the data types of the date and returns columns
-    #tesing the value of return and making sure it makes sense
\ No newline at end of file
+    #tesing the value of return and making sure it makes sense
+#small archive of per-ticker .csv files with an extra column and a few missing prices
+@pytest.fixture
+def sample_zip(tmp_path):
+    rng = np.random.default_rng(1)
+    dates = pd.bdate_range("2022-01-03", periods=30).strftime("%Y-%m-%d")
+    path = tmp_path / "sample.zip"
+    with zipfile.ZipFile(path, "w") as zip_ref:
+        for ticker in ["AAPL", "MSFT", "GOOG", "TSLA"]:
+            prices = 100 + rng.normal(0, 1, len(dates)).cumsum()
+            prices[rng.random(len(dates)) < 0.1] = np.nan
+            df = pd.DataFrame({"Ticker": ticker, "Date": dates, "Price": prices, "Volume": 1000})
+            zip_ref.writestr(f"{ticker}.csv", df.to_csv(index=False))
+        zip_ref.writestr("README.txt", "not a csv")
+    return str(path)
+
+#Testing both parsers give the same sorted, NaN-free frame with one shared ticker category set
+@pytest.mark.parametrize("engine", ["c", "pyarrow"])
+def testing_load_zip_engines(sample_zip, engine):
+    df = data_load_zip(sample_zip, engine=engine, max_workers=2)
+    assert list(df.columns) == ["Ticker", "Date", "Price"], f"Unexpected columns {list(df.columns)}"
+    assert isinstance(df["Ticker"].dtype, pd.CategoricalDtype), f"Ticker should stay categorical, got {df['Ticker'].dtype}"
+    assert list(df["Ticker"].cat.categories) == ["AAPL", "GOOG", "MSFT", "TSLA"], "Categories should be the sorted union"
+    assert df["Price"].dtype == "float32" and df["Price"].notna().all(), "Prices should be float32 with NaNs dropped"
+    assert df.equals(df.sort_values(["Ticker", "Date"])), "Rows should be sorted by Ticker and Date"
+
+#Testing date range and ticker filters are applied while reading
+@pytest.mark.parametrize("engine", ["c", "pyarrow"])
+def testing_load_zip_filters(sample_zip, engine):
+    full = data_load_zip(sample_zip, engine=engine)
+    filtered = data_load_zip(sample_zip, start_date="2022-01-10", end_date="2022-01-20", tickers=["MSFT", "AAPL"], engine=engine)
+
+    expected = full[
+        (full["Date"] >= "2022-01-10") & (full["Date"] <= "2022-01-20") & full["Ticker"].isin(["MSFT", "AAPL"])
+    ]
+    assert len(filtered) == len(expected) > 0, f"Expected {len(expected)} rows after filtering, got {len(filtered)}"
+    assert list(filtered["Ticker"].cat.categories) == ["AAPL", "MSFT"], "Filtered-out tickers should not stay as categories"
+
+#Testing files the pyarrow parser cannot read (non-ISO dates) fall back to pandas and unsorted rows are still sorted
+def testing_load_zip_fallback_and_sort(tmp_path):
+    path = tmp_path / "mixed.zip"
+    with zipfile.ZipFile(path, "w") as zip_ref:
+        zip_ref.writestr("B.csv", "Ticker,Date,Price\nZZZ,01/05/2022,2.0\nZZZ,01/04/2022,1.0\nAAA,01/04/2022,5.0\n")
+        zip_ref.writestr("A.csv", "Ticker,Date,Price\nMMM,2022-01-04,3.0\nMMM,2022-01-05,\n")
+    df = data_load_zip(str(path))
+    assert list(df["Ticker"]) == ["AAA", "MMM", "ZZZ", "ZZZ"], f"Rows should be sorted by Ticker, got {list(df['Ticker'])}"
+    assert list(df["Price"]) == [5.0, 3.0, 1.0, 2.0], f"Rows should be sorted by Date within a ticker, got {list(df['Price'])}"
+    assert (df["Date"].dt.strftime("%Y-%m-%d") == ["2022-01-04", "2022-01-04", "2022-01-04", "2022-01-05"]).all(), "Dates should be parsed"
+
+#Testing rows with a missing or empty ticker are dropped instead of being given another ticker's code
+@pytest.mark.parametrize("engine", ["c", "pyarrow"])
+def testing_load_zip_drops_missing_tickers(tmp_path, engine):
+    path = tmp_path / "blank.zip"
+    with zipfile.ZipFile(path, "w") as zip_ref:
+        zip_ref.writestr("A.csv", "Ticker,Date,Price\nAAA,2022-01-04,1.0\n,2022-01-05,9.0\nBBB,2022-01-04,2.0\n")
+    df = data_load_zip(str(path), engine=engine)
+    assert list(df["Ticker"]) == ["AAA", "BBB"], f"The row without a ticker should be dropped, got {list(df['Ticker'])}"
+    assert list(df["Price"]) == [1.0, 2.0], f"Unexpected prices {list(df['Price'])}"
@@ -0,0 +1,144 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.fast_correlation import (
+    pairwise_moments,
+    correlation_from_moments,
+    SlidingCorrelationState,
+    rolling_correlation_matrices,
+    rolling_correlation_states,
+    batched_correlation
+)
+
+import pytest
+import pandas as pd
+import numpy as np
+
+#sample return matrix with a market factor, scattered NaNs and a constant (stale price) column
+@pytest.fixture
+def sample_return_matrix():
+    rng = np.random.default_rng(7)
+    n_days, n_tickers = 120, 40
+    market = rng.normal(0, 0.01, (n_days, 1))
+    returns = market * rng.uniform(0, 2, n_tickers) + rng.normal(0, 0.02, (n_days, n_tickers))
+    returns[rng.random((n_days, n_tickers)) < 0.05] = np.nan
+    returns[:, 3] = 0.0
+    dates = pd.date_range("2021-01-01", periods=n_days, freq="B")
+    return pd.DataFrame(returns.astype("float32"), index=dates, columns=[f"T{i}" for i in range(n_tickers)])
+
+#checks two correlation matrices agree, including where pandas gives NaN
+def assert_matches_pandas(actual, expected, tolerance):
+    nan_mismatch = (np.isnan(actual) != np.isnan(expected)).sum()
+    assert nan_mismatch == 0, f"{nan_mismatch} entries differ in NaN placement from DataFrame.corr()"
+    both = ~np.isnan(expected)
+    worst = np.abs(actual[both] - expected[both]).max()
+    assert worst <= tolerance, f"Max difference from DataFrame.corr() was {worst}, expected <= {tolerance}"
+
+#Testing a single window built from moments matches pandas pairwise-complete correlation
+def testing_correlation_from_moments_matches_pandas(sample_return_matrix):
+    window = sample_return_matrix.iloc[:20]
+    corr = correlation_from_moments(*pairwise_moments(window.to_numpy(), np.float64))
+    assert_matches_pandas(corr, window.corr().to_numpy(), 1e-9)
+
+#Testing the sliding engine yields the same dates and matrices as recomputing every window
+@pytest.mark.parametrize("dtype, tolerance", [(np.float32, 1e-4), (np.float64, 1e-9)])
+def testing_rolling_correlation_matrices_matches_pandas(sample_return_matrix, dtype, tolerance):
+    window = 20
+    results = list(rolling_correlation_matrices(sample_return_matrix, window=window, reanchor_every=30, dtype=dtype))
+
+    expected_dates = list(sample_return_matrix.index[window:])
+    assert [date for date, _ in results] == expected_dates, "Dates yielded do not match the dates after the first window"
+
+    for i, (_, corr) in enumerate(results):
+        expected = sample_return_matrix.iloc[i:i + window].corr().to_numpy()
+        assert_matches_pandas(corr, expected, tolerance)
+
+#Testing several windows in one pass match pandas, each date only carrying the windows with a full history
+@pytest.mark.parametrize("dtype, tolerance", [(np.float32, 1e-4), (np.float64, 1e-9)])
+def testing_rolling_correlation_states_multiple_windows(sample_return_matrix, dtype, tolerance):
+    windows = [5, 20, 60]
+    results = rolling_correlation_states(sample_return_matrix, windows, reanchor_every=30, dtype=dtype)
+    dates_seen = 0
+    for position, (current_date, states) in enumerate(results, start=5):
+        assert current_date == sample_return_matrix.index[position], f"Unexpected date {current_date}"
+        expected_windows = [window for window in windows if position >= window]
+        assert list(states) == expected_windows, f"Expected windows {expected_windows} on row {position}, got {list(states)}"
+        for window, state in states.items():
+            expected = sample_return_matrix.iloc[position - window:position].corr().to_numpy()
+            assert_matches_pandas(state.correlation(), expected, tolerance)
+        dates_seen += 1
+    assert dates_seen == len(sample_return_matrix) - 5, f"Expected every date after the shortest window, got {dates_seen}"
+
+#Testing pairs sharing only 2-4 rows of a short window stay within 1e-4 of pandas in float32 (they are recomputed from
+#the raw rows): a ticker listed late, sparse tickers and a ticker constant over the rows it shares with a sparse one
+def testing_sliding_state_sparse_overlap():
+    rng = np.random.default_rng(3)
+    n_days, n_tickers = 150, 30
+    returns = rng.normal(0, 0.01, (n_days, 1)) * rng.uniform(0, 2, n_tickers) + rng.normal(0, 0.02, (n_days, n_tickers))
+    returns[rng.random((n_days, n_tickers)) < 0.05] = np.nan
+    returns[:100, 10] = np.nan #listed late
+    returns[rng.random(n_days) < 0.6, 11] = np.nan
+    returns[rng.random(n_days) < 0.6, 12] = np.nan
+    returns[::3, 13] = 0.01
+    returns[~np.isnan(returns[:, 12]), 13] = 0.02
+    dates = pd.date_range("2023-01-02", periods=n_days, freq="B")
+    return_matrix = pd.DataFrame(returns.astype("float32"), index=dates, columns=[f"S{i}" for i in range(n_tickers)])
+
+    low_overlap = 0
+    for position, (_, states) in enumerate(rolling_correlation_states(return_matrix, [5, 20], reanchor_every=50), start=5):
+        for window, state in states.items():
+            expected = return_matrix.iloc[position - window:position].corr().to_numpy()
+            assert_matches_pandas(state.correlation(), expected, 1e-4)
+            low_overlap += np.count_nonzero((state.count >= 2) & (state.count <= 4))
+    assert low_overlap > 0, "Expected pairs sharing only a few rows"
+
+    #the standalone state keeps its rows through slide/add_row/remove_row
+    values = return_matrix.to_numpy()
+    state = SlidingCorrelationState(n_tickers)
+    state.reset(values[95:100])
+    for end in range(101, 120):
+        state.slide(values[end - 1], values[end - 6])
+    state.add_row(values[119])
+    state.add_row(values[120])
+    state.remove_row(values[114])
+    assert_matches_pandas(state.correlation(), return_matrix.iloc[115:121].corr().to_numpy(), 1e-4)
+
+#Testing tiles of the sliding state put together give the full matrix
+def testing_sliding_state_tiles(sample_return_matrix):
+    state = SlidingCorrelationState(sample_return_matrix.shape[1])
+    state.reset(sample_return_matrix.iloc[10:30].to_numpy())
+    full = state.correlation()
+    tiled = np.vstack([np.hstack([state.tile(r, r + 16, c, c + 16) for c in range(0, 48, 16)]) for r in range(0, 48, 16)])
+    np.testing.assert_array_equal(tiled[:40, :40], full)
+
+#Testing add_row/remove_row are inverse rank-1 updates of the same state
+def testing_add_then_remove_row_restores_state(sample_return_matrix):
+    values = sample_return_matrix.to_numpy(dtype=np.float64)
+    state = SlidingCorrelationState(values.shape[1], dtype=np.float64)
+    state.reset(values[:20])
+    before = state.correlation()
+
+    state.add_row(values[20])
+    state.remove_row(values[20])
+    after = state.correlation()
+
+    assert_matches_pandas(after, before, 1e-12)
+
+#Testing the batched kernel matches pandas for NaN-free, partially observed, all-NaN and constant columns
+def testing_batched_correlation_matches_pandas(sample_return_matrix):
+    window = sample_return_matrix.iloc[40:60].copy()
+    window.iloc[:, 5] = np.nan #no observations
+    window.iloc[:19, 6] = np.nan #a single observation
+    window.iloc[:, 7] = 0.01 #constant, non-zero
+    window.iloc[0, 8] = np.nan
+
+    corr = batched_correlation(window.to_numpy())
+    assert corr.dtype == np.float32, f"Expected float32 output, got {corr.dtype}"
+    assert_matches_pandas(corr, window.corr().to_numpy(), 1e-5)
+
+#Testing the kernel goes through the GEMM path alone when there are no NaNs
+def testing_batched_correlation_no_nans(sample_return_matrix):
+    window = sample_return_matrix.iloc[:20].fillna(0.0)
+    assert_matches_pandas(batched_correlation(window.to_numpy()), window.corr().to_numpy(), 1e-5)
@@ -0,0 +1,123 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.group_correlation import (
+    read_group_mapping,
+    group_codes,
+    group_correlation,
+    load_group_correlations,
+    group_matrix
+)
+from src.correlation import orchestrate_daily_correlation_summary_stats
+from fast_correlation_test import sample_return_matrix
+
+import pytest
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+
+WINDOW = 20
+
+@pytest.fixture
+def temp_output_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+#ticker -> group mapping over the sample tickers, T39 left unmapped
+@pytest.fixture
+def groups(sample_return_matrix):
+    tickers = list(sample_return_matrix.columns[:-1])
+    return pd.Series([["Energy", "Tech", "Banks"][i % 3] for i in range(len(tickers))], index=tickers)
+
+#Average of the pairwise correlations between (or within) two groups from a full correlation matrix
+def brute_force(corr: pd.DataFrame, members_1: list, members_2: list) -> float:
+    values = [
+        corr.loc[i, j] for i in members_1 for j in members_2
+        if (i < j if members_1 == members_2 else True) and not np.isnan(corr.loc[i, j])
+    ]
+    return np.mean(values) if values else np.nan
+
+#Testing the indicator products give the average of every pair of fully observed tickers, constant columns left out
+def testing_group_correlation_matches_pairs(sample_return_matrix, groups):
+    window = sample_return_matrix.iloc[40:60].fillna(0.0)
+    codes, names = group_codes(window.columns, groups)
+    assert names == ["Banks", "Energy", "Tech"] and codes[-1] == -1, f"Unexpected groups {names}, {codes[-1]}"
+
+    average, pairs = group_correlation(window.to_numpy(), codes, len(names))
+    corr = window.corr()
+    for a, name_a in enumerate(names):
+        for b, name_b in enumerate(names):
+            members_a = [t for t in groups.index[groups == name_a] if t != "T3"] #T3 is constant
+            members_b = [t for t in groups.index[groups == name_b] if t != "T3"]
+            expected = brute_force(corr, members_a, members_b)
+            assert average[a, b] == pytest.approx(expected, abs=1e-6), f"{name_a}/{name_b}: {average[a, b]} != {expected}"
+            expected_pairs = len(members_a) * (len(members_a) - 1) // 2 if a == b else len(members_a) * len(members_b)
+            assert pairs[a, b] == expected_pairs, f"{name_a}/{name_b}: {pairs[a, b]} pairs, expected {expected_pairs}"
+
+#Testing tickers with missing days get pandas' pairwise-complete correlations: one group listed 8 days into the window,
+#random gaps, a ticker with a single return and one that is constant over the days another ticker has
+def testing_group_correlation_with_gaps():
+    rng = np.random.default_rng(11)
+    tickers = [f"G{i}" for i in range(60)]
+    market = rng.normal(0, 0.01, (WINDOW, 1))
+    window = pd.DataFrame(market * rng.uniform(0.5, 1.5, 60) + rng.normal(0, 0.008, (WINDOW, 60)), columns=tickers)
+    window.iloc[:8, 40:] = np.nan #the third group is listed late
+    window = window.mask(rng.random(window.shape) < 0.05)
+    window.iloc[:-1, 5] = np.nan #a single return, no correlation
+    window.iloc[:, 6] = np.nan
+    window.iloc[[0, 1, 2], 6] = [0.01, 0.01, 0.02] #constant over the two days it shares with G7
+    window.iloc[:, 7] = np.nan
+    window.iloc[[0, 1, 3], 7] = [0.01, -0.02, 0.03]
+    groups = pd.Series([["A", "B", "C"][i // 20] for i in range(60)], index=tickers)
+    codes, names = group_codes(tickers, groups)
+
+    average, pairs = group_correlation(window.to_numpy(), codes, len(names))
+    corr = window.corr()
+    for a, name_a in enumerate(names):
+        for b, name_b in enumerate(names):
+            members_a, members_b = list(groups.index[groups == name_a]), list(groups.index[groups == name_b])
+            expected = brute_force(corr, members_a, members_b)
+            assert average[a, b] == pytest.approx(expected, abs=1e-9), f"{name_a}/{name_b}: {average[a, b]} != {expected}"
+            block = corr.loc[members_a, members_b].to_numpy()
+            block = block[np.triu_indices(len(members_a), 1)] if a == b else block
+            expected_pairs = np.count_nonzero(~np.isnan(block))
+            assert pairs[a, b] == expected_pairs, f"{name_a}/{name_b}: {pairs[a, b]} pairs, expected {expected_pairs}"
+
+#Testing the mapping reader accepts a Sector column and rejects files without a group column
+def testing_read_group_mapping(temp_output_dir):
+    path = os.path.join(temp_output_dir, "sectors.csv")
+    pd.DataFrame({"Ticker": ["AAPL", " MSFT", "XOM"], "Sector": ["Tech", "Tech", "Energy "]}).to_csv(path, index=False)
+    mapping = read_group_mapping(path)
+    assert mapping.to_dict() == {"AAPL": "Tech", "MSFT": "Tech", "XOM": "Energy"}, f"Unexpected mapping {mapping.to_dict()}"
+
+    pd.DataFrame({"Ticker": ["AAPL"], "Industry": ["Tech"]}).to_csv(path, index=False)
+    with pytest.raises(ValueError):
+        read_group_mapping(path)
+
+#Testing both engines store the same G x G averages for every date
+def testing_pipeline_stores_group_averages(sample_return_matrix, groups, temp_output_dir):
+    results = {}
+    for engine in ["window", "sliding"]:
+        output_dir = os.path.join(temp_output_dir, engine)
+        orchestrate_daily_correlation_summary_stats(
+            sample_return_matrix, window=WINDOW, output_directory=output_dir, engine=engine, groups=groups
+        )
+        results[engine] = load_group_correlations(output_dir, window=WINDOW)
+
+    table = results["window"]
+    assert table["Date"].nunique() == len(sample_return_matrix) - WINDOW, "Expected group averages for every date"
+    assert len(table) == table["Date"].nunique() * 6, "Expected the 6 pairs of groups (diagonal included) per date"
+    pd.testing.assert_frame_equal(table, results["sliding"])
+
+    position = WINDOW + 10
+    date = sample_return_matrix.index[position]
+    matrix = group_matrix(table[table["Date"] == date])
+    assert list(matrix.index) == ["Banks", "Energy", "Tech"], f"Unexpected groups {list(matrix.index)}"
+    np.testing.assert_array_equal(matrix.to_numpy(), matrix.to_numpy().T)
+    rows = sample_return_matrix.iloc[position - WINDOW:position].to_numpy()
+    codes, names = group_codes(sample_return_matrix.columns, groups)
+    np.testing.assert_allclose(matrix.to_numpy(), group_correlation(rows, codes, len(names))[0], atol=1e-6)
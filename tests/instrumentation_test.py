@@ -0,0 +1,95 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src import instrumentation
+from src.instrumentation import span, instrumented, run_report
+from src.correlation import orchestrate_daily_correlation_summary_stats
+from fast_correlation_test import sample_return_matrix
+from orchestration_test import price_zip, temp_dir
+from orchestration import orchestrate_pipeline
+
+import pytest
+import time
+import json
+
+WINDOW = 20
+
+@pytest.fixture(autouse=True)
+def clean_recorder():
+    instrumentation.reset()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+#Testing a disabled span records nothing and costs well under a microsecond or two
+def testing_disabled_spans_are_cheap():
+    start = time.perf_counter()
+    for _ in range(100_000):
+        with span("tile", rows=256):
+            pass
+    per_span = (time.perf_counter() - start) / 100_000
+    assert instrumentation.events() == [], "Nothing should be recorded while instrumentation is off"
+    assert per_span < 2e-6, f"A disabled span took {per_span * 1e9:.0f}ns"
+
+#Testing run_traced hands back the call's spans and counters and leaves instrumentation as it found it
+def testing_run_traced_restores_state():
+    def task(rows):
+        with span("inner"):
+            instrumentation.add_counter("rows", rows)
+        return rows * 2
+
+    result, events, counters = instrumentation.run_traced(task, 3)
+    assert result == 6 and [event["name"] for event in events] == ["inner"], f"Unexpected result {result}, {events}"
+    assert counters == {"rows": 3}, f"Counters recorded by the call should come back, got {counters}"
+    assert not instrumentation.is_enabled(), "A worker that was not tracing should stop recording after the call"
+    assert instrumentation.events() == [] and instrumentation.counters() == {}, "Nothing should be kept in the worker"
+
+    instrumentation.enable()
+    instrumentation.run_traced(task, 1)
+    assert instrumentation.is_enabled(), "A worker that was already tracing should keep recording"
+
+#Testing a window engine run records every stage, task and date (spans of the worker threads included) and the report
+@pytest.mark.parametrize("scheduler", ["threads", "processes"])
+def testing_window_engine_trace(sample_return_matrix, temp_dir, scheduler, capsys):
+    trace_path = os.path.join(temp_dir, "trace.json")
+    with instrumented(trace_path):
+        orchestrate_daily_correlation_summary_stats(
+            sample_return_matrix, window=WINDOW, output_directory=os.path.join(temp_dir, "store"),
+            scheduler=scheduler, max_workers=2, batch_size=30, progress=lambda stats: None
+        )
+
+    with open(trace_path) as f:
+        trace = json.load(f)
+    spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    names = {event["name"] for event in spans}
+    for name in ["task", "date", "correlation_window", "correlation_tile", "reduce_tile", "triu", "histogram",
+                 "top_pairs", "median_band", "store_write", "on_result"]:
+        assert name in names, f"Expected {name} spans in the trace, got {sorted(names)}"
+
+    dates = [event["args"]["date"] for event in spans if event["name"] == "date"]
+    assert sorted(dates) == list(sample_return_matrix.index[WINDOW:].strftime("%Y-%m-%d")), "Expected one date span per date"
+    assert all(event["dur"] >= 0 and event["ts"] > 0 for event in spans), "Spans need a start and a duration"
+    tasks = [event for event in spans if event["name"] == "task"]
+    assert all(event["args"]["peak_rss_mb"] > 0 for event in tasks), "Every task should carry its peak RSS"
+    if scheduler == "processes":
+        assert {event["pid"] for event in spans if event["name"] == "date"} - {os.getpid()}, "Worker spans should come back"
+    assert trace["otherData"]["counters"]["idle_worker_seconds"] >= 0, "Idle time should be counted"
+
+    report = capsys.readouterr().out
+    assert "slowest dates:" in report and "scheduler idle:" in report and "reduce_tile" in report, f"Unexpected report {report}"
+    assert not instrumentation.is_enabled(), "Instrumentation should be off again after the block"
+
+#Testing the pipeline's trace option covers loading, the sliding engine and the store writes
+def testing_pipeline_trace(price_zip, temp_dir):
+    trace_path = os.path.join(temp_dir, "trace.json")
+    orchestrate_pipeline(
+        price_zip, output_correlations_dir=os.path.join(temp_dir, "store"), trace=trace_path, launch_dashboard=False
+    )
+    with open(trace_path) as f:
+        names = {event["name"] for event in json.load(f)["traceEvents"]}
+    for name in ["load_return_matrix", "data_load_zip", "correlation_summaries", "slide", "reanchor", "normalise",
+                 "date", "store_write", "write_rollups"]:
+        assert name in names, f"Expected {name} spans in the trace, got {sorted(names)}"
+    assert "slowest dates:" in run_report(), "The report should list the slowest dates"
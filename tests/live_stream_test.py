@@ -0,0 +1,140 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.live_stream import (
+    LiveCorrelation,
+    parse_price_line,
+    tail_lines,
+    socket_lines,
+    run_live,
+    read_live_summary
+)
+from src.correlation import computing_daily_returns, pivot_returns, summarize_rows
+from src.synthetic_market import generate_prices
+from src.summary_reducer import MEDIAN_BINS
+from fast_correlation_test import assert_matches_pandas
+
+import pytest
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+import socket
+import threading
+
+WINDOW = 10
+
+@pytest.fixture
+def temp_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+#40 days of prices for 30 tickers with missing prices, split into the archive (first 35 days) and the days streamed live
+@pytest.fixture
+def prices():
+    prices = generate_prices(30, 40, nan_density=0.05, seed=4).dropna(subset=["Price"])
+    prices["Ticker"] = prices["Ticker"].astype(str)
+    return prices
+
+def split_days(prices):
+    days = np.sort(prices["Date"].unique())
+    return prices[prices["Date"] < days[35]], prices[prices["Date"] >= days[35]], days[35:]
+
+#The window the batch pipeline would correlate once the prices seen so far are final
+def expected_window(prices_seen: pd.DataFrame) -> pd.DataFrame:
+    return pivot_returns(computing_daily_returns(prices_seen)).iloc[-WINDOW:]
+
+def price_lines(rows: pd.DataFrame) -> list:
+    return [f"{ticker},{date.strftime('%Y-%m-%d')},{price}" for ticker, date, price in rows[["Ticker", "Date", "Price"]].itertuples(index=False)]
+
+#Testing the live correlations match pandas on the window that ends with today's partial day, and after a day closes
+def testing_live_window_matches_pandas(prices):
+    archive, stream, days = split_days(prices)
+    live = LiveCorrelation.from_prices(archive, WINDOW)
+    assert live.summary()["tickers_updated"] == 0, "No ticker has a price today before the first update"
+
+    today = stream[stream["Date"] == days[0]]
+    first, second = today.iloc[::3], today.iloc[1::3] #a third, then two thirds of the tickers have printed
+    for seen, updates in [(first, first), (pd.concat([first, second]), second), (today, today)]:
+        live.apply([parse_price_line(line) for line in price_lines(updates)])
+        expected = expected_window(pd.concat([archive, seen]))
+        assert_matches_pandas(live.state.tile(0, 30), expected.corr().to_numpy(), 1e-5)
+
+    #the next day's prices close today: it becomes a completed day and the oldest one leaves the window
+    next_day = stream[stream["Date"] == days[1]].iloc[:20]
+    live.apply([parse_price_line(line) for line in price_lines(next_day)])
+    expected = expected_window(pd.concat([archive, today, next_day]))
+    assert_matches_pandas(live.state.tile(0, 30), expected.corr().to_numpy(), 1e-5)
+    assert live.today == pd.Timestamp(days[1]), f"Expected {days[1]} to be today, got {live.today}"
+
+    summary = live.summary()
+    reference = summarize_rows(expected.to_numpy(), live.tickers, live.today)
+    for key in ["mean_correlation", "std_correlation", "pct_above_0.7", "correlation_entropy"]:
+        assert summary[key] == pytest.approx(reference[key], abs=1e-5), f"{key} differs from the batch summary"
+    assert abs(summary["median_correlation"] - reference["median_correlation"]) <= 2 / MEDIAN_BINS, "Median outside one fine bin"
+    assert summary["top_5_most_negative"][0]["correlation"] == pytest.approx(reference["top_5_most_negative"][0]["correlation"], abs=1e-5)
+    assert summary["tickers_updated"] == 20 and summary["window"] == WINDOW, f"Unexpected live details {summary}"
+
+#Testing lines that cannot be applied are skipped and counted
+def testing_bad_updates_are_skipped(prices):
+    archive, stream, days = split_days(prices)
+    live = LiveCorrelation.from_prices(archive, WINDOW)
+    assert parse_price_line("Ticker,Date,Price") is None and parse_price_line("T0,not a date,1") is None, "Header/garbage should not parse"
+    assert parse_price_line("T0,2024-01-02,12.5,1000") == ("T0", pd.Timestamp("2024-01-02"), 12.5), "Extra columns should be ignored"
+
+    ticker = archive["Ticker"].iloc[0]
+    applied = live.apply([
+        ("UNKNOWN", days[0], 10.0), #not in the archive
+        (ticker, archive["Date"].max(), 10.0), #already a completed day
+        (ticker, days[0], float("nan")),
+        (ticker, days[1], 10.0)
+    ])
+    assert applied == 1 and live.skipped == 3, f"Expected 1 applied and 3 skipped, got {applied} and {live.skipped}"
+    assert live.apply([(ticker, days[0], 10.0)]) == 0, "A date before today should be skipped once a later day is open"
+
+#Testing the live loop follows a file (including a line written in two parts) and publishes each refresh
+def testing_run_live_tails_file(prices, temp_dir):
+    archive, stream, days = split_days(prices)
+    live = LiveCorrelation.from_prices(archive, WINDOW)
+    lines = price_lines(stream[stream["Date"] == days[0]])
+    path = os.path.join(temp_dir, "prices.csv")
+    with open(path, "w") as f:
+        f.write("Ticker,Date,Price\n" + "\n".join(lines[:-1]) + "\n" + lines[-1][:3])
+
+    stop = threading.Event()
+    published = []
+    def on_publish(summary):
+        published.append(summary)
+        if len(published) == 1:
+            with open(path, "a") as f:
+                f.write(lines[-1][3:] + "\n") #completes the last line
+        else:
+            stop.set()
+
+    run_live(live, tail_lines(path, poll_interval=0.01, stop=stop), temp_dir, on_publish)
+    assert [summary["tickers_updated"] for summary in published] == [len(lines) - 1, len(lines)], "Expected two refreshes"
+    stored = read_live_summary(temp_dir)
+    assert stored["tickers_updated"] == len(lines) and stored["latency_seconds"] >= 0, f"Unexpected published summary {stored}"
+    assert stored["Date"] == pd.Timestamp(days[0]).strftime("%Y-%m-%d"), "Live summary should be dated today"
+
+#Testing the socket source collects lines from a client, including a last line without a newline
+def testing_socket_lines():
+    with socket.socket() as probe: #free port for the listener
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    stop = threading.Event()
+    source = socket_lines(port, poll_interval=0.01, stop=stop)
+    next(source) #binds and listens
+
+    with socket.create_connection(("127.0.0.1", port)) as client:
+        client.sendall(b"T0,2024-01-02,10\nT1,2024-01-02,")
+        client.sendall(b"11\nT2,2024-01-02,12")
+    received = []
+    for lines in source:
+        received += lines
+        if len(received) == 3:
+            stop.set()
+    assert received == ["T0,2024-01-02,10", "T1,2024-01-02,11", "T2,2024-01-02,12"], f"Unexpected lines {received}"
@@ -0,0 +1,90 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.neighbour_index import top_k_per_row, append_neighbours, load_neighbours, neighbour_dates, neighbour_parts
+from src.correlation import orchestrate_daily_correlation_summary_stats
+from src.summary_store import load_summary_stats
+from fast_correlation_test import sample_return_matrix
+
+import pytest
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+
+WINDOW = 20
+K = 5
+
+@pytest.fixture
+def temp_output_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+#Expected (peers, correlations) of one row by sorting every other non-NaN column
+def expected_peers(row: np.ndarray, own_column: int, k: int, kind: str):
+    columns = [j for j in range(len(row)) if j != own_column and not np.isnan(row[j])]
+    columns.sort(key=lambda j: -row[j] if kind == "most" else row[j])
+    return columns[:k], row[columns[:k]]
+
+#Testing the top k of every row skip the ticker itself and NaNs, and pad rows with too few peers
+def testing_top_k_per_row_matches_sort():
+    rng = np.random.default_rng(3)
+    corr = rng.uniform(-1, 1, (12, 12)).astype(np.float32)
+    corr[rng.random(corr.shape) < 0.2] = np.nan
+    corr[7, :] = np.nan
+    corr[7, [0, 1]] = [0.5, -0.25] #only two peers
+
+    most_index, most_correlation, least_index, least_correlation = top_k_per_row(corr[4:12], 4, K)
+    assert most_index.shape == (8, K) and most_index.dtype == np.int32, f"Unexpected index {most_index.shape} {most_index.dtype}"
+    assert most_correlation.dtype == np.float16, f"Expected float16 correlations, got {most_correlation.dtype}"
+    for i in range(8):
+        for kind, index, correlation in [("most", most_index, most_correlation), ("least", least_index, least_correlation)]:
+            peers, values = expected_peers(corr[4 + i], 4 + i, K, kind)
+            assert list(index[i, :len(peers)]) == peers, f"Row {4 + i} {kind} peers {index[i]} != {peers}"
+            np.testing.assert_allclose(correlation[i, :len(peers)], values, atol=1e-3)
+            assert (index[i, len(peers):] == -1).all() and np.isnan(correlation[i, len(peers):]).all(), "Empty slots should be -1/NaN"
+
+#Testing the index written alongside the summaries matches pandas for one ticker, with either engine
+@pytest.mark.parametrize("engine", ["window", "sliding"])
+def testing_pipeline_neighbours_match_pandas(sample_return_matrix, temp_output_dir, engine):
+    orchestrate_daily_correlation_summary_stats(
+        sample_return_matrix, window=WINDOW, output_directory=temp_output_dir, engine=engine, batch_size=30, neighbours=K
+    )
+    dates = sample_return_matrix.index[WINDOW:]
+    assert neighbour_dates(temp_output_dir, WINDOW).equals(pd.DatetimeIndex(dates)), "Every summarised date should have peers"
+    assert len(load_summary_stats(temp_output_dir)) == len(dates), "Summaries should still be written"
+
+    tickers = list(sample_return_matrix.columns)
+    for kind in ["most", "least"]:
+        neighbours = load_neighbours(temp_output_dir, "T0", dates[10], dates[15], window=WINDOW, kind=kind)
+        assert list(neighbours.columns) == ["Date", "rank", "peer", "correlation"], f"Unexpected columns {neighbours.columns}"
+        assert list(neighbours["Date"].unique()) == list(dates[10:16]), "Expected the inclusive date range only"
+        for date, rows in neighbours.groupby("Date"):
+            position = sample_return_matrix.index.get_loc(date)
+            corr = sample_return_matrix.iloc[position - WINDOW:position].corr().to_numpy()
+            peers, values = expected_peers(corr[0], 0, K, kind)
+            assert list(rows["rank"]) == list(range(1, K + 1)), "Ranks should run from 1 to k"
+            assert list(rows["peer"]) == [tickers[j] for j in peers], f"Peers of T0 on {date} do not match pandas"
+            np.testing.assert_allclose(rows["correlation"], values, atol=2e-3)
+
+    assert load_neighbours(temp_output_dir, "T3", window=WINDOW).empty, "A constant column has no correlated peers"
+
+#Testing a date written twice keeps the latest part, and the index is skipped when neighbours is 0
+def testing_latest_part_wins(sample_return_matrix, temp_output_dir):
+    n_columns = sample_return_matrix.shape[1]
+    tickers = sample_return_matrix.columns
+    date = sample_return_matrix.index[30]
+    def summary(peer):
+        index = np.full((n_columns, K), peer, dtype=np.int32)
+        correlation = np.full((n_columns, K), 0.5, dtype=np.float16)
+        return {"Date": date, "window": WINDOW, "neighbours": (index, correlation, index, correlation)}
+
+    append_neighbours([summary(1)], temp_output_dir, tickers)
+    append_neighbours([summary(2)], temp_output_dir, tickers)
+    append_neighbours([{"Date": date, "window": WINDOW}], temp_output_dir, tickers)
+    assert len(neighbour_parts(temp_output_dir, WINDOW)) == 2, "Summaries without peers should not add a part"
+    neighbours = load_neighbours(temp_output_dir, "T0", window=WINDOW)
+    assert set(neighbours["peer"]) == {"T2"}, f"Expected the latest part's peers, got {set(neighbours['peer'])}"
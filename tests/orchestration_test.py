@@ -0,0 +1,183 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from orchestration import orchestrate_pipeline, orchestrate_live, plan_incremental_run
+from src.summary_store import (
+    load_summary_stats,
+    load_top_pairs,
+    read_manifest,
+    read_journal,
+    write_manifest,
+    convert_pickle_directory,
+    STAT_COLUMNS
+)
+from src.correlation import SUMMARY_CODE_VERSION
+from src.helpers import pickle_save
+from src.correlation_change import load_change_stats
+
+import pytest
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+import zipfile
+
+TICKERS = ["AAPL", "MSFT", "GOOG", "TSLA", "AMZN", "META", "NFLX", "NVDA", "JPM", "BAC", "WMT", "PG"]
+
+#writes a .zip with one .csv of prices per ticker
+def write_price_zip(path, dates, tickers, seed=0):
+    rng = np.random.default_rng(seed)
+    with zipfile.ZipFile(path, "w") as zip_ref:
+        for ticker in tickers:
+            prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+            prices[rng.random(len(dates)) < 0.03] = np.nan #missing prices get dropped on load
+            df = pd.DataFrame({"Ticker": ticker, "Date": dates.strftime("%Y-%m-%d"), "Price": prices})
+            zip_ref.writestr(f"{ticker}.csv", df.to_csv(index=False))
+
+@pytest.fixture
+def temp_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+@pytest.fixture
+def price_zip(temp_dir):
+    path = os.path.join(temp_dir, "stock_data.zip")
+    write_price_zip(path, pd.bdate_range("2022-01-03", periods=80), TICKERS)
+    return path
+
+#Testing an incremental update gives the same summaries as computing everything in one go
+def testing_incremental_run_matches_full_run(price_zip, temp_dir):
+    full_dir = os.path.join(temp_dir, "full")
+    incremental_dir = os.path.join(temp_dir, "incremental")
+    cutoff = pd.bdate_range("2022-01-03", periods=80)[59]
+
+    orchestrate_pipeline(price_zip, output_correlations_dir=full_dir, launch_dashboard=False)
+    orchestrate_pipeline(price_zip, output_correlations_dir=incremental_dir, end_date=cutoff, launch_dashboard=False)
+    assert load_summary_stats(incremental_dir)["Date"].max() == cutoff, "First run should stop at the cutoff date"
+
+    orchestrate_pipeline(price_zip, output_correlations_dir=incremental_dir, incremental=True, launch_dashboard=False)
+
+    expected, actual = load_summary_stats(full_dir), load_summary_stats(incremental_dir)
+    assert list(actual["Date"]) == list(expected["Date"]), "Incremental run should fill in exactly the missing dates"
+    for key in ["mean_correlation", "median_correlation", "std_correlation", "pct_above_0.7"]:
+        difference = (actual[key] - expected[key]).abs().max()
+        assert difference < 1e-4, f"{key} differs from the full run by up to {difference}"
+    assert read_manifest(incremental_dir)["last_date"] == expected["Date"].max().strftime("%Y-%m-%d"), "Manifest not updated"
+
+#Testing a store converted from pickles (no recorded ticker universe) is extended by an incremental run
+def testing_converted_store_is_extended(price_zip, temp_dir):
+    full_dir = os.path.join(temp_dir, "full")
+    converted_dir = os.path.join(temp_dir, "converted")
+    pickle_dir = os.path.join(temp_dir, "pickles")
+    cutoff = pd.bdate_range("2022-01-03", periods=80)[59]
+    orchestrate_pipeline(price_zip, output_correlations_dir=full_dir, launch_dashboard=False)
+
+    #the summaries up to the cutoff as the pickles earlier versions wrote
+    stats = load_summary_stats(full_dir, end_date=cutoff)
+    top_pairs = load_top_pairs(full_dir, stats["Date"].min(), cutoff)
+    for _, row in stats.iterrows():
+        summary = {"Date": row["Date"].strftime("%Y-%m-%d"), **{key: row[key] for key in STAT_COLUMNS}}
+        for category, pairs in top_pairs[top_pairs["Date"] == row["Date"]].sort_values("rank").groupby("category"):
+            summary[category] = pairs[["ticker_1", "ticker_2", "correlation"]].to_dict("records")
+        pickle_save(summary, os.path.join(pickle_dir, f"correlation_summary_{summary['Date']}.pkl"))
+    convert_pickle_directory(pickle_dir, converted_dir, code_version=SUMMARY_CODE_VERSION)
+
+    _, first_date, reason = plan_incremental_run(converted_dir, window=20)
+    assert reason is None and first_date > cutoff, f"Converted store should be extendable, got '{reason}'"
+    orchestrate_pipeline(price_zip, output_correlations_dir=converted_dir, incremental=True, launch_dashboard=False)
+    expected, actual = load_summary_stats(full_dir), load_summary_stats(converted_dir)
+    assert list(actual["Date"]) == list(expected["Date"]), "Incremental run should add the dates after the cutoff"
+    difference = (actual["mean_correlation"] - expected["mean_correlation"]).abs().max()
+    assert difference < 1e-4, f"mean_correlation differs from the full run by up to {difference}"
+    assert read_manifest(converted_dir)["tickers"] == sorted(TICKERS), "Extending run should record the universe"
+
+#Testing a different window size is reported as needing a full rebuild
+def testing_window_change_requires_rebuild(price_zip, temp_dir):
+    output_dir = os.path.join(temp_dir, "summaries")
+    orchestrate_pipeline(price_zip, output_correlations_dir=output_dir, launch_dashboard=False)
+
+    load_start, first_date, reason = plan_incremental_run(output_dir, window=20)
+    assert reason is None, f"Same window should be extendable, got '{reason}'"
+    assert first_date > load_summary_stats(output_dir)["Date"].max(), "First new date should be after the stored dates"
+
+    _, _, reason = plan_incremental_run(output_dir, window=10)
+    assert reason is not None and "window" in reason, f"Expected a window change to require a rebuild, got '{reason}'"
+
+#Testing a new ticker in the archive triggers a full rebuild instead of an update
+def testing_new_ticker_triggers_rebuild(temp_dir):
+    dates = pd.bdate_range("2022-01-03", periods=80)
+    zip_path = os.path.join(temp_dir, "stock_data.zip")
+    output_dir = os.path.join(temp_dir, "summaries")
+
+    write_price_zip(zip_path, dates, TICKERS)
+    orchestrate_pipeline(zip_path, output_correlations_dir=output_dir, end_date=dates[59], launch_dashboard=False)
+    old_hash = read_manifest(output_dir)["ticker_universe_hash"]
+
+    write_price_zip(zip_path, dates, TICKERS + ["XOM"])
+    orchestrate_pipeline(zip_path, output_correlations_dir=output_dir, incremental=True, launch_dashboard=False)
+
+    manifest = read_manifest(output_dir)
+    assert manifest["ticker_universe_hash"] != old_hash, "Universe hash should change with the new ticker"
+    assert "XOM" in manifest["tickers"], "New ticker missing from the manifest"
+    assert list(load_summary_stats(output_dir)["Date"]) == list(dates[21:]), "Rebuild should cover every date"
+
+#Testing a resumed run only recomputes the dates lost in the interruption and ends with the same summaries
+def testing_resume_recomputes_missing_dates(price_zip, temp_dir):
+    full_dir = os.path.join(temp_dir, "full")
+    resumed_dir = os.path.join(temp_dir, "resumed")
+    orchestrate_pipeline(price_zip, output_correlations_dir=full_dir, launch_dashboard=False)
+    orchestrate_pipeline(price_zip, output_correlations_dir=resumed_dir, launch_dashboard=False)
+
+    #simulate a crash: the first append's stats part is truncated and the run never wrote its final manifest
+    journal = read_journal(resumed_dir)
+    lost_dates = journal[0]["dates"]
+    with open(os.path.join(resumed_dir, journal[0]["files"][0]), "r+b") as f:
+        f.truncate(50)
+    manifest = read_manifest(resumed_dir)
+    write_manifest(resumed_dir, manifest["windows"], manifest["tickers"], manifest["code_version"], None)
+
+    orchestrate_pipeline(price_zip, output_correlations_dir=resumed_dir, incremental=True, launch_dashboard=False)
+
+    new_records = read_journal(resumed_dir)[len(journal):]
+    recomputed = sorted(date for record in new_records for date in record["dates"])
+    assert recomputed == lost_dates, f"Only the {len(lost_dates)} lost dates should be recomputed, got {len(recomputed)}"
+
+    expected, actual = load_summary_stats(full_dir), load_summary_stats(resumed_dir)
+    assert list(actual["Date"]) == list(expected["Date"]), "Resumed run should cover every date"
+    difference = (actual["mean_correlation"] - expected["mean_correlation"]).abs().max()
+    assert difference < 1e-6, f"Resumed summaries differ from the full run by up to {difference}"
+    assert read_manifest(resumed_dir)["last_date"] is not None, "Finished run should record its last date"
+
+#Testing incremental and resumed runs with other optional stages rebuild instead of mixing dates with and without them
+def testing_stage_change_requires_rebuild(price_zip, temp_dir):
+    output_dir = os.path.join(temp_dir, "summaries")
+    groups_csv = os.path.join(temp_dir, "groups.csv")
+    pd.DataFrame({"Ticker": TICKERS, "Group": ["tech"] * 8 + ["other"] * 4}).to_csv(groups_csv, index=False)
+    cutoff = pd.bdate_range("2022-01-03", periods=80)[59]
+    orchestrate_pipeline(price_zip, output_correlations_dir=output_dir, end_date=cutoff, neighbours=2,
+                         launch_dashboard=False)
+    assert read_manifest(output_dir)["stages"]["neighbours"] == 2, "Neighbour setting missing from the manifest"
+
+    _, _, reason = plan_incremental_run(output_dir, window=20)
+    assert reason is not None and "neighbours" in reason, f"Expected dropping the neighbours to rebuild, got '{reason}'"
+
+    orchestrate_pipeline(price_zip, output_correlations_dir=output_dir, incremental=True, neighbours=2,
+                         groups_csv=groups_csv, launch_dashboard=False)
+    stages = read_manifest(output_dir)["stages"]
+    assert stages["groups_hash"] is not None and stages["neighbours"] == 2, f"Stage settings not recorded: {stages}"
+    dates = pd.bdate_range("2022-01-03", periods=80)
+    assert list(load_summary_stats(output_dir)["Date"]) == list(dates[21:]), "Adding groups should rebuild every date"
+
+    orchestrate_pipeline(price_zip, output_correlations_dir=output_dir, resume=True, neighbours=2, groups_csv=groups_csv,
+                         changes=5, launch_dashboard=False)
+    assert list(load_change_stats(output_dir)["Date"]) == list(dates[22:]), \
+        "Resuming with day-over-day changes should rebuild them for every date"
+    assert read_manifest(output_dir)["stages"]["changes"] == 5, "Changes setting missing from the manifest"
+
+#Testing live mode rejects several window lengths before loading any data
+def testing_live_rejects_several_windows(temp_dir):
+    with pytest.raises(ValueError):
+        orchestrate_live(os.path.join(temp_dir, "missing.zip"), window=[20, 60], output_correlations_dir=temp_dir)
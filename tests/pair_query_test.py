@@ -0,0 +1,84 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.pair_query import CorrelationQuery
+from src.return_cache import save_return_matrix
+from fast_correlation_test import sample_return_matrix, assert_matches_pandas
+
+import pytest
+import numpy as np
+import tempfile
+import shutil
+
+WINDOW = 20
+
+#Testing a pair's history matches DataFrame.corr() on every window (scattered NaNs, a ticker with itself)
+@pytest.mark.parametrize("ticker_1, ticker_2", [("T0", "T1"), ("T2", "T4"), ("T5", "T5")])
+def testing_pair_history_matches_pandas(sample_return_matrix, ticker_1, ticker_2):
+    history = CorrelationQuery(sample_return_matrix, WINDOW).pair_history(ticker_1, ticker_2)
+    assert list(history.index) == list(sample_return_matrix.index[WINDOW:]), "Expected one value per date with a full window"
+    expected = [
+        sample_return_matrix.iloc[i - WINDOW:i][[ticker_1, ticker_2]].corr().iloc[0, -1]
+        for i in range(WINDOW, len(sample_return_matrix))
+    ]
+    assert_matches_pandas(history.to_numpy(), np.array(expected), 1e-9)
+
+#Testing start/end are inclusive and a reversed pair reuses the cached history
+def testing_pair_history_range_and_cache(sample_return_matrix):
+    query = CorrelationQuery(sample_return_matrix, WINDOW)
+    dates = sample_return_matrix.index
+    history = query.pair_history("T0", "T1", dates[40], dates[60])
+    assert history.index[0] == dates[40] and history.index[-1] == dates[60], "start and end should both be included"
+    np.testing.assert_allclose(history.to_numpy(), query.pair_history("T0", "T1").loc[dates[40]:dates[60]].to_numpy(), atol=1e-12)
+    assert query.pair_history("T0", "T3").isna().all(), "A constant column should give NaN correlations"
+
+    reversed_history = query.pair_history("T1", "T0", dates[40], dates[60])
+    np.testing.assert_array_equal(reversed_history.to_numpy(), history.to_numpy())
+    assert query.cache_info()["hits"] == 1, f"Reversed pair should be a cache hit, got {query.cache_info()}"
+
+    assert query.pair_history("T0", "T1", dates[0], dates[5]).empty, "Dates without a full window should give no values"
+
+#Testing one ticker against all matches the column of the full correlation matrix
+def testing_ticker_vs_all_matches_pandas(sample_return_matrix):
+    query = CorrelationQuery(sample_return_matrix, WINDOW)
+    date = sample_return_matrix.index[70]
+    expected = sample_return_matrix.iloc[70 - WINDOW:70].corr()
+    for ticker in ["T0", "T5", "T9"]:
+        peers = query.ticker_vs_all(ticker, date)
+        assert list(peers.index) == list(sample_return_matrix.columns), "Expected one value per ticker, in column order"
+        assert_matches_pandas(peers.to_numpy(), expected[ticker].to_numpy(), 1e-9)
+
+    with pytest.raises(ValueError):
+        query.ticker_vs_all("T0", sample_return_matrix.index[5])
+    with pytest.raises(ValueError):
+        query.ticker_vs_all("MISSING", date)
+
+#Testing the cache is bounded, evicts the least recently used entry and hands out copies
+def testing_query_cache_is_lru(sample_return_matrix):
+    query = CorrelationQuery(sample_return_matrix, WINDOW, cache_size=2)
+    dates = sample_return_matrix.index
+    query.ticker_vs_all("T0", dates[50])
+    query.ticker_vs_all("T0", dates[51])
+    peers = query.ticker_vs_all("T0", dates[50]) #hit, T0 on dates[51] is now the least recently used
+    peers.iloc[:] = 0
+    query.ticker_vs_all("T0", dates[52])
+    assert query.cache_info()["size"] == 2, f"Cache should hold 2 entries, got {query.cache_info()}"
+
+    misses = query.cache_info()["misses"]
+    assert query.ticker_vs_all("T0", dates[50])["T0"] == pytest.approx(1.0), "Cached result should not be changed by callers"
+    assert query.cache_info()["misses"] == misses, "Most recently used entry should still be cached"
+    query.ticker_vs_all("T0", dates[51])
+    assert query.cache_info()["misses"] == misses + 1, "Least recently used entry should have been evicted"
+
+#Testing queries over a memory-mapped return cache entry
+def testing_query_from_cache_entry(sample_return_matrix):
+    temp_dir = tempfile.mkdtemp()
+    try:
+        entry_dir = save_return_matrix(sample_return_matrix, os.path.join(temp_dir, "entry"))
+        query = CorrelationQuery.from_cache(entry_dir, WINDOW)
+        expected = CorrelationQuery(sample_return_matrix, WINDOW).pair_history("T0", "T1")
+        np.testing.assert_array_equal(query.pair_history("T0", "T1").to_numpy(), expected.to_numpy())
+    finally:
+        shutil.rmtree(temp_dir)
@@ -0,0 +1,53 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.part_store import next_write_stamp, part_dir, write_part, list_parts, remove_partial_parts
+
+import pytest
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+
+STAGE = "stage"
+
+@pytest.fixture
+def temp_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+#writes one part of window 20 holding its dates
+def write_dates(store_dir, dates):
+    dates = pd.to_datetime(dates).to_numpy(dtype="datetime64[ns]")
+    part_path = part_dir(store_dir, STAGE, 20, next_write_stamp(store_dir, STAGE), dates)
+    with write_part(part_path) as temp_dir:
+        np.save(os.path.join(temp_dir, "dates.npy"), dates)
+    return part_path
+
+#Testing parts are named by write stamp and date range, listed in write order and renamed into place complete
+def testing_parts_in_write_order(temp_dir):
+    first = write_dates(temp_dir, ["2022-01-04", "2022-01-03"])
+    second = write_dates(temp_dir, ["2022-01-03"])
+    assert os.path.basename(first)[20:] == "-2022-01-03_2022-01-04", f"Unexpected part name {first}"
+    assert list_parts(temp_dir, STAGE, 20) == [first, second], "Parts should be listed in write order"
+    assert list_parts(temp_dir, STAGE, 60) == [], "Other windows have no parts"
+    assert next_write_stamp(temp_dir, STAGE) > int(os.path.basename(second)[:20]), "Write stamps should keep increasing"
+    assert all(not name.startswith(".") for name in os.listdir(os.path.dirname(first))), "No temporary directory left"
+
+#Testing a failed write leaves no part and leftovers of killed runs are removed
+def testing_failed_and_partial_writes(temp_dir):
+    dates = pd.to_datetime(["2022-01-03"]).to_numpy(dtype="datetime64[ns]")
+    part_path = part_dir(temp_dir, STAGE, 20, next_write_stamp(temp_dir, STAGE), dates)
+    with pytest.raises(RuntimeError):
+        with write_part(part_path) as temp_part:
+            np.save(os.path.join(temp_part, "dates.npy"), dates)
+            raise RuntimeError("killed")
+    assert not os.path.exists(part_path) and list_parts(temp_dir, STAGE, 20) == [], "A failed write should leave no part"
+
+    leftover = os.path.join(temp_dir, STAGE, "window=20", ".0-x.tmp-1")
+    os.makedirs(leftover)
+    assert list_parts(temp_dir, STAGE, 20) == [], "Leftovers are not parts"
+    assert remove_partial_parts(temp_dir, STAGE) == [leftover] and not os.path.exists(leftover), "Leftover not removed"
@@ -0,0 +1,81 @@
+"""Accuracy and speed of approximate_summary vs. the exact summarize_rows on 20 day windows"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.approximate_summary import approximate_summary, INTERVAL_STATS
+from src.correlation import summarize_rows
+from src.synthetic_market import generate_returns
+
+WINDOW = 20
+DATES = 5 #windows per configuration, the interval coverage is counted over all of them
+NAN_COLUMN_SHARE = 0.02 #share of tickers with a missing day in each window
+
+#DATES consecutive windows of factor-driven returns with a few tickers missing a day
+def make_windows(n_tickers, seed=0):
+    returns = generate_returns(n_tickers, WINDOW + DATES - 1, seed=seed)
+    values = returns.to_numpy(np.float32)
+    rng = np.random.default_rng(seed)
+    nan_columns = rng.choice(n_tickers, int(n_tickers * NAN_COLUMN_SHARE), replace=False)
+    values[rng.integers(0, len(values), len(nan_columns)), nan_columns] = np.nan
+    tickers = np.asarray(returns.columns)
+    return [(values[i:i + WINDOW], tickers, returns.index[i + WINDOW - 1]) for i in range(DATES)]
+
+def pair_set(pairs):
+    return {tuple(sorted((pair["ticker_1"], pair["ticker_2"]))) for pair in pairs}
+
+#exact vs approximate at 5000 tickers, then exact vs the default approximate at 20000
+for n_tickers, sample_sizes in [(5000, [10_000, 100_000, 1_000_000]), (20000, [200_000])]:
+    windows = make_windows(n_tickers)
+    start = time.perf_counter()
+    exact = [summarize_rows(*window) for window in windows]
+    exact_time = (time.perf_counter() - start) / DATES
+    print(f"{n_tickers} tickers - exact: {exact_time:.2f} seconds per date")
+
+    for n_pairs in sample_sizes:
+        start = time.perf_counter()
+        approximate = [approximate_summary(*window, n_pairs=n_pairs) for window in windows]
+        approximate_time = (time.perf_counter() - start) / DATES
+
+        errors = {stat: max(abs(a[stat] - e[stat]) for a, e in zip(approximate, exact)) for stat in INTERVAL_STATS}
+        covered = sum(
+            a["intervals"][stat][0] <= e[stat] <= a["intervals"][stat][1]
+            for a, e in zip(approximate, exact) for stat in INTERVAL_STATS
+        )
+        recall_one = np.mean([
+            len(pair_set(a["top_20_closest_to_one"]) & pair_set(e["top_20_closest_to_one"])) / 20
+            for a, e in zip(approximate, exact)
+        ])
+        recall_negative = np.mean([
+            len(pair_set(a["top_5_most_negative"]) & pair_set(e["top_5_most_negative"])) / 5
+            for a, e in zip(approximate, exact)
+        ])
+        candidates = np.mean([a["candidate_pairs"] for a in approximate])
+        print(
+            f"  {n_pairs} sampled pairs: {approximate_time:.2f} seconds per date ({exact_time / approximate_time:.1f}x), "
+            f"{candidates:,.0f} candidates, intervals covering the exact value: {covered}/{DATES * len(INTERVAL_STATS)}, "
+            f"recall closest to one: {recall_one:.0%}, most negative: {recall_negative:.0%}"
+        )
+        print("    max abs error: " + ", ".join(f"{stat} {error:.1e}" for stat, error in errors.items()))
+
+"""Results (single core, 5 dates per configuration, 25 intervals = 5 dates x 5 statistics):
+5000 tickers - exact: 0.71 seconds per date
+  10000 sampled pairs: 0.46 seconds per date (1.6x), 1,405,831 candidates, intervals covering the exact value: 20/25, recall closest to one: 100%, most negative: 76%
+    max abs error: mean_correlation 3.8e-03, median_correlation 5.2e-03, std_correlation 3.8e-03, pct_above_0.7 2.0e-03, correlation_entropy 2.6e-02
+  100000 sampled pairs: 0.44 seconds per date (1.6x), 1,285,631 candidates, intervals covering the exact value: 24/25, recall closest to one: 98%, most negative: 88%
+    max abs error: mean_correlation 1.5e-03, median_correlation 1.3e-03, std_correlation 6.8e-04, pct_above_0.7 3.9e-04, correlation_entropy 4.2e-03
+  1000000 sampled pairs: 0.62 seconds per date (1.1x), 1,337,484 candidates, intervals covering the exact value: 25/25, recall closest to one: 98%, most negative: 88%
+    max abs error: mean_correlation 2.8e-04, median_correlation 3.5e-04, std_correlation 1.3e-04, pct_above_0.7 1.1e-04, correlation_entropy 8.2e-04
+20000 tickers - exact: 13.26 seconds per date
+  200000 sampled pairs: 2.79 seconds per date (4.8x), 8,800,685 candidates, intervals covering the exact value: 23/25, recall closest to one: 99%, most negative: 92%
+    max abs error: mean_correlation 4.3e-04, median_correlation 9.5e-04, std_correlation 6.1e-04, pct_above_0.7 4.6e-04, correlation_entropy 4.1e-03
+
+At 5000 tickers the exact path is already fast, most of the approximate time is hashing and scoring the LSH candidates.
+The exact cost grows with N^2 while the approximate one grows with the candidates (more than N on factor data, where
+whole sectors share buckets), so the gap widens with the universe: 4.8x at 20000 tickers, and at 50000 tickers the
+approximate summary took 9.7 seconds per date (30.7M candidates) against ~83 seconds extrapolated for the exact one.
+"""
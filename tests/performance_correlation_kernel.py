@@ -0,0 +1,41 @@
+"""Performance testing of DataFrame.corr() vs. batched_correlation on a single 20 day window"""
+
+import os
+import sys
+import timeit
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.fast_correlation import batched_correlation
+
+WINDOW = 20
+NAN_COLUMN_SHARE = 0.02 #share of tickers with at least one missing return in the window
+
+#one window of factor-driven returns with a few tickers missing a day
+def make_window(n_tickers, seed=0):
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0, 0.01, (WINDOW, 1))
+    returns = (market * rng.uniform(0, 2, n_tickers) + rng.normal(0, 0.02, (WINDOW, n_tickers))).astype("float32")
+    nan_columns = rng.choice(n_tickers, int(n_tickers * NAN_COLUMN_SHARE), replace=False)
+    returns[rng.integers(0, WINDOW, len(nan_columns)), nan_columns] = np.nan
+    return pd.DataFrame(returns)
+
+for n_tickers in [500, 2000, 5000]:
+    window_slice = make_window(n_tickers)
+    values = window_slice.to_numpy()
+    repeats = 3 if n_tickers < 5000 else 1
+
+    pandas_performance = timeit.timeit(lambda: window_slice.corr(), number=repeats) / repeats
+    batched_performance = timeit.timeit(lambda: batched_correlation(values), number=repeats) / repeats
+    difference = np.nanmax(np.abs(window_slice.corr().to_numpy() - batched_correlation(values)))
+
+    print(f"{n_tickers} tickers - DataFrame.corr(): {pandas_performance:.3f} seconds, "
+          f"batched_correlation: {batched_performance:.3f} seconds ({pandas_performance / batched_performance:.0f}x), "
+          f"max difference: {difference:.1e}")
+
+"""Results (single core, 2% of tickers with a missing day):
+500 tickers - DataFrame.corr(): 0.013 seconds, batched_correlation: 0.001 seconds (9x), max difference: 2.5e-07
+2000 tickers - DataFrame.corr(): 0.169 seconds, batched_correlation: 0.011 seconds (15x), max difference: 3.6e-07
+5000 tickers - DataFrame.corr(): 1.113 seconds, batched_correlation: 0.118 seconds (9x), max difference: 4.2e-07"""
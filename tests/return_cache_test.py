@@ -0,0 +1,85 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.return_cache import (
+    archive_fingerprint,
+    return_cache_key,
+    cached_return_matrix,
+    read_return_window,
+    prune_return_cache
+)
+from orchestration import build_return_matrix, load_return_matrix
+from orchestration_test import write_price_zip, TICKERS
+
+import pytest
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+
+DATES = pd.bdate_range("2022-01-03", periods=40)
+
+@pytest.fixture
+def temp_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+@pytest.fixture
+def price_zip(temp_dir):
+    path = os.path.join(temp_dir, "stock_data.zip")
+    write_price_zip(path, DATES, TICKERS)
+    return path
+
+#Testing the key follows the archive contents and the load parameters
+def testing_cache_key_changes(price_zip, temp_dir):
+    key = return_cache_key(price_zip)
+    assert key == return_cache_key(price_zip), "Same archive and parameters should give the same key"
+    assert key != return_cache_key(price_zip, start_date="2022-01-10"), "A date filter should change the key"
+
+    other_zip = os.path.join(temp_dir, "other.zip")
+    write_price_zip(other_zip, DATES, TICKERS, seed=1)
+    assert archive_fingerprint(other_zip) != archive_fingerprint(price_zip), "Different prices should change the fingerprint"
+
+#Testing a cache hit returns the same matrix as building it, backed by a read-only memory map, without rebuilding
+def testing_cached_matrix_round_trip(price_zip, temp_dir):
+    expected = build_return_matrix(price_zip)
+    cache_dir = os.path.join(temp_dir, "cache")
+    builds = []
+
+    def build_fn():
+        builds.append(1)
+        return build_return_matrix(price_zip)
+
+    first = cached_return_matrix(price_zip, build_fn, cache_dir=cache_dir)
+    second = cached_return_matrix(price_zip, build_fn, cache_dir=cache_dir)
+    assert len(builds) == 1, f"Matrix should be built once and then mapped, built {len(builds)} times"
+
+    for actual in [first, second]:
+        assert actual.shape == expected.shape, f"Expected shape {expected.shape}, got {actual.shape}"
+        assert list(actual.columns) == list(map(str, expected.columns)), "Tickers should round trip in order"
+        assert actual.index.equals(expected.index), "Dates should round trip"
+        np.testing.assert_array_equal(actual.to_numpy(), expected.to_numpy())
+        assert not actual.to_numpy().flags.writeable, "Cached matrix should be a read-only mapping"
+
+    entry_dir = os.path.join(cache_dir, return_cache_key(price_zip))
+    np.testing.assert_array_equal(read_return_window(entry_dir, 5, 25), expected.to_numpy()[5:25])
+
+#Testing the pipeline loader keeps the cache next to the archive and matches the uncached matrix
+def testing_load_return_matrix_uses_cache(price_zip, temp_dir):
+    cached = load_return_matrix(price_zip, start_date=DATES[10])
+    uncached = load_return_matrix(price_zip, start_date=DATES[10], use_cache=False)
+    assert os.listdir(os.path.join(temp_dir, "return_matrix_cache")), "Expected a cache entry next to the archive"
+    np.testing.assert_array_equal(cached.to_numpy(), uncached.to_numpy())
+
+#Testing only the most recently used entries are kept
+def testing_prune_keeps_recent_entries(price_zip, temp_dir):
+    cache_dir = os.path.join(temp_dir, "cache")
+    for i, start in enumerate(DATES[:3]):
+        cached_return_matrix(price_zip, lambda: build_return_matrix(price_zip, start), start_date=start, cache_dir=cache_dir)
+        os.utime(os.path.join(cache_dir, return_cache_key(price_zip, start)), (i, i))
+    prune_return_cache(cache_dir, keep=2)
+    kept = sorted(os.listdir(cache_dir))
+    assert kept == sorted(return_cache_key(price_zip, start) for start in DATES[1:3]), "Oldest entry should be removed"
@@ -0,0 +1,118 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.summary_reducer import (
+    CorrelationSummaryReducer,
+    reduce_correlation_matrix,
+    reduce_correlation_blocks,
+    MEDIAN_BINS
+)
+from src.fast_correlation import CorrelationWindow, batched_correlation
+
+import pytest
+import pandas as pd
+import numpy as np
+
+#sample correlation matrix from factor-driven returns with some NaN correlations
+@pytest.fixture
+def sample_corr_matrix():
+    rng = np.random.default_rng(3)
+    n_tickers = 300
+    returns = rng.normal(0, 0.01, (20, 1)) * rng.uniform(-1, 2, n_tickers) + rng.normal(0, 0.02, (20, n_tickers))
+    returns[:, 10] = np.nan #ticker with no data gives a NaN row/column
+    return batched_correlation(returns)
+
+@pytest.fixture
+def tickers():
+    return np.array([f"T{i}" for i in range(300)], dtype=object)
+
+#Reference summary: full upper triangle with the NaNs removed
+def upper_triangle(corr_matrix):
+    values = corr_matrix[np.triu_indices(len(corr_matrix), k=1)]
+    return values[~np.isnan(values)]
+
+#Testing the scalar stats match numpy on the full triangle
+def testing_reduce_matches_full_triangle(sample_corr_matrix, tickers):
+    summary = reduce_correlation_matrix(sample_corr_matrix, tickers, pd.Timestamp("2021-06-01"), block_rows=17)
+    values = upper_triangle(sample_corr_matrix)
+
+    assert summary["Date"] == "2021-06-01", f"Unexpected date {summary['Date']}"
+    assert abs(summary["mean_correlation"] - np.mean(values, dtype=np.float64)) < 1e-9, "Mean differs from numpy"
+    assert abs(summary["std_correlation"] - np.std(values, dtype=np.float64)) < 1e-9, "Std differs from numpy"
+    assert summary["median_correlation"] == float(np.median(values)), "Median is not exact"
+    assert summary["pct_above_0.7"] == np.mean(np.abs(values) > 0.7), "pct_above_0.7 differs from numpy"
+
+    hist, _ = np.histogram(values, bins=50, range=(-1, 1))
+    probabilities = hist[hist > 0] / hist.sum()
+    assert abs(summary["correlation_entropy"] + np.sum(probabilities * np.log2(probabilities))) < 1e-9, "Entropy differs"
+
+#Testing top pairs are the true extremes, sorted best first and named from the right rows/columns
+def testing_reduce_top_pairs(sample_corr_matrix, tickers):
+    summary = reduce_correlation_matrix(sample_corr_matrix, tickers, pd.Timestamp("2021-06-01"), block_rows=17)
+    values = upper_triangle(sample_corr_matrix)
+
+    closest_to_one = [pair["correlation"] for pair in summary["top_20_closest_to_one"]]
+    assert np.allclose(np.abs(closest_to_one), np.sort(np.abs(values))[::-1][:20]), "Wrong closest to +-1 pairs"
+    closest_to_zero = [pair["correlation"] for pair in summary["top_20_closest_to_zero"]]
+    assert np.allclose(np.abs(closest_to_zero), np.sort(np.abs(values))[:20]), "Wrong closest to 0 pairs"
+    most_negative = [pair["correlation"] for pair in summary["top_5_most_negative"]]
+    assert np.allclose(most_negative, np.sort(values)[:5]), "Wrong most negative pairs"
+
+    for pair in summary["top_5_most_negative"]:
+        i, j = int(pair["ticker_1"][1:]), int(pair["ticker_2"][1:])
+        assert i < j, "Pairs should come from the upper triangle"
+        assert sample_corr_matrix[i, j] == np.float32(pair["correlation"]), f"Ticker names do not match value for {pair}"
+
+#Testing reducers over disjoint tiles merge to the same answer as one reducer
+def testing_merge_matches_single_pass(sample_corr_matrix, tickers):
+    n = len(sample_corr_matrix)
+    single = CorrelationSummaryReducer()
+    single.update(sample_corr_matrix, 0, 0)
+
+    merged = CorrelationSummaryReducer()
+    for row_start in range(0, n, 100):
+        for col_start in range(0, n, 100):
+            part = CorrelationSummaryReducer()
+            part.update(sample_corr_matrix[row_start:row_start + 100, col_start:col_start + 100], row_start, col_start)
+            merged.merge(part)
+
+    date = pd.Timestamp("2021-06-01")
+    expected, actual = single.summary(tickers, date), merged.summary(tickers, date)
+    for key in ["mean_correlation", "std_correlation", "pct_above_0.7", "correlation_entropy"]:
+        assert abs(actual[key] - expected[key]) < 1e-12, f"{key} changed after merging tiles"
+    assert actual["top_20_closest_to_one"] == expected["top_20_closest_to_one"], "Top pairs changed after merging tiles"
+
+#Testing the single pass median estimate stays inside the documented bound
+def testing_median_estimate_error_bound(sample_corr_matrix):
+    reducer = CorrelationSummaryReducer()
+    reducer.update(sample_corr_matrix, 0, 0)
+    error = abs(reducer.median() - np.median(upper_triangle(sample_corr_matrix)))
+    assert error <= 2 / MEDIAN_BINS, f"Median estimate error {error} exceeds one fine bin"
+
+#Testing the exact median comes from one walk while the band holds it, and from a second walk once it drifts out
+@pytest.mark.parametrize("median_band, walks", [(20000, 1), (500, 2)])
+def testing_median_band_walks(sample_corr_matrix, tickers, monkeypatch, median_band, walks):
+    corr = sample_corr_matrix.copy()
+    corr[150:, 150:] = np.abs(corr[150:, 150:]) #later blocks push the median up, out of a narrow band
+    calls = []
+    def tile_fn(row_start, row_stop, col_start):
+        calls.append(row_start)
+        return corr[row_start:row_stop, col_start:]
+    monkeypatch.setattr("src.summary_reducer.MEDIAN_BAND", median_band)
+    summary = reduce_correlation_blocks(tile_fn, 300, tickers, pd.Timestamp("2021-06-01"), block_rows=30)
+    assert summary["median_correlation"] == float(np.median(upper_triangle(corr))), "Median is not exact"
+    assert len(calls) == 10 * walks, f"Expected {walks} walk(s) over the blocks, got {len(calls)} tiles"
+
+#Testing tiles computed on demand from the window give the same summary as the materialized matrix
+def testing_window_tiles_match_matrix(tickers):
+    rng = np.random.default_rng(5)
+    returns = rng.normal(0, 0.02, (20, 300)).astype("float32")
+    returns[3, 7] = np.nan
+    window = CorrelationWindow(returns)
+
+    date = pd.Timestamp("2021-06-01")
+    streamed = reduce_correlation_blocks(window.tile, window.n_columns, tickers, date, block_rows=64)
+    materialized = reduce_correlation_matrix(batched_correlation(returns), tickers, date)
+    assert streamed == materialized, "Streaming tiles should give exactly the same summary"
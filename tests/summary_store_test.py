@@ -0,0 +1,174 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.summary_store import (
+    append_summaries,
+    load_summary_stats,
+    load_top_pairs,
+    stored_dates,
+    convert_pickle_directory,
+    completed_dates,
+    repair_store,
+    read_journal,
+    stored_windows,
+    write_rollups,
+    load_rollup,
+    load_summary_series,
+    read_manifest,
+    STAT_COLUMNS
+)
+from src.helpers import pickle_save
+
+import pytest
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+
+#one summary dictionary in the format the pipeline produces
+def make_summary(date, value):
+    pair = {"ticker_1": "AAPL", "ticker_2": "MSFT", "correlation": value}
+    return {
+        "Date": date,
+        "mean_correlation": value,
+        "median_correlation": value,
+        "std_correlation": 0.2,
+        "pct_above_0.7": 0.01,
+        "correlation_entropy": 4.5,
+        "top_20_closest_to_zero": [pair, {**pair, "ticker_2": "GOOG"}],
+        "top_20_closest_to_one": [pair],
+        "top_5_most_negative": [pair],
+    }
+
+@pytest.fixture
+def temp_store_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+#Testing appended batches come back as one sorted table and can be filtered by date and column
+def testing_append_and_load_stats(temp_store_dir):
+    append_summaries([make_summary("2021-12-30", 0.1), make_summary("2022-01-03", 0.2)], temp_store_dir)
+    append_summaries([make_summary("2022-01-04", 0.3)], temp_store_dir)
+
+    stats = load_summary_stats(temp_store_dir)
+    assert list(stats["Date"]) == list(pd.to_datetime(["2021-12-30", "2022-01-03", "2022-01-04"])), "Dates not loaded in order"
+    assert os.path.isdir(os.path.join(temp_store_dir, "stats", "year=2021")), "Stats should be partitioned by year"
+
+    subset = load_summary_stats(temp_store_dir, columns=["mean_correlation"], start_date="2022-01-01")
+    assert list(subset.columns) == ["Date", "mean_correlation"], f"Unexpected columns {list(subset.columns)}"
+    assert list(subset["mean_correlation"].round(6)) == [0.2, 0.3], "Date filter did not apply"
+
+#Testing the long top pairs table keeps category and rank
+def testing_load_top_pairs_for_one_date(temp_store_dir):
+    append_summaries([make_summary("2022-01-03", 0.2), make_summary("2022-01-04", 0.3)], temp_store_dir)
+
+    top_pairs = load_top_pairs(temp_store_dir, "2022-01-04")
+    assert set(top_pairs["Date"]) == {pd.Timestamp("2022-01-04")}, "Pairs from other dates were loaded"
+    zero = top_pairs[top_pairs["category"] == "top_20_closest_to_zero"]
+    assert list(zero["rank"]) == [1, 2], f"Expected ranks 1 and 2, got {list(zero['rank'])}"
+    assert list(zero["ticker_2"]) == ["MSFT", "GOOG"], "Pairs not stored in rank order"
+
+#Testing a date written twice keeps the latest row
+def testing_rewritten_date_keeps_latest(temp_store_dir):
+    append_summaries([make_summary("2022-01-03", 0.2)], temp_store_dir)
+    append_summaries([make_summary("2022-01-03", 0.5)], temp_store_dir)
+    stats = load_summary_stats(temp_store_dir)
+    assert len(stats) == 1 and round(stats["mean_correlation"].iloc[0], 6) == 0.5, "Latest write should win"
+
+#Testing the pickle converter
+def testing_convert_pickle_directory(temp_store_dir):
+    pickle_dir = os.path.join(temp_store_dir, "pickles")
+    for date, value in [("2022-01-03", 0.2), ("2022-01-04", 0.3)]:
+        pickle_save(make_summary(date, value), os.path.join(pickle_dir, f"correlation_summary_{date}.pkl"))
+
+    convert_pickle_directory(pickle_dir, temp_store_dir, remove_pickles=True, code_version=2)
+    assert list(stored_dates(temp_store_dir)) == list(pd.to_datetime(["2022-01-03", "2022-01-04"])), "Dates missing after conversion"
+    assert not [f for f in os.listdir(pickle_dir) if f.endswith(".pkl")], "Pickles should be removed after conversion"
+
+    #journalled and with a finished manifest, so the store can be resumed and extended
+    assert list(completed_dates(temp_store_dir, window=20)) == list(stored_dates(temp_store_dir)), "Converted dates not journalled"
+    manifest = read_manifest(temp_store_dir)
+    assert manifest["windows"] == [20] and manifest["code_version"] == 2, f"Unexpected manifest {manifest}"
+    assert manifest["last_date"] == "2022-01-04" and manifest["tickers"] is None, f"Unexpected manifest {manifest}"
+
+#part file written by an append, for corrupting in tests
+def stats_part_files(store_dir):
+    return sorted(os.path.join(root, f) for root, _, files in os.walk(os.path.join(store_dir, "stats")) for f in files if f.endswith(".parquet"))
+
+#Testing the journal records completed dates and drops those whose part files are missing or truncated
+def testing_completed_dates_checks_part_files(temp_store_dir):
+    append_summaries([make_summary("2022-01-03", 0.2), make_summary("2022-01-04", 0.3)], temp_store_dir)
+    append_summaries([make_summary("2022-01-05", 0.4)], temp_store_dir)
+    assert [record["dates"] for record in read_journal(temp_store_dir)] == [["2022-01-03", "2022-01-04"], ["2022-01-05"]], "Journal should list each append"
+    assert list(completed_dates(temp_store_dir)) == list(pd.to_datetime(["2022-01-03", "2022-01-04", "2022-01-05"])), "All dates should be complete"
+
+    with open(stats_part_files(temp_store_dir)[0], "r+b") as f: #a killed writer without the atomic rename
+        f.truncate(100)
+    with open(os.path.join(temp_store_dir, "journal.jsonl"), "a") as f:
+        f.write('{"write_stamp": 1, "dates": ["2022-01-') #torn last line
+    assert list(completed_dates(temp_store_dir)) == [pd.Timestamp("2022-01-05")], "Truncated append should not count as complete"
+
+#Testing repair moves corrupt and leftover temporary files out of the way so the store loads again
+def testing_repair_store(temp_store_dir):
+    append_summaries([make_summary("2022-01-03", 0.2)], temp_store_dir)
+    append_summaries([make_summary("2022-01-04", 0.3)], temp_store_dir)
+    corrupt = stats_part_files(temp_store_dir)[0]
+    with open(corrupt, "r+b") as f:
+        f.truncate(100)
+    with open(os.path.join(os.path.dirname(corrupt), ".leftover.parquet.tmp-1-1"), "wb") as f:
+        f.write(b"partial")
+
+    moved = repair_store(temp_store_dir)
+    assert len(moved) == 2, f"Expected the corrupt part and the temp file to be moved, got {moved}"
+    assert list(load_summary_stats(temp_store_dir)["Date"]) == [pd.Timestamp("2022-01-04")], "Store should load without the corrupt part"
+
+#Testing summaries are kept apart by window, and part files written before windows were tagged load as 20 days
+def testing_windows_are_tagged(temp_store_dir):
+    append_summaries([{**make_summary("2022-01-03", 0.2), "window": 5}, {**make_summary("2022-01-03", 0.4), "window": 60}], temp_store_dir)
+    legacy = os.path.join(temp_store_dir, "stats", "year=2022", "00000000000000000001-2022-01-04_2022-01-04.parquet")
+    pd.DataFrame({"Date": pd.to_datetime(["2022-01-04"]), **{column: [0.3] for column in STAT_COLUMNS}}).to_parquet(legacy, index=False)
+
+    assert stored_windows(temp_store_dir) == [5, 20, 60], f"Unexpected windows {stored_windows(temp_store_dir)}"
+    assert list(load_summary_stats(temp_store_dir, window=60)["mean_correlation"].round(6)) == [0.4], "Wrong row for window 60"
+    assert list(load_summary_stats(temp_store_dir, window=20)["Date"]) == [pd.Timestamp("2022-01-04")], "Untagged rows should be window 20"
+    top_pairs = load_top_pairs(temp_store_dir, "2022-01-03", window=5)
+    assert set(top_pairs["window"]) == {5} and len(top_pairs) == 4, "Top pairs should be filtered by window"
+    assert list(completed_dates(temp_store_dir, 60)) == [pd.Timestamp("2022-01-03")], "Journal should record windows"
+    assert list(completed_dates(temp_store_dir, 20)) == [], "No journalled append holds window 20"
+
+
+#Testing the weekly/monthly rollups average each period, and are recomputed when summaries were appended after them
+def testing_rollups(temp_store_dir):
+    dates = pd.bdate_range("2022-01-03", periods=30)
+    append_summaries([make_summary(date, i / 100) for i, date in enumerate(dates)], temp_store_dir)
+    write_rollups(temp_store_dir)
+
+    weekly = load_rollup(temp_store_dir, "weekly", window=20)
+    assert len(weekly) == 6 and list(weekly["days"]) == [5] * 6, f"Expected 6 full weeks, got {list(weekly['days'])}"
+    assert list(weekly["Date"]) == list(dates[4::5]), "A period should be labelled with its last stored date"
+    np.testing.assert_allclose(weekly["mean_correlation"], [np.mean(np.arange(i, i + 5)) / 100 for i in range(0, 30, 5)])
+
+    monthly = load_rollup(temp_store_dir, "monthly", start_date="2022-02-01")
+    assert list(monthly["Date"]) == [dates[-1]], f"Expected only February, got {list(monthly['Date'])}"
+    assert monthly["days"].iloc[0] == 9, f"Expected 9 days in February, got {monthly['days'].iloc[0]}"
+
+    #a later append makes the stored rollup stale, it is computed from the stats table instead
+    append_summaries([make_summary(dates[-1] + pd.offsets.BDay(1), 1.0)], temp_store_dir)
+    weekly = load_rollup(temp_store_dir, "weekly")
+    assert weekly["Date"].iloc[-1] == dates[-1] + pd.offsets.BDay(1), "Appended date missing from a stale rollup"
+    assert stored_dates(temp_store_dir)[-1] == dates[-1] + pd.offsets.BDay(1), "Appended date missing from a stale date index"
+
+#Testing chart data switches from daily values to rollups as the range grows
+def testing_load_summary_series_resolution(temp_store_dir):
+    dates = pd.bdate_range("2020-01-01", periods=300)
+    append_summaries([make_summary(date, 0.1) for date in dates], temp_store_dir)
+    write_rollups(temp_store_dir)
+    index = stored_dates(temp_store_dir)
+
+    for max_points, expected, points in [(300, "daily", 300), (61, "weekly", 61), (60, "monthly", 14)]:
+        resolution, series = load_summary_series(temp_store_dir, index, window=20, max_points=max_points)
+        assert resolution == expected, f"Expected {expected} for {max_points} points, got {resolution}"
+        assert list(series.columns) == STAT_COLUMNS and len(series) == points, f"Unexpected {expected} series {series.shape}"
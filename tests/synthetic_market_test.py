@@ -0,0 +1,58 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src.synthetic_market import ticker_names, generate_returns, generate_prices, write_price_zip
+from src.data_reader import data_load_zip
+
+import pytest
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+
+@pytest.fixture
+def temp_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+#Testing ticker names are unique and move on to two letters after Z
+def testing_ticker_names():
+    names = ticker_names(800)
+    assert len(set(names)) == 800, "Ticker names should be unique"
+    assert names[:2] == ["A", "B"] and names[26] == "AA", f"Unexpected ticker order {names[:2]}, {names[26]}"
+
+#Testing the same seed gives the same prices and a different seed does not
+def testing_generator_is_seeded():
+    first = generate_prices(30, 50, seed=3)
+    second = generate_prices(30, 50, seed=3)
+    other = generate_prices(30, 50, seed=4)
+    pd.testing.assert_frame_equal(first, second)
+    assert not np.allclose(first["Price"].fillna(0), other["Price"].fillna(0)), "Different seeds should differ"
+
+#Testing shape, NaN share and the factor structure giving positive average correlation
+def testing_generator_shape_and_structure():
+    prices = generate_prices(100, 200, nan_density=0.05)
+    assert list(prices.columns) == ["Ticker", "Date", "Price"], f"Unexpected columns {list(prices.columns)}"
+    assert len(prices) == 100 * 200, f"Expected one row per ticker and day, got {len(prices)}"
+    nan_share = prices["Price"].isna().mean()
+    assert 0.04 < nan_share < 0.06, f"Expected about 5% NaN prices, got {nan_share:.3f}"
+
+    corr = generate_returns(100, 200).corr().to_numpy()
+    mean_corr = corr[np.triu_indices(100, 1)].mean()
+    assert 0.1 < mean_corr < 0.6, f"Expected positive average correlation from the market factor, got {mean_corr:.3f}"
+    no_factors = generate_returns(100, 200, n_factors=0).corr().to_numpy()
+    assert no_factors[np.triu_indices(100, 1)].max() < corr[np.triu_indices(100, 1)].max(), \
+        "Sector factors should create the most correlated pairs"
+
+#Testing the written archive loads back through data_load_zip without the NaN rows
+def testing_written_zip_loads(temp_dir):
+    prices = generate_prices(20, 30, nan_density=0.1)
+    zip_path = os.path.join(temp_dir, "market.zip")
+    write_price_zip(prices, zip_path)
+    loaded = data_load_zip(zip_path)
+    expected = prices.dropna()
+    assert len(loaded) == len(expected), f"Expected {len(expected)} rows, got {len(loaded)}"
+    np.testing.assert_allclose(loaded["Price"].to_numpy(), expected["Price"].to_numpy(), rtol=1e-4)
@@ -0,0 +1,90 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))) #adding this to help run from command line
+
+from src import tiled_summary, instrumentation
+from src.tiled_summary import tile_ranges, summarize_rows_tiled
+from src.correlation import summarize_rows, orchestrate_daily_correlation_summary_stats
+from src.summary_store import load_summary_stats, load_top_pairs
+from fast_correlation_test import sample_return_matrix
+
+import pytest
+import numpy as np
+import pandas as pd
+import tempfile
+import shutil
+
+WINDOW = 20
+
+@pytest.fixture
+def temp_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+#Testing the tiles cover every pair of the upper triangle exactly once
+def testing_tile_ranges_cover_upper_triangle():
+    covered = np.zeros((50, 50), dtype=int)
+    for row_start, row_stop, col_start, col_stop in tile_ranges(50, 16):
+        rows, cols = np.meshgrid(np.arange(row_start, row_stop), np.arange(col_start, col_stop), indexing="ij")
+        keep = cols > rows
+        np.add.at(covered, (rows[keep], cols[keep]), 1)
+    assert (covered[np.triu_indices(50, k=1)] == 1).all(), "Every upper triangle pair should be in exactly one tile"
+    assert covered[np.tril_indices(50)].sum() == 0, "No pair below the diagonal should be reduced"
+
+#Testing merged tile reductions give the single process summary (missing days and a constant column included)
+@pytest.mark.parametrize("scheduler", ["threads", "processes"])
+def testing_tiled_summary_matches_whole_matrix(sample_return_matrix, scheduler):
+    rows = sample_return_matrix.iloc[:WINDOW].to_numpy()
+    tickers = sample_return_matrix.columns.to_numpy()
+    current_date = sample_return_matrix.index[WINDOW]
+    expected = summarize_rows(rows, tickers, current_date)
+    actual = summarize_rows_tiled(rows, tickers, current_date, tile_size=16, scheduler=scheduler, max_workers=2)
+
+    for key in ["mean_correlation", "std_correlation"]:
+        assert actual[key] == pytest.approx(expected[key], abs=1e-12), f"{key} differs from the whole matrix"
+    for key in ["median_correlation", "pct_above_0.7", "correlation_entropy", "top_20_closest_to_zero",
+                "top_20_closest_to_one", "top_5_most_negative"]:
+        assert actual[key] == expected[key], f"{key} differs from the whole matrix: {actual[key]} vs {expected[key]}"
+
+#Testing the tiles engine writes the window engine's summaries and rejects the neighbour index
+def testing_tiles_engine_matches_window_engine(sample_return_matrix, temp_dir):
+    window_dir, tiles_dir = os.path.join(temp_dir, "window"), os.path.join(temp_dir, "tiles")
+    orchestrate_daily_correlation_summary_stats(sample_return_matrix, window=[10, WINDOW], output_directory=window_dir,
+                                                progress=lambda stats: None)
+    orchestrate_daily_correlation_summary_stats(sample_return_matrix, window=[10, WINDOW], output_directory=tiles_dir,
+                                                engine="tiles", tile_size=16, batch_size=40, progress=lambda stats: None)
+
+    expected, actual = load_summary_stats(window_dir), load_summary_stats(tiles_dir)
+    assert list(zip(actual["Date"], actual["window"])) == list(zip(expected["Date"], expected["window"])), "Different dates"
+    for key in ["mean_correlation", "median_correlation", "std_correlation", "pct_above_0.7", "correlation_entropy"]:
+        difference = (actual[key] - expected[key]).abs().max()
+        assert difference < 1e-9, f"{key} differs between engines by up to {difference}"
+    date = sample_return_matrix.index[60]
+    assert load_top_pairs(tiles_dir, date).equals(load_top_pairs(window_dir, date)), "Top pairs differ between engines"
+
+    with pytest.raises(ValueError):
+        orchestrate_daily_correlation_summary_stats(sample_return_matrix, window=WINDOW, output_directory=tiles_dir,
+                                                    engine="tiles", neighbours=3)
+
+#Testing the median comes from the tiles' bands and only tiles whose band missed the median bins are recomputed:
+#two sectors, so the within-sector tiles' medians sit far above the cross-sector ones
+def testing_tile_median_bands(monkeypatch):
+    monkeypatch.setattr(tiled_summary, "TILE_MEDIAN_BAND", 64) #bands of at most 16 values
+    rng = np.random.default_rng(5)
+    sectors = rng.normal(0, 0.01, (WINDOW, 2))
+    rows = np.repeat(sectors, 32, axis=1) * np.repeat([1.0, 0.0], 32) + rng.normal(0, 0.01, (WINDOW, 64))
+    rows = rows.astype(np.float32)
+    tickers = np.array([f"S{i}" for i in range(64)])
+    expected = summarize_rows(rows, tickers, pd.Timestamp("2024-01-02"))
+
+    instrumentation.enable()
+    try:
+        actual = summarize_rows_tiled(rows, tickers, pd.Timestamp("2024-01-02"), tile_size=16)
+        second_round = [event for event in instrumentation.events() if event["name"] == "median_pass"]
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
+    assert actual["median_correlation"] == expected["median_correlation"], "Median differs from the whole matrix"
+    assert 0 < len(second_round) < len(tile_ranges(64, 16)), f"Expected some tiles to miss, {len(second_round)} did"